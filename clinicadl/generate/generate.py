@@ -12,11 +12,13 @@ import nibabel as nib
 import numpy as np
 import pandas as pd
 import torch
-from clinica.utils.inputs import RemoteFileStructure, clinica_file_reader, fetch_file
+from clinica.utils.inputs import RemoteFileStructure, fetch_file
 
 from clinicadl.prepare_data.prepare_data_utils import compute_extract_json
+from clinicadl.utils.caps_dataset.caps_index import get_caps_index
 from clinicadl.utils.caps_dataset.data import CapsDataset
 from clinicadl.utils.maps_manager.iotools import check_and_clean, commandline_to_json
+from clinicadl.utils.nifti import load_nifti_image, read_nifti
 from clinicadl.utils.preprocessing import write_preprocessing
 from clinicadl.utils.tsvtools_utils import extract_baseline
 
@@ -98,10 +100,10 @@ def generate_random_dataset(
         preprocessing, uncropped_image, acq_label, suvr_reference_region
     )
 
-    image_paths = clinica_file_reader(
-        [participant_id], [session_id], caps_dict[cohort], file_type
-    )[0]
-    image_nii = nib.load(image_paths[0])
+    image_paths = get_caps_index(caps_dict[cohort], file_type).read_files(
+        [participant_id], [session_id]
+    )
+    image_nii = load_nifti_image(image_paths[0])
     image = image_nii.get_data()
 
     # Create output tsv file
@@ -247,6 +249,10 @@ def generate_trivial_dataset(
     file_type = find_file_type(
         preprocessing, uncropped_image, acq_label, suvr_reference_region
     )
+    for cohort, cohort_df in data_df.iloc[:n_subjects].groupby("cohort"):
+        get_caps_index(caps_dict[cohort], file_type).update(
+            cohort_df.participant_id.values, cohort_df.session_id.values
+        )
 
     for i in range(2 * n_subjects):
         data_idx = i // 2
@@ -255,10 +261,10 @@ def generate_trivial_dataset(
         participant_id = data_df.loc[data_idx, "participant_id"]
         session_id = data_df.loc[data_idx, "session_id"]
         cohort = data_df.loc[data_idx, "cohort"]
-        image_paths = clinica_file_reader(
-            [participant_id], [session_id], caps_dict[cohort], file_type
-        )[0]
-        image_nii = nib.load(image_paths[0])
+        image_paths = get_caps_index(caps_dict[cohort], file_type).read_files(
+            [participant_id], [session_id]
+        )
+        image_nii = load_nifti_image(image_paths[0])
         image = image_nii.get_data()
 
         input_filename = basename(image_paths[0])
@@ -271,7 +277,7 @@ def generate_trivial_dataset(
 
         makedirs(trivial_image_nii_dir, exist_ok=True)
 
-        atlas_to_mask = nib.load(join(mask_path, f"mask-{label + 1}.nii")).get_data()
+        atlas_to_mask = read_nifti(join(mask_path, f"mask-{label + 1}.nii"))
 
         # Create atrophied image
         trivial_image = im_loss_roi_gaussian_distribution(
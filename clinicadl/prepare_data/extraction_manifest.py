@@ -0,0 +1,182 @@
+# coding: utf8
+
+"""
+Manifest of the images already extracted by prepare_data, used to resume an interrupted
+extraction and to only process new or modified images when an extraction is run again.
+"""
+
+import hashlib
+import json
+import os
+from os import path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+MANIFEST_COLUMNS = [
+    "participant_id",
+    "session_id",
+    "input_path",
+    "input_size",
+    "input_mtime",
+    "parameters_hash",
+    "num_tensors",
+    "tensor_shapes",
+    "output_files",
+]
+
+
+def get_manifest_path(caps_directory: str, extract_json: str) -> str:
+    """Gives the path to the manifest of an extraction."""
+    manifest_name = path.splitext(extract_json)[0]
+    return path.join(
+        caps_directory, "tensor_extraction", f"{manifest_name}_manifest.tsv"
+    )
+
+
+def compute_parameters_hash(parameters: Dict[str, Any]) -> str:
+    """Gives a digest of the parameters of an extraction."""
+    parameters_str = json.dumps(parameters, sort_keys=True, default=str)
+    return hashlib.sha1(parameters_str.encode()).hexdigest()
+
+
+class ExtractionManifest:
+    """
+    Records each extracted image with the size and the modification time of its input file,
+    the digest of the extraction parameters and the files written.
+
+    An image is up to date if all these elements are unchanged and its output files exist.
+    Entries are appended to the manifest file as soon as images are extracted. The last
+    entry of an image replaces the previous ones.
+    """
+
+    def __init__(self, manifest_path: str, parameters_hash: str):
+        """
+        Args:
+            manifest_path: path to the manifest (*.tsv). It is created with the first entry.
+            parameters_hash: digest of the parameters of the current extraction.
+                Entries computed with other parameters are ignored.
+        """
+        self.manifest_path = manifest_path
+        self.parameters_hash = parameters_hash
+        self.n_outdated = 0
+        self._entries: Dict[Tuple[str, str], Dict[str, Any]] = dict()
+
+        if path.isfile(manifest_path):
+            manifest_df = pd.read_csv(
+                manifest_path,
+                sep="\t",
+                dtype={
+                    column: str
+                    for column in MANIFEST_COLUMNS
+                    if column not in ["input_size", "input_mtime", "num_tensors"]
+                },
+            )
+            for entry in manifest_df.to_dict("records"):
+                if entry["parameters_hash"] == parameters_hash:
+                    key = (entry["participant_id"], entry["session_id"])
+                    self._entries[key] = entry
+                else:
+                    self.n_outdated += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def is_up_to_date(
+        self, participant: str, session: str, input_path: str, caps_directory: str
+    ) -> bool:
+        """
+        Checks if the outputs of an image were already extracted from its current input file.
+
+        Args:
+            participant: ID of the participant.
+            session: ID of the session.
+            input_path: path to the input image.
+            caps_directory: path to the CAPS directory, to which output paths are relative.
+        Returns:
+            True if the image does not need to be extracted again.
+        """
+        entry = self._entries.get((participant, session))
+        if entry is None or entry["input_path"] != input_path:
+            return False
+
+        input_stat = os.stat(input_path)
+        if (
+            entry["input_size"] != input_stat.st_size
+            or entry["input_mtime"] != input_stat.st_mtime_ns
+        ):
+            return False
+
+        return all(
+            path.exists(path.join(caps_directory, output_file))
+            for output_file in entry["output_files"].split(";")
+        )
+
+    def get_tensor_shapes(
+        self, participant: str, session: str
+    ) -> Tuple[int, Set[Tuple[int, ...]]]:
+        """Gives the number of tensors extracted from an image and their different shapes."""
+        entry = self._entries[(participant, session)]
+        tensor_shapes = {
+            tuple(int(dim) for dim in shape.split("x"))
+            for shape in entry["tensor_shapes"].split(";")
+        }
+        return int(entry["num_tensors"]), tensor_shapes
+
+    def add(
+        self,
+        participant: str,
+        session: str,
+        input_path: str,
+        output_files: List[str],
+        tensor_shapes: List[Tuple[int, ...]],
+    ):
+        """
+        Records an extracted image and appends it to the manifest file.
+
+        Args:
+            participant: ID of the participant.
+            session: ID of the session.
+            input_path: path to the input image.
+            output_files: paths to the output tensors, relative to the CAPS directory.
+            tensor_shapes: shapes of the output tensors.
+        """
+        input_stat = os.stat(input_path)
+        entry = {
+            "participant_id": participant,
+            "session_id": session,
+            "input_path": input_path,
+            "input_size": input_stat.st_size,
+            "input_mtime": input_stat.st_mtime_ns,
+            "parameters_hash": self.parameters_hash,
+            "num_tensors": len(tensor_shapes),
+            "tensor_shapes": ";".join(
+                "x".join(str(dim) for dim in shape)
+                for shape in sorted(set(tensor_shapes))
+            ),
+            "output_files": ";".join(output_files),
+        }
+        self._entries[(participant, session)] = entry
+        write_header = not path.isfile(self.manifest_path)
+        if write_header:
+            os.makedirs(path.dirname(self.manifest_path), exist_ok=True)
+        pd.DataFrame([entry], columns=MANIFEST_COLUMNS).to_csv(
+            self.manifest_path, sep="\t", index=False, header=write_header, mode="a"
+        )
+
+
+def summarize_tensor_shapes(
+    image_shapes: List[Tuple[int, Set[Tuple[int, ...]]]]
+) -> Tuple[Optional[int], Optional[Tuple[int, ...]]]:
+    """
+    Args:
+        image_shapes: number of tensors and set of tensor shapes of each image.
+    Returns:
+        the number of tensors per image and the tensor shape, or None if they vary between images.
+    """
+    num_tensors = {n_tensors for n_tensors, _ in image_shapes}
+    all_shapes = set().union(*(shapes for _, shapes in image_shapes))
+    return (
+        num_tensors.pop() if len(num_tensors) == 1 else None,
+        all_shapes.pop() if len(all_shapes) == 1 else None,
+    )
@@ -0,0 +1,246 @@
+# coding: utf8
+
+"""
+Streaming extraction of tensors, in which images are decoded, split into elements and
+written by successive stages of threads connected by bounded queues.
+
+Decompression, tensor operations and file writes release the GIL, so that the stages run
+concurrently and keep both the CPUs and the disk busy, while the bounded queues limit the
+number of images in memory.
+"""
+
+import os
+import threading
+from logging import getLogger
+from queue import Empty, Full, Queue
+from time import perf_counter
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import torch
+
+from clinicadl.utils.exceptions import ClinicaDLArgumentError
+
+from .prepare_data_utils import load_nifti_tensor
+
+logger = getLogger("clinicadl.extract")
+
+_END = object()
+_TIMEOUT = 0.1
+
+
+class StagedPipeline:
+    """
+    Applies successive functions to a stream of inputs, each function being run by its own
+    pool of threads. Outputs are given in the order in which they are completed.
+    """
+
+    def __init__(
+        self,
+        stages: Sequence[Tuple[str, Callable[[Any], Any], int]],
+        queue_size: int = 4,
+    ):
+        """
+        Args:
+            stages: name, function and number of threads of each stage.
+            queue_size: maximum number of items waiting between two stages.
+        Raises:
+            ClinicaDLArgumentError: if a stage has no thread.
+        """
+        if any(n_threads < 1 for _, _, n_threads in stages):
+            raise ClinicaDLArgumentError(
+                "Each stage of the pipeline needs at least one thread."
+            )
+        self.stages = stages
+        self.queue_size = queue_size
+        self.n_items = [0] * len(stages)
+        self.busy_time = [0.0] * len(stages)
+        self.wall_time = 0.0
+
+    def run(self, inputs: Iterable[Any]) -> Iterator[Tuple[int, Any]]:
+        """
+        Args:
+            inputs: inputs of the first stage.
+        Yields:
+            the position of the input and the output of the last stage.
+        Raises:
+            the first exception raised by a stage, once the pipeline is stopped.
+        """
+        queues = [Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        stop = threading.Event()
+        errors: List[BaseException] = list()
+        lock = threading.Lock()
+        remaining_threads = [n_threads for _, _, n_threads in self.stages]
+
+        def put(queue_idx: int, item: Any) -> bool:
+            while not stop.is_set():
+                try:
+                    queues[queue_idx].put(item, timeout=_TIMEOUT)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def get(queue_idx: int) -> Any:
+            while not stop.is_set():
+                try:
+                    return queues[queue_idx].get(timeout=_TIMEOUT)
+                except Empty:
+                    pass
+            return _END
+
+        def end_stage(stage_idx: int):
+            # The next stage (or the consumer) is stopped once per thread
+            n_next = (
+                self.stages[stage_idx + 1][2] if stage_idx + 1 < len(self.stages) else 1
+            )
+            for _ in range(n_next):
+                put(stage_idx + 1, _END)
+
+        def feed():
+            try:
+                for position, value in enumerate(inputs):
+                    if not put(0, (position, value)):
+                        return
+            except BaseException as error:
+                errors.append(error)
+                stop.set()
+                return
+            for _ in range(self.stages[0][2]):
+                put(0, _END)
+
+        def work(stage_idx: int):
+            _, function, _ = self.stages[stage_idx]
+            while True:
+                item = get(stage_idx)
+                if item is _END:
+                    break
+                position, value = item
+                start = perf_counter()
+                try:
+                    output = function(value)
+                except BaseException as error:
+                    errors.append(error)
+                    stop.set()
+                    break
+                with lock:
+                    self.n_items[stage_idx] += 1
+                    self.busy_time[stage_idx] += perf_counter() - start
+                put(stage_idx + 1, (position, output))
+
+            with lock:
+                remaining_threads[stage_idx] -= 1
+                last_thread = remaining_threads[stage_idx] == 0
+            if last_thread:
+                end_stage(stage_idx)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        for stage_idx, (name, _, n_threads) in enumerate(self.stages):
+            threads += [
+                threading.Thread(
+                    target=work, args=(stage_idx,), name=f"{name}-{i}", daemon=True
+                )
+                for i in range(n_threads)
+            ]
+
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = get(len(self.stages))
+                if item is _END:
+                    break
+                yield item
+            if errors:
+                raise errors[0]
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            self.wall_time += perf_counter() - start
+
+    def log_throughput(self):
+        """Logs the number of items processed per second by each stage and its occupancy."""
+        if self.wall_time == 0:
+            return
+        for stage_idx, (name, _, n_threads) in enumerate(self.stages):
+            logger.info(
+                f"Stage {name}: {self.n_items[stage_idx]} images, "
+                f"{self.n_items[stage_idx] / self.wall_time:.2f} images/s, "
+                f"{self.busy_time[stage_idx] / (self.wall_time * n_threads):.0%} "
+                f"occupancy of {n_threads} thread(s)."
+            )
+
+
+def compute_n_threads(n_jobs: int) -> int:
+    """
+    Gives a number of threads from a number of jobs, which follows the convention of joblib:
+    negative values are counted from the number of CPUs, -1 meaning all the CPUs.
+
+    Raises:
+        ClinicaDLArgumentError: if n_jobs is 0.
+    """
+    if n_jobs == 0:
+        raise ClinicaDLArgumentError(
+            "The number of jobs must be a positive integer, or a negative integer "
+            "counted from the number of CPUs (-1 uses all the CPUs)."
+        )
+    elif n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return n_jobs
+
+
+def stream_extraction(
+    input_files: Sequence[str],
+    extract_fn: Callable[..., List[Tuple[str, torch.Tensor]]],
+    write_fn: Optional[Callable[[str, List[Tuple[str, torch.Tensor]]], Any]] = None,
+    n_decoders: int = 2,
+    n_extractors: int = 2,
+    n_writers: int = 4,
+    queue_size: int = 4,
+    nifti_cache: Optional[str] = None,
+) -> Iterator[Tuple[int, Any]]:
+    """
+    Decodes the input images, extracts their tensors and optionally writes them in a
+    pipeline of thread pools. The throughput of each stage is logged at the end.
+
+    Args:
+        input_files: paths to the NifTi input images.
+        extract_fn: function called as extract_fn(nii_path, image_tensor=image_tensor),
+            like extract_images, extract_patches, extract_slices or extract_roi, whose other
+            parameters can be given with functools.partial.
+        write_fn: function called as write_fn(nii_path, output_mode) on the extracted tensors.
+            If None, the extracted tensors are yielded.
+        n_decoders: number of threads decoding images.
+        n_extractors: number of threads extracting tensors.
+        n_writers: number of threads writing tensors (used only if write_fn is given).
+            Numbers of threads follow the convention of joblib (see compute_n_threads).
+        queue_size: maximum number of images waiting between two stages.
+        nifti_cache: folder of the cache of decoded volumes (see clinicadl.utils.nifti).
+            If None, volumes are not cached.
+    Yields:
+        the position of the input file and the list of names and tensors extracted
+        (or the output of write_fn), in the order in which images are done.
+    """
+
+    def decode(nii_path):
+        return nii_path, load_nifti_tensor(nii_path, nifti_cache)
+
+    def extract(decoded):
+        nii_path, image_tensor = decoded
+        return nii_path, extract_fn(nii_path, image_tensor=image_tensor)
+
+    def write(extracted):
+        return None, write_fn(*extracted)
+
+    stages = [
+        ("decode", decode, compute_n_threads(n_decoders)),
+        ("extract", extract, compute_n_threads(n_extractors)),
+    ]
+    if write_fn is not None:
+        stages.append(("write", write, compute_n_threads(n_writers)))
+
+    pipeline = StagedPipeline(stages, queue_size)
+    for position, (_, output) in pipeline.run(input_files):
+        yield position, output
+    pipeline.log_throughput()
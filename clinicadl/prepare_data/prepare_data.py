@@ -1,20 +1,65 @@
 from logging import getLogger
 
 
-def DeepLearningPrepareData(caps_directory, tsv_file, n_proc, parameters):
+def DeepLearningPrepareData(
+    caps_directory,
+    tsv_file,
+    n_proc,
+    parameters,
+    n_decoders=2,
+    n_writers=4,
+    nifti_cache=None,
+):
     import os
     from os import path
 
-    from clinica.utils.inputs import check_caps_folder, clinica_file_reader
+    import torch
+    from clinica.utils.inputs import check_caps_folder
     from clinica.utils.nipype import container_from_filename
     from clinica.utils.participant import get_subject_session_list
-    from joblib import Parallel, delayed
-    from torch import save as save_tensor
 
+    from clinicadl.utils.caps_dataset.caps_index import get_caps_index
+    from clinicadl.utils.caps_dataset.chunked_store import ChunkedStoreWriter
+    from clinicadl.utils.caps_dataset.foreground import (
+        ForegroundIndex,
+        compute_bounding_box,
+        compute_foreground_mask,
+        compute_foreground_patches,
+        get_foreground_index_path,
+        union_bounding_box,
+    )
+    from clinicadl.utils.caps_dataset.image_statistics import (
+        NORMALIZATION_SCOPES,
+        ImageStatisticsIndex,
+        compute_image_statistics,
+        get_statistics_index_path,
+        normalize_tensor,
+    )
+    from clinicadl.utils.caps_dataset.memmap_store import (
+        MemmapStoreWriter,
+        get_store_dir,
+    )
+    from clinicadl.utils.caps_dataset.pyramid import compute_pyramid, get_level_path
+    from clinicadl.utils.caps_dataset.quantization import (
+        check_tensor_dtype,
+        save_tensor,
+    )
     from clinicadl.utils.exceptions import ClinicaDLArgumentError
     from clinicadl.utils.preprocessing import write_preprocessing
 
-    from .prepare_data_utils import check_mask_list, compute_folder_and_file_type
+    from .extraction_manifest import (
+        ExtractionManifest,
+        compute_parameters_hash,
+        get_manifest_path,
+        summarize_tensor_shapes,
+    )
+    from .extraction_pipeline import stream_extraction
+    from .prepare_data_utils import (
+        check_mask_list,
+        compute_folder_and_file_type,
+        get_tensor_shapes,
+        load_nifti_tensor,
+    )
 
     logger = getLogger("clinicadl.extract")
 
@@ -47,12 +92,36 @@ def DeepLearningPrepareData(caps_directory, tsv_file, n_proc, parameters):
     )
     mod_subfolder, file_type = compute_folder_and_file_type(parameters)
     parameters["file_type"] = file_type
+    parameters.setdefault("tensor_format", "pt")
+    parameters.setdefault("tensor_dtype", "float32")
+    check_tensor_dtype(parameters["tensor_dtype"])
+
+    # Images already extracted with the same parameters are recorded in a manifest.
+    # It is only used by the pt format, as stores are written at once.
+    manifest = None
+    if parameters["tensor_format"] == "pt":
+        manifest = ExtractionManifest(
+            get_manifest_path(caps_directory, parameters["extract_json"]),
+            compute_parameters_hash(parameters),
+        )
+    json_path = path.join(
+        caps_directory, "tensor_extraction", parameters["extract_json"]
+    )
+    if path.exists(json_path) and (
+        manifest is None or len(manifest) == 0 or manifest.n_outdated > 0
+    ):
+        raise ClinicaDLArgumentError(
+            f"JSON file at {json_path} already exists and does not describe the same extraction. "
+            f"Please choose another name for your preprocessing file."
+        )
 
     # Input file:
-    input_files = clinica_file_reader(subjects, sessions, caps_directory, file_type)[0]
+    caps_index = get_caps_index(caps_directory, file_type)
+    input_files = caps_index.read_files(subjects, sessions)
 
     def write_output_imgs(output_mode, container, subfolder):
         # Write the extracted tensor on a .pt file
+        output_files = list()
         for filename, tensor in output_mode:
             output_file_dir = path.join(
                 caps_directory,
@@ -61,122 +130,435 @@ def DeepLearningPrepareData(caps_directory, tsv_file, n_proc, parameters):
                 subfolder,
                 mod_subfolder,
             )
-            if not path.exists(output_file_dir):
-                os.makedirs(output_file_dir)
+            os.makedirs(output_file_dir, exist_ok=True)
             output_file = path.join(output_file_dir, filename)
-            save_tensor(tensor, output_file)
+            save_tensor(tensor, output_file, parameters["tensor_dtype"])
             logger.debug(f"    Output tensor saved at {output_file}")
+            output_files.append(path.relpath(output_file, caps_directory))
+        return output_files
 
     if parameters["mode"] == "image" or not parameters["prepare_dl"]:
+        subfolder = "image_based"
 
-        def prepare_image(file):
+        def prepare_image(file, image_tensor=None):
             from .prepare_data_utils import extract_images
 
             logger.debug(f"  Processing of {file}.")
-            container = container_from_filename(file)
-            subfolder = "image_based"
-            output_mode = extract_images(file)
+            output_mode = extract_images(file, image_tensor=image_tensor)
             logger.debug(f"    Image extracted.")
-            write_output_imgs(output_mode, container, subfolder)
+            return output_mode
 
-        Parallel(n_jobs=n_proc)(delayed(prepare_image)(file) for file in input_files)
+        prepare_file = prepare_image
 
     elif parameters["prepare_dl"] and parameters["mode"] == "slice":
+        subfolder = "slice_based"
 
-        def prepare_slice(file):
+        def prepare_slice(file, image_tensor=None):
             from .prepare_data_utils import extract_slices
 
             logger.debug(f"  Processing of {file}.")
-            container = container_from_filename(file)
-            subfolder = "slice_based"
             output_mode = extract_slices(
                 file,
                 slice_direction=parameters["slice_direction"],
                 slice_mode=parameters["slice_mode"],
                 discarded_slices=parameters["discarded_slices"],
+                image_tensor=image_tensor,
             )
             logger.debug(f"    {len(output_mode)} slices extracted.")
-            write_output_imgs(output_mode, container, subfolder)
+            return output_mode
 
-        Parallel(n_jobs=n_proc)(delayed(prepare_slice)(file) for file in input_files)
+        prepare_file = prepare_slice
 
     elif parameters["prepare_dl"] and parameters["mode"] == "patch":
+        subfolder = "patch_based"
 
-        def prepare_patch(file):
+        def prepare_patch(file, image_tensor=None):
             from .prepare_data_utils import extract_patches
 
             logger.debug(f"  Processing of {file}.")
-            container = container_from_filename(file)
-            subfolder = "patch_based"
             output_mode = extract_patches(
                 file,
                 patch_size=parameters["patch_size"],
                 stride_size=parameters["stride_size"],
+                image_tensor=image_tensor,
             )
             logger.debug(f"    {len(output_mode)} patches extracted.")
-            write_output_imgs(output_mode, container, subfolder)
+            return output_mode
 
-        Parallel(n_jobs=n_proc)(delayed(prepare_patch)(file) for file in input_files)
+        prepare_file = prepare_patch
 
     elif parameters["prepare_dl"] and parameters["mode"] == "roi":
+        subfolder = "roi_based"
+
+        if parameters["preprocessing"] == "custom":
+            if not parameters["roi_custom_template"]:
+                raise ClinicaDLArgumentError(
+                    "A custom template must be defined when the modality is set to custom."
+                )
+            parameters["roi_template"] = parameters["roi_custom_template"]
+            parameters["roi_mask_pattern"] = parameters["roi_custom_mask_pattern"]
+        else:
+            from .prepare_data_utils import PATTERN_DICT, TEMPLATE_DICT
 
-        def prepare_roi(file):
+            parameters["roi_template"] = TEMPLATE_DICT[parameters["preprocessing"]]
+            parameters["roi_mask_pattern"] = PATTERN_DICT[parameters["preprocessing"]]
+
+        parameters["masks_location"] = path.join(
+            caps_directory, "masks", f"tpl-{parameters['roi_template']}"
+        )
+        if len(parameters["roi_list"]) == 0:
+            raise ClinicaDLArgumentError("A list of regions of interest must be given.")
+        # Masks must be cropped as the images they are applied to
+        cropped_input = (
+            None
+            if parameters["use_uncropped_image"] is None
+            else not parameters["use_uncropped_image"]
+        )
+        # Masks are checked once here. Then each worker loads them once, at its first image.
+        check_mask_list(
+            parameters["masks_location"],
+            parameters["roi_list"],
+            parameters["roi_mask_pattern"],
+            cropped_input,
+        )
+
+        def prepare_roi(file, image_tensor=None):
             from .prepare_data_utils import extract_roi
 
             logger.debug(f"  Processing of {file}.")
-            container = container_from_filename(file)
-            subfolder = "roi_based"
-            if parameters["preprocessing"] == "custom":
-                if not parameters["roi_custom_template"]:
-                    raise ClinicaDLArgumentError(
-                        "A custom template must be defined when the modality is set to custom."
-                    )
-                parameters["roi_template"] = parameters["roi_custom_template"]
-                parameters["roi_mask_pattern"] = parameters["roi_custom_mask_pattern"]
-            else:
-                from .prepare_data_utils import PATTERN_DICT, TEMPLATE_DICT
-
-                parameters["roi_template"] = TEMPLATE_DICT[parameters["preprocessing"]]
-                parameters["roi_mask_pattern"] = PATTERN_DICT[
-                    parameters["preprocessing"]
-                ]
-
-            parameters["masks_location"] = path.join(
-                caps_directory, "masks", f"tpl-{parameters['roi_template']}"
-            )
-            if len(parameters["roi_list"]) == 0:
-                raise ClinicaDLArgumentError(
-                    "A list of regions of interest must be given."
-                )
-            else:
-                check_mask_list(
-                    parameters["masks_location"],
-                    parameters["roi_list"],
-                    parameters["roi_mask_pattern"],
-                    None
-                    if parameters["use_uncropped_image"] is None
-                    else not parameters["use_uncropped_image"],
-                )
             output_mode = extract_roi(
                 file,
                 masks_location=parameters["masks_location"],
                 mask_pattern=parameters["roi_mask_pattern"],
-                cropped_input=None
-                if parameters["use_uncropped_image"] is None
-                else not parameters["use_uncropped_image"],
+                cropped_input=cropped_input,
                 roi_names=parameters["roi_list"],
                 uncrop_output=parameters["uncropped_roi"],
+                image_tensor=image_tensor,
             )
             logger.debug(f"    ROI extracted.")
-            write_output_imgs(output_mode, container, subfolder)
+            return output_mode
 
-        Parallel(n_jobs=n_proc)(delayed(prepare_roi)(file) for file in input_files)
+        prepare_file = prepare_roi
 
     else:
         raise NotImplementedError(
             f"Extraction is not implemented for mode {parameters['mode']}."
         )
 
+    prenormalize = parameters.get("prenormalize")
+    if prenormalize is not None:
+        if prenormalize not in NORMALIZATION_SCOPES:
+            raise ClinicaDLArgumentError(
+                f"Tensors cannot be normalized with the {prenormalize} scope. "
+                f"Please choose between {', '.join(NORMALIZATION_SCOPES)}."
+            )
+        if prenormalize == "element" and subfolder == "image_based":
+            # Whole images are written, from which elements are extracted on-the-fly
+            parameters["prenormalize"] = prenormalize = "image"
+
+    # The statistics of each image are recorded, so that datasets can normalize tensors
+    # without scanning them.
+    statistics_index = ImageStatisticsIndex(
+        get_statistics_index_path(caps_directory, parameters["extract_json"])
+    )
+
+    # The foreground of each image is recorded, so that datasets can crop the
+    # background of images and skip the patches which only contain background.
+    foreground_index = None
+    if parameters.get("foreground_threshold") is not None:
+        if parameters["mode"] not in ["image", "patch"]:
+            raise ClinicaDLArgumentError(
+                "The foreground threshold can only be used to extract images or patches."
+            )
+        if not 0 <= parameters["foreground_threshold"] <= 1:
+            raise ClinicaDLArgumentError(
+                f"The foreground threshold is a fraction of voxels and must be between 0 and 1, "
+                f"got {parameters['foreground_threshold']}."
+            )
+        foreground_index = ForegroundIndex(
+            get_foreground_index_path(caps_directory, parameters["extract_json"])
+        )
+
+    # Downsampled versions of the images are written after them, so that datasets can
+    # select a lower resolution without a new extraction.
+    pyramid_levels = parameters.setdefault("pyramid_levels", 0)
+    if pyramid_levels < 0:
+        raise ClinicaDLArgumentError(
+            f"The number of pyramid levels must be positive, got {pyramid_levels}."
+        )
+    if pyramid_levels > 0 and subfolder != "image_based":
+        raise ClinicaDLArgumentError(
+            "A resolution pyramid can only be extracted for whole images. Please extract "
+            "images, or extract the elements on-the-fly during training."
+        )
+
+    def get_element_outputs(output_mode):
+        # Levels of the pyramid are not elements of the image
+        return output_mode[: len(output_mode) - pyramid_levels]
+
+    image_records = dict()
+    extract_file = prepare_file
+
+    def prepare_file(file, image_tensor=None):
+        if image_tensor is None:
+            image_tensor = load_nifti_tensor(file)
+        statistics = compute_image_statistics(image_tensor)
+
+        foreground = None
+        if foreground_index is not None:
+            mask = compute_foreground_mask(image_tensor)
+            patch_ids = list()
+            if parameters["mode"] == "patch":
+                patch_ids = compute_foreground_patches(
+                    mask,
+                    parameters["patch_size"],
+                    parameters["stride_size"],
+                    parameters["foreground_threshold"],
+                )
+            foreground = (compute_bounding_box(mask), patch_ids)
+
+        if prenormalize == "image":
+            image_tensor = normalize_tensor(image_tensor, statistics)
+        output_mode = extract_file(file, image_tensor=image_tensor)
+        if prenormalize == "element":
+            output_mode = [
+                (filename, normalize_tensor(tensor)) for filename, tensor in output_mode
+            ]
+        if pyramid_levels > 0:
+            filename, _ = output_mode[0]
+            if statistics.has_nan and prenormalize is None:
+                image_tensor = torch.nan_to_num(image_tensor)
+            output_mode = output_mode + [
+                (get_level_path(filename, level), level_tensor)
+                for level, level_tensor in enumerate(
+                    compute_pyramid(image_tensor, pyramid_levels), start=1
+                )
+            ]
+
+        image_records[file] = (statistics, foreground)
+        return output_mode
+
+    def record_image(idx):
+        statistics, foreground = image_records.pop(input_files[idx])
+        statistics_index.add(subjects[idx], sessions[idx], statistics)
+        if foreground is not None:
+            foreground_index.add(subjects[idx], sessions[idx], *foreground)
+
+    if parameters["tensor_format"] in ["memmap", "chunked"]:
+        # Tensors are gathered in the main process which appends them to the store
+        store_dir = get_store_dir(
+            caps_directory, parameters["extract_json"], parameters["tensor_format"]
+        )
+        writer_class = (
+            MemmapStoreWriter
+            if parameters["tensor_format"] == "memmap"
+            else ChunkedStoreWriter
+        )
+        image_shapes = list()
+        with writer_class(store_dir, parameters["tensor_dtype"]) as writer:
+            for idx, output_mode in stream_extraction(
+                input_files,
+                prepare_file,
+                n_decoders=n_decoders,
+                n_extractors=n_proc,
+                nifti_cache=nifti_cache,
+            ):
+                writer.write(
+                    subjects[idx], sessions[idx], [tensor for _, tensor in output_mode]
+                )
+                tensor_shapes = get_tensor_shapes(get_element_outputs(output_mode))
+                image_shapes.append((len(tensor_shapes), set(tensor_shapes)))
+                record_image(idx)
+        logger.info(f"Tensors saved in {store_dir}.")
+
+    elif parameters["tensor_format"] == "pt":
+
+        def write_image(file, output_mode):
+            output_files = write_output_imgs(
+                output_mode, container_from_filename(file), subfolder
+            )
+            return output_files, get_tensor_shapes(get_element_outputs(output_mode))
+
+        to_extract = [
+            idx
+            for idx, (subject, session, file) in enumerate(
+                zip(subjects, sessions, input_files)
+            )
+            if not manifest.is_up_to_date(subject, session, file, caps_directory)
+            or (subject, session) not in statistics_index
+            or (
+                foreground_index is not None
+                and (subject, session) not in foreground_index
+            )
+        ]
+        logger.info(
+            f"{len(input_files) - len(to_extract)} images are already extracted and up to date, "
+            f"{len(to_extract)} images will be extracted."
+        )
+        # Images are recorded in the manifest as soon as they are written,
+        # so that an interrupted extraction can be resumed.
+        for position, (output_files, tensor_shapes) in stream_extraction(
+            [input_files[idx] for idx in to_extract],
+            prepare_file,
+            write_image,
+            n_decoders=n_decoders,
+            n_extractors=n_proc,
+            n_writers=n_writers,
+            nifti_cache=nifti_cache,
+        ):
+            idx = to_extract[position]
+            manifest.add(
+                subjects[idx],
+                sessions[idx],
+                input_files[idx],
+                output_files,
+                tensor_shapes,
+            )
+            record_image(idx)
+
+        image_shapes = [
+            manifest.get_tensor_shapes(subject, session)
+            for subject, session in zip(subjects, sessions)
+        ]
+
+    else:
+        raise ClinicaDLArgumentError(
+            f"Tensor format {parameters['tensor_format']} is not implemented. "
+            f"Please choose between 'pt', 'memmap' and 'chunked'."
+        )
+
+    # Record the shapes so that datasets can be built without loading tensors
+    num_tensors, tensor_shape = summarize_tensor_shapes(image_shapes)
+    if num_tensors is not None:
+        parameters["num_tensors"] = num_tensors
+    if tensor_shape is not None:
+        parameters["tensor_shape"] = list(tensor_shape)
+    else:
+        logger.warning(
+            "Extracted tensors do not all have the same shape. Datasets will load "
+            "the first tensor to find the input size."
+        )
+
+    if foreground_index is not None and parameters["mode"] == "image":
+        # Images are cropped to a common box to keep the same shape
+        foreground_bbox = union_bounding_box(
+            [
+                foreground_index.get_bounding_box(subject, session)
+                for subject, session in zip(subjects, sessions)
+            ]
+        )
+        parameters["foreground_bbox"] = [
+            list(dim_range) for dim_range in foreground_bbox
+        ]
+        logger.info(f"Images will be cropped to the foreground box {foreground_bbox}.")
+    elif foreground_index is not None:
+        n_foreground = sum(
+            len(foreground_index.get_patch_ids(subject, session))
+            for subject, session in zip(subjects, sessions)
+        )
+        logger.info(
+            f"{n_foreground} patches of {len(subjects)} images contain foreground "
+            f"and will be used by datasets."
+        )
+
+    # Extracted tensors modified the sessions folders
+    caps_index.update(subjects, sessions)
+
     # Save parameters dictionary
+    preprocessing_json_path = write_preprocessing(
+        parameters, caps_directory, overwrite=path.exists(json_path)
+    )
+    logger.info(f"Preprocessing JSON saved at {preprocessing_json_path}.")
+
+
+def ConvertTensorFormat(
+    caps_directory, preprocessing_json, tensor_format, extract_json, tsv_file, n_proc
+):
+    import shutil
+    from os import path
+
+    import pandas as pd
+    from clinica.utils.participant import get_subject_session_list
+    from joblib import Parallel, delayed, effective_n_jobs
+
+    from clinicadl.utils.caps_dataset.chunked_store import ChunkedStoreWriter
+    from clinicadl.utils.caps_dataset.data import return_dataset
+    from clinicadl.utils.caps_dataset.foreground import get_foreground_index_path
+    from clinicadl.utils.caps_dataset.image_statistics import get_statistics_index_path
+    from clinicadl.utils.caps_dataset.memmap_store import (
+        MemmapStoreWriter,
+        get_store_dir,
+    )
+    from clinicadl.utils.exceptions import ClinicaDLArgumentError
+    from clinicadl.utils.preprocessing import read_preprocessing, write_preprocessing
+
+    from .prepare_data_utils import compute_extract_json
+
+    logger = getLogger("clinicadl.extract")
+
+    parameters = read_preprocessing(
+        path.join(caps_directory, "tensor_extraction", preprocessing_json)
+    )
+    source_format = parameters.get("tensor_format", "pt")
+    if tensor_format not in ["memmap", "chunked"]:
+        raise ClinicaDLArgumentError(
+            f"Tensors cannot be converted to the {tensor_format} format. "
+            f"Please choose between 'memmap' and 'chunked'."
+        )
+    if source_format == tensor_format:
+        raise ClinicaDLArgumentError(
+            f"Tensors described by {preprocessing_json} are already stored in the "
+            f"{tensor_format} format."
+        )
+
+    sessions, subjects = get_subject_session_list(
+        caps_directory, tsv_file, False, False, None
+    )
+    data_df = pd.DataFrame(
+        {"participant_id": subjects, "session_id": sessions, "cohort": "single"}
+    )
+    # The dataset finds the tensors of each image, whatever their current format
+    dataset = return_dataset(
+        caps_directory, data_df, parameters, None, label_presence=False
+    )
+    logger.info(
+        f"Tensors of {len(sessions)} images will be converted from the {source_format} "
+        f"format to the {tensor_format} format."
+    )
+
+    parameters["tensor_format"] = tensor_format
+    source_json = parameters["extract_json"]
+    parameters["extract_json"] = compute_extract_json(extract_json)
+    parameters.setdefault("tensor_dtype", "float32")
+    store_dir = get_store_dir(
+        caps_directory, parameters["extract_json"], parameters["tensor_format"]
+    )
+    writer_class = (
+        MemmapStoreWriter if tensor_format == "memmap" else ChunkedStoreWriter
+    )
+    # Images are read by groups of one image per job
+    n_jobs = effective_n_jobs(n_proc)
+    with writer_class(store_dir, parameters["tensor_dtype"]) as writer:
+        for begin in range(0, len(subjects), n_jobs):
+            end = begin + n_jobs
+            tensors_list = Parallel(n_jobs=n_jobs)(
+                delayed(dataset.get_stored_tensors)(subject, session, "single")
+                for subject, session in zip(subjects[begin:end], sessions[begin:end])
+            )
+            for subject, session, tensors in zip(
+                subjects[begin:end], sessions[begin:end], tensors_list
+            ):
+                writer.write(subject, session, tensors)
+    logger.info(f"Tensors saved in {store_dir}.")
+
+    # The indexes describing the images are the same for the converted tensors
+    for get_index_path in [get_statistics_index_path, get_foreground_index_path]:
+        source_index_path = get_index_path(caps_directory, source_json)
+        if path.isfile(source_index_path):
+            shutil.copyfile(
+                source_index_path,
+                get_index_path(caps_directory, parameters["extract_json"]),
+            )
+
     preprocessing_json_path = write_preprocessing(parameters, caps_directory)
     logger.info(f"Preprocessing JSON saved at {preprocessing_json_path}.")
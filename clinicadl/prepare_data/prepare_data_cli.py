@@ -4,7 +4,7 @@ import click
 
 from clinicadl.utils import cli_param
 
-from .prepare_data import DeepLearningPrepareData
+from .prepare_data import ConvertTensorFormat, DeepLearningPrepareData
 from .prepare_data_utils import get_parameters_dict
 
 
@@ -12,8 +12,16 @@ from .prepare_data_utils import get_parameters_dict
 @cli_param.argument.caps_directory
 @cli_param.argument.modality
 @cli_param.option.n_proc
+@cli_param.option.n_decoders
+@cli_param.option.n_writers
+@cli_param.option.nifti_cache
 @cli_param.option.subjects_sessions_tsv
 @cli_param.option.extract_json
+@cli_param.option.tensor_format
+@cli_param.option.tensor_dtype
+@cli_param.option.prenormalize
+@cli_param.option.foreground_threshold
+@cli_param.option.pyramid_levels
 @cli_param.option.use_uncropped_image
 @cli_param.option.acq_label
 @cli_param.option.suvr_reference_region
@@ -22,8 +30,16 @@ def image_cli(
     caps_directory: str,
     modality: str,
     n_proc: int,
+    n_decoders: int = 2,
+    n_writers: int = 4,
+    nifti_cache: Optional[str] = None,
     subjects_sessions_tsv: Optional[str] = None,
     extract_json: str = None,
+    tensor_format: str = "pt",
+    tensor_dtype: str = "float32",
+    prenormalize: Optional[str] = None,
+    foreground_threshold: Optional[float] = None,
+    pyramid_levels: int = 0,
     use_uncropped_image: bool = False,
     acq_label: Optional[str] = None,
     suvr_reference_region: Optional[str] = None,
@@ -44,12 +60,20 @@ def image_cli(
         custom_suffix,
         acq_label,
         suvr_reference_region,
+        tensor_format,
+        tensor_dtype,
+        prenormalize,
     )
+    parameters["foreground_threshold"] = foreground_threshold
+    parameters["pyramid_levels"] = pyramid_levels
     DeepLearningPrepareData(
         caps_directory=caps_directory,
         tsv_file=subjects_sessions_tsv,
         n_proc=n_proc,
         parameters=parameters,
+        n_decoders=n_decoders,
+        n_writers=n_writers,
+        nifti_cache=nifti_cache,
     )
 
 
@@ -57,9 +81,17 @@ def image_cli(
 @cli_param.argument.caps_directory
 @cli_param.argument.modality
 @cli_param.option.n_proc
+@cli_param.option.n_decoders
+@cli_param.option.n_writers
+@cli_param.option.nifti_cache
 @cli_param.option.save_features
 @cli_param.option.subjects_sessions_tsv
 @cli_param.option.extract_json
+@cli_param.option.tensor_format
+@cli_param.option.tensor_dtype
+@cli_param.option.prenormalize
+@cli_param.option.foreground_threshold
+@cli_param.option.pyramid_levels
 @cli_param.option.use_uncropped_image
 @click.option(
     "-ps",
@@ -82,9 +114,17 @@ def patch_cli(
     caps_directory: str,
     modality: str,
     n_proc: int,
+    n_decoders: int = 2,
+    n_writers: int = 4,
+    nifti_cache: Optional[str] = None,
     save_features: bool = False,
     subjects_sessions_tsv: Optional[str] = None,
     extract_json: str = None,
+    tensor_format: str = "pt",
+    tensor_dtype: str = "float32",
+    prenormalize: Optional[str] = None,
+    foreground_threshold: Optional[float] = None,
+    pyramid_levels: int = 0,
     use_uncropped_image: bool = False,
     patch_size: int = 50,
     stride_size: int = 50,
@@ -107,15 +147,23 @@ def patch_cli(
         custom_suffix,
         acq_label,
         suvr_reference_region,
+        tensor_format,
+        tensor_dtype,
+        prenormalize,
     )
     parameters["patch_size"] = patch_size
     parameters["stride_size"] = stride_size
+    parameters["foreground_threshold"] = foreground_threshold
+    parameters["pyramid_levels"] = pyramid_levels
 
     DeepLearningPrepareData(
         caps_directory=caps_directory,
         tsv_file=subjects_sessions_tsv,
         n_proc=n_proc,
         parameters=parameters,
+        n_decoders=n_decoders,
+        n_writers=n_writers,
+        nifti_cache=nifti_cache,
     )
 
 
@@ -123,9 +171,16 @@ def patch_cli(
 @cli_param.argument.caps_directory
 @cli_param.argument.modality
 @cli_param.option.n_proc
+@cli_param.option.n_decoders
+@cli_param.option.n_writers
+@cli_param.option.nifti_cache
 @cli_param.option.save_features
 @cli_param.option.subjects_sessions_tsv
 @cli_param.option.extract_json
+@cli_param.option.tensor_format
+@cli_param.option.tensor_dtype
+@cli_param.option.prenormalize
+@cli_param.option.pyramid_levels
 @cli_param.option.use_uncropped_image
 @click.option(
     "-sd",
@@ -163,9 +218,16 @@ def slice_cli(
     caps_directory: str,
     modality: str,
     n_proc: int,
+    n_decoders: int = 2,
+    n_writers: int = 4,
+    nifti_cache: Optional[str] = None,
     save_features: bool = False,
     subjects_sessions_tsv: Optional[str] = None,
     extract_json: str = None,
+    tensor_format: str = "pt",
+    tensor_dtype: str = "float32",
+    prenormalize: Optional[str] = None,
+    pyramid_levels: int = 0,
     use_uncropped_image: bool = False,
     slice_direction: int = 0,
     slice_mode: str = "rgb",
@@ -189,16 +251,23 @@ def slice_cli(
         custom_suffix,
         acq_label,
         suvr_reference_region,
+        tensor_format,
+        tensor_dtype,
+        prenormalize,
     )
     parameters["slice_direction"] = slice_direction
     parameters["slice_mode"] = slice_mode
     parameters["discarded_slices"] = discarded_slices
+    parameters["pyramid_levels"] = pyramid_levels
 
     DeepLearningPrepareData(
         caps_directory=caps_directory,
         tsv_file=subjects_sessions_tsv,
         n_proc=n_proc,
         parameters=parameters,
+        n_decoders=n_decoders,
+        n_writers=n_writers,
+        nifti_cache=nifti_cache,
     )
 
 
@@ -206,9 +275,15 @@ def slice_cli(
 @cli_param.argument.caps_directory
 @cli_param.argument.modality
 @cli_param.option.n_proc
+@cli_param.option.n_decoders
+@cli_param.option.n_writers
+@cli_param.option.nifti_cache
 @cli_param.option.save_features
 @cli_param.option.subjects_sessions_tsv
 @cli_param.option.extract_json
+@cli_param.option.tensor_format
+@cli_param.option.tensor_dtype
+@cli_param.option.prenormalize
 @cli_param.option.use_uncropped_image
 @click.option(
     "--roi_list",
@@ -249,9 +324,15 @@ def roi_cli(
     caps_directory: str,
     modality: str,
     n_proc: int,
+    n_decoders: int = 2,
+    n_writers: int = 4,
+    nifti_cache: Optional[str] = None,
     save_features: bool = False,
     subjects_sessions_tsv: Optional[str] = None,
     extract_json: str = None,
+    tensor_format: str = "pt",
+    tensor_dtype: str = "float32",
+    prenormalize: Optional[str] = None,
     use_uncropped_image: bool = False,
     roi_list: list = [],
     roi_uncrop_output: bool = False,
@@ -276,6 +357,9 @@ def roi_cli(
         custom_suffix,
         acq_label,
         suvr_reference_region,
+        tensor_format,
+        tensor_dtype,
+        prenormalize,
     )
     parameters["roi_list"] = roi_list
     parameters["uncropped_roi"] = roi_uncrop_output
@@ -287,6 +371,49 @@ def roi_cli(
         tsv_file=subjects_sessions_tsv,
         n_proc=n_proc,
         parameters=parameters,
+        n_decoders=n_decoders,
+        n_writers=n_writers,
+        nifti_cache=nifti_cache,
+    )
+
+
+@click.command(name="convert", no_args_is_help=True)
+@cli_param.argument.caps_directory
+@cli_param.argument.preprocessing_json
+@click.option(
+    "--format",
+    "tensor_format",
+    type=click.Choice(["memmap", "chunked"]),
+    default="chunked",
+    show_default=True,
+    help="Format of the converted tensors.",
+)
+@cli_param.option.n_proc
+@cli_param.option.subjects_sessions_tsv
+@cli_param.option.extract_json
+def convert_cli(
+    caps_directory: str,
+    preprocessing_json: str,
+    tensor_format: str = "chunked",
+    n_proc: int = 2,
+    subjects_sessions_tsv: Optional[str] = None,
+    extract_json: str = None,
+):
+    """Convert extracted tensors to another format.
+
+    CAPS_DIRECTORY is the CAPS folder where tensors were extracted.
+
+    PREPROCESSING_JSON is the name of the JSON file in CAPS_DIRECTORY/tensor_extraction folder
+    describing the extraction. A new JSON file describing the converted tensors is created,
+    the original tensors are kept.
+    """
+    ConvertTensorFormat(
+        caps_directory=caps_directory,
+        preprocessing_json=preprocessing_json,
+        tensor_format=tensor_format,
+        extract_json=extract_json,
+        tsv_file=subjects_sessions_tsv,
+        n_proc=n_proc,
     )
 
 
@@ -307,6 +434,7 @@ cli.add_command(image_cli)
 cli.add_command(slice_cli)
 cli.add_command(patch_cli)
 cli.add_command(roi_cli)
+cli.add_command(convert_cli)
 
 
 if __name__ == "__main__":
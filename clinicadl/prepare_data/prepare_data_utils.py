@@ -1,11 +1,14 @@
 # coding: utf8
+from functools import lru_cache
 from os import path
 from time import time
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import torch
 
+from clinicadl.utils.exceptions import ClinicaDLArgumentError
+
 
 def get_parameters_dict(
     modality: str,
@@ -16,6 +19,9 @@ def get_parameters_dict(
     custom_suffix: str,
     acq_label: str,
     suvr_reference_region: str,
+    tensor_format: str = "pt",
+    tensor_dtype: str = "float32",
+    prenormalize: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     Args:
@@ -30,6 +36,10 @@ def get_parameters_dict(
         acq_label: name of the tracer (specific to PET pipelines).
         suvr_reference_region: name of the reference region for normalization
             specific to PET pipelines)
+        tensor_format: format of the output tensors (pt, memmap or chunked).
+        tensor_dtype: storage dtype of the output tensors (float32, float16, bfloat16, uint8 or uint16).
+        prenormalize: if given, tensors are written without NaN and min-max normalized,
+            with the statistics of each image (image) or of each tensor (element).
     Returns:
         The dictionary of parameters specific to the preprocessing
     """
@@ -38,6 +48,9 @@ def get_parameters_dict(
         "mode": extract_method,
         "use_uncropped_image": use_uncropped_image,
         "prepare_dl": save_features,
+        "tensor_format": tensor_format,
+        "tensor_dtype": tensor_dtype,
+        "prenormalize": prenormalize,
     }
 
     if modality == "custom":
@@ -96,6 +109,18 @@ def compute_folder_and_file_type(
 ############
 # SLICE    #
 ############
+def get_tensor_shapes(
+    output_mode: List[Tuple[str, torch.Tensor]]
+) -> List[Tuple[int, ...]]:
+    """
+    Args:
+        output_mode: list of tuples containing the name and the tensor of the elements of an image.
+    Returns:
+        the shapes of the tensors.
+    """
+    return [tuple(tensor.shape) for _, tensor in output_mode]
+
+
 def compute_discarded_slices(discarded_slices: Union[int, tuple]) -> Tuple[int, int]:
     if isinstance(discarded_slices, int):
         begin_discard, end_discard = discarded_slices, discarded_slices
@@ -116,6 +141,7 @@ def extract_slices(
     slice_direction: int = 0,
     slice_mode: str = "single",
     discarded_slices: Union[int, tuple] = 0,
+    image_tensor: Optional[torch.Tensor] = None,
 ) -> List[Tuple[str, torch.Tensor]]:
     """Extracts the slices from three directions
     This function extracts slices form the preprocessed nifti image.
@@ -133,14 +159,13 @@ def extract_slices(
         discarded_slices: Number of slices to discard at the beginning and the end of the image.
             Will be a tuple of two integers if the number of slices to discard at the beginning
             and at the end differ.
+        image_tensor: image already decoded from nii_path (optional).
     Returns:
         list of tuples containing the path to the extracted slice
             and the tensor of the corresponding slice.
     """
-    import nibabel as nib
-
-    image_array = nib.load(nii_path).get_fdata(dtype="float32")
-    image_tensor = torch.from_numpy(image_array).unsqueeze(0).float()
+    if image_tensor is None:
+        image_tensor = load_nifti_tensor(nii_path)
 
     begin_discard, end_discard = compute_discarded_slices(discarded_slices)
     index_list = range(
@@ -211,6 +236,7 @@ def extract_patches(
     nii_path: str,
     patch_size: int,
     stride_size: int,
+    image_tensor: Optional[torch.Tensor] = None,
 ) -> List[Tuple[str, torch.Tensor]]:
     """Extracts the patches
     This function extracts patches form the preprocessed nifti image. Patch size
@@ -222,28 +248,19 @@ def extract_patches(
         nii_path: path to the NifTi input image.
         patch_size: size of a single patch.
         stride_size: size of the stride leading to next patch.
+        image_tensor: image already decoded from nii_path (optional).
     Returns:
         list of tuples containing the path to the extracted patch
             and the tensor of the corresponding patch.
     """
-    import nibabel as nib
+    if image_tensor is None:
+        image_tensor = load_nifti_tensor(nii_path)
 
-    image_array = nib.load(nii_path).get_fdata(dtype="float32")
-    image_tensor = torch.from_numpy(image_array).unsqueeze(0).float()
-
-    patches_tensor = (
-        image_tensor.unfold(1, patch_size, stride_size)
-        .unfold(2, patch_size, stride_size)
-        .unfold(3, patch_size, stride_size)
-        .contiguous()
-    )
-    patches_tensor = patches_tensor.view(-1, patch_size, patch_size, patch_size)
+    patch_grid = get_patch_grid(tuple(image_tensor.shape), patch_size, stride_size)
 
     patch_list = []
-    for patch_index in range(patches_tensor.shape[0]):
-        patch_tensor = extract_patch_tensor(
-            image_tensor, patch_size, stride_size, patch_index, patches_tensor
-        )
+    for patch_index in range(patch_grid.num_patches):
+        patch_tensor = patch_grid.extract(image_tensor, patch_index)
         patch_path = extract_patch_path(nii_path, patch_size, stride_size, patch_index)
 
         patch_list.append((patch_path, patch_tensor))
@@ -251,27 +268,88 @@ def extract_patches(
     return patch_list
 
 
+class PatchGrid:
+    """
+    Positions of the patches of an image, in the order given by successive unfold
+    operations on the three spatial dimensions.
+
+    A patch is extracted as a view of the image followed by a copy of the patch only,
+    so its cost does not depend on the size of the image.
+    """
+
+    def __init__(self, image_shape: Tuple[int, ...], patch_size: int, stride_size: int):
+        """
+        Args:
+            image_shape: shape of the image tensor (C * D * H * W).
+            patch_size: size of a single patch.
+            stride_size: size of the stride leading to next patch.
+        Raises:
+            ClinicaDLArgumentError: if the stride is not positive or if the patch is
+                larger than the image.
+        """
+        if stride_size <= 0:
+            raise ClinicaDLArgumentError(
+                f"The stride size must be positive, got {stride_size}."
+            )
+        if patch_size > min(image_shape[1:]):
+            raise ClinicaDLArgumentError(
+                f"Patches of size {patch_size} cannot be extracted from an image "
+                f"of shape {tuple(image_shape[1:])}."
+            )
+        self.patch_size = patch_size
+        self.stride_size = stride_size
+        self.grid_shape = tuple(
+            (dim_size - patch_size) // stride_size + 1 for dim_size in image_shape[1:]
+        )
+        self.num_patches = int(np.prod(self.grid_shape))
+
+    def __len__(self) -> int:
+        return self.num_patches
+
+    def coordinates(self, patch_index: int) -> Tuple[int, int, int]:
+        """Gives the coordinates of the first voxel of the patch in the image."""
+        if not 0 <= patch_index < self.num_patches:
+            raise IndexError(
+                f"Patch index {patch_index} is out of range: "
+                f"the image only contains {self.num_patches} patches."
+            )
+        grid_coordinates = np.unravel_index(patch_index, self.grid_shape)
+        return tuple(int(coord) * self.stride_size for coord in grid_coordinates)
+
+    def extract(self, image_tensor: torch.Tensor, patch_index: int) -> torch.Tensor:
+        """
+        Args:
+            image_tensor: image of shape C * D * H * W.
+            patch_index: index of the patch in the grid.
+        Returns:
+            copy of the patch, of shape C * patch_size * patch_size * patch_size.
+        """
+        x, y, z = self.coordinates(patch_index)
+        patch_view = (
+            image_tensor.narrow(1, x, self.patch_size)
+            .narrow(2, y, self.patch_size)
+            .narrow(3, z, self.patch_size)
+        )
+        return patch_view.clone(memory_format=torch.contiguous_format)
+
+
+@lru_cache(maxsize=32)
+def get_patch_grid(
+    image_shape: Tuple[int, ...], patch_size: int, stride_size: int
+) -> PatchGrid:
+    """Gives the patch grid of an image shape, computed once per set of parameters."""
+    return PatchGrid(image_shape, patch_size, stride_size)
+
+
 def extract_patch_tensor(
     image_tensor: torch.Tensor,
     patch_size: int,
     stride_size: int,
     patch_index: int,
-    patches_tensor: torch.Tensor = None,
 ) -> torch.Tensor:
     """Extracts a single patch from image_tensor"""
-
-    if patches_tensor is None:
-        patches_tensor = (
-            image_tensor.unfold(1, patch_size, stride_size)
-            .unfold(2, patch_size, stride_size)
-            .unfold(3, patch_size, stride_size)
-            .contiguous()
-        )
-
-        # the dimension of patches_tensor is [1, patch_num1, patch_num2, patch_num3, patch_size1, patch_size2, patch_size3]
-        patches_tensor = patches_tensor.view(-1, patch_size, patch_size, patch_size)
-
-    return patches_tensor[patch_index, ...].unsqueeze_(0).clone()
+    patch_grid = get_patch_grid(tuple(image_tensor.shape), patch_size, stride_size)
+    return patch_grid.extract(image_tensor, patch_index)
 
 
 def extract_patch_path(
@@ -289,23 +367,39 @@ def extract_patch_path(
 ############
 # IMAGE    #
 ############
-def extract_images(input_img: str) -> List[Tuple[str, torch.Tensor]]:
+def load_nifti_tensor(nii_path: str, cache_dir: Optional[str] = None) -> torch.Tensor:
+    """
+    Decodes a NifTi image.
+
+    Args:
+        nii_path: path to the NifTi input image.
+        cache_dir: folder of the cache of decoded volumes (see clinicadl.utils.nifti).
+    Returns:
+        float32 tensor of shape 1 * D * H * W.
+    """
+    from clinicadl.utils.nifti import read_nifti
+
+    image_array = read_nifti(nii_path, cache_dir)
+    return torch.from_numpy(image_array).unsqueeze(0)
+
+
+def extract_images(
+    input_img: str, image_tensor: Optional[torch.Tensor] = None
+) -> List[Tuple[str, torch.Tensor]]:
     """Extract the images
     This function convert nifti image to tensor (.pt) version of the image.
     Tensor version is saved at the same location than input_img.
     Args:
         input_img: path to the NifTi input image.
+        image_tensor: image already decoded from input_img (optional).
     Returns:
         filename (str): single tensor file  saved on the disk. Same location than input file.
     """
 
     import os
 
-    import nibabel as nib
-    import torch
-
-    image_array = nib.load(input_img).get_fdata(dtype="float32")
-    image_tensor = torch.from_numpy(image_array).unsqueeze(0).float()
+    if image_tensor is None:
+        image_tensor = load_nifti_tensor(input_img)
     # make sure the tensor type is torch.float32
     output_file = (
         os.path.basename(input_img).replace(".nii.gz", ".pt"),
@@ -318,22 +412,68 @@ def extract_images(input_img: str) -> List[Tuple[str, torch.Tensor]]:
 ############
 # ROI    #
 ############
-def check_mask_list(masks_location, roi_list, mask_pattern, cropping):
-    import nibabel as nib
-    import numpy as np
+def check_mask_list(
+    masks_location: str, roi_list: List[str], mask_pattern: str, cropping: bool
+):
+    """
+    Checks that a binary mask can be found for each region of interest.
+
+    The masks are loaded in the cache of load_roi_masks, so that they are not read
+    again by the extraction of the images in the same process.
+
+    Args:
+        masks_location: directory containing the masks.
+        roi_list: names of the regions.
+        mask_pattern: pattern which should be found in the filename of the masks.
+        cropping: if True the masks should contain the substring 'desc-Crop'.
+    Raises:
+        FileNotFoundError: if a region does not correspond to a mask.
+        ValueError: if a mask is not binary.
+    """
+    load_roi_masks(masks_location, tuple(roi_list), mask_pattern, cropping)
+
+
+@lru_cache(maxsize=8)
+def load_roi_masks(
+    masks_location: str,
+    roi_names: Tuple[str, ...],
+    mask_pattern: str,
+    cropping: bool,
+) -> List[Tuple[str, "RoiMask"]]:
+    """
+    Finds, checks and compiles the masks of the regions of interest.
+
+    Masks are loaded once per process: the extraction of each image then only needs
+    to crop the image.
+
+    Args:
+        masks_location: directory containing the masks.
+        roi_names: names of the regions.
+        mask_pattern: pattern which should be found in the filename of the masks.
+        cropping: if True the masks should contain the substring 'desc-Crop'.
+    Returns:
+        the path and the compiled mask of each region.
+    Raises:
+        FileNotFoundError: if a region does not correspond to a mask.
+        ValueError: if a mask is not binary.
+    """
+    from clinicadl.utils.nifti import read_nifti
 
-    for roi in roi_list:
-        roi_path, desc = find_mask_path(masks_location, roi, mask_pattern, cropping)
-        if roi_path is None:
+    roi_masks = list()
+    for roi in roi_names:
+        mask_path, desc = find_mask_path(masks_location, roi, mask_pattern, cropping)
+        if mask_path is None:
             raise FileNotFoundError(
                 f"The ROI '{roi}' does not correspond to a mask in the CAPS directory. {desc}"
             )
-        roi_mask = nib.load(roi_path).get_fdata()
-        mask_values = set(np.unique(roi_mask))
+        mask_np = read_nifti(mask_path)
+        mask_values = set(np.unique(mask_np))
         if mask_values != {0, 1}:
             raise ValueError(
                 "The ROI masks used should be binary (composed of 0 and 1 only)."
             )
+        roi_masks.append((mask_path, RoiMask(mask_np)))
+    return roi_masks
 
 
 def find_mask_path(
@@ -422,6 +562,7 @@ def extract_roi(
     cropped_input: bool,
     roi_names: List[str],
     uncrop_output: bool,
+    image_tensor: Optional[torch.Tensor] = None,
 ) -> List[Tuple[str, torch.Tensor]]:
     """Extracts regions of interest defined by masks
     This function extracts regions of interest from preprocessed nifti images.
@@ -434,24 +575,19 @@ def extract_roi(
         cropped_input: if the input is cropped or not (contains desc-Crop)
         roi_names: list of the names of the regions that will be extracted.
         uncrop_output: if True, the final region is not cropped.
+        image_tensor: image already decoded from nii_path (optional).
     Returns:
         list of tuples containing the path to the extracted ROI
             and the tensor of the corresponding ROI.
     """
-    import nibabel as nib
-
-    image_array = nib.load(nii_path).get_fdata(dtype="float32")
-    image_tensor = torch.from_numpy(image_array).unsqueeze(0).float()
+    if image_tensor is None:
+        image_tensor = load_nifti_tensor(nii_path)
 
     roi_list = []
-    for roi_name in roi_names:
-        # read mask
-        mask_path, _ = find_mask_path(
-            masks_location, roi_name, mask_pattern, cropped_input
-        )
-        mask_np = nib.load(mask_path).get_fdata()
-
-        roi_tensor = extract_roi_tensor(image_tensor, mask_np, uncrop_output)
+    for mask_path, roi_mask in load_roi_masks(
+        masks_location, tuple(roi_names), mask_pattern, cropped_input
+    ):
+        roi_tensor = roi_mask.extract(image_tensor, uncrop_output)
         roi_path = extract_roi_path(nii_path, mask_path, uncrop_output)
 
         roi_list.append((roi_path, roi_tensor))
@@ -459,33 +595,92 @@ def extract_roi(
     return roi_list
 
 
+class RoiMask:
+    """
+    ROI mask compiled once: stored as a float32 tensor cropped to the bounding box of the
+    region, so that a region is extracted by cropping the image before applying the mask.
+    """
+
+    def __init__(self, mask_np: np.ndarray):
+        """
+        Args:
+            mask_np: 3D or 4D (1 * D * H * W) mask of the region.
+        """
+        if len(mask_np.shape) == 3:
+            mask_np = np.expand_dims(mask_np, axis=0)
+        elif len(mask_np.shape) == 4:
+            assert mask_np.shape[0] == 1
+        else:
+            raise ValueError(
+                "ROI masks must be 3D or 4D tensors. "
+                f"The dimension of your ROI mask is {len(mask_np.shape)}."
+            )
+
+        self.mask_shape = mask_np.shape
+        # Indices of the planes containing the region along each dimension
+        self.indices = [
+            torch.from_numpy(np.flatnonzero(mask_np.any(axis=other_axes)))
+            for other_axes in [(1, 2, 3), (0, 2, 3), (0, 1, 3), (0, 1, 2)]
+        ]
+        self.box = tuple(
+            slice(int(index[0]), int(index[-1]) + 1) if len(index) > 0 else slice(0, 0)
+            for index in self.indices
+        )
+        # Planes not containing the region inside the bounding box are also removed
+        self.contiguous = all(
+            len(index) == box_slice.stop - box_slice.start
+            for index, box_slice in zip(self.indices, self.box)
+        )
+        self.cropped_mask = self._crop(torch.from_numpy(mask_np.astype(np.float32)))
+
+    def _crop(self, tensor: torch.Tensor) -> torch.Tensor:
+        """Crops a tensor of the size of the mask to the region."""
+        if self.contiguous:
+            return tensor[self.box]
+        for dim, index in enumerate(self.indices):
+            tensor = tensor.index_select(dim, index)
+        return tensor
+
+    def share_memory_(self) -> "RoiMask":
+        """Moves the tensors of the mask to shared memory, to share them between workers."""
+        self.cropped_mask = self.cropped_mask.contiguous().share_memory_()
+        self.indices = [index.share_memory_() for index in self.indices]
+        return self
+
+    def extract(self, image_tensor: torch.Tensor, uncrop_output: bool) -> torch.Tensor:
+        """
+        Args:
+            image_tensor: image of shape 1 * D * H * W.
+            uncrop_output: if True, the region is not cropped and has the size of the image.
+        Returns:
+            the image multiplied by the mask.
+        """
+        roi_tensor = self._crop(image_tensor.float()) * self.cropped_mask
+        if not uncrop_output:
+            return roi_tensor
+
+        output_tensor = torch.zeros(
+            torch.broadcast_shapes(image_tensor.shape, self.mask_shape),
+            dtype=torch.float32,
+        )
+        if self.contiguous:
+            output_tensor[self.box] = roi_tensor
+        else:
+            output_tensor[
+                np.ix_(*[index.numpy() for index in self.indices])
+            ] = roi_tensor
+        return output_tensor
+
+
 def extract_roi_tensor(
     image_tensor: torch.Tensor,
-    mask_np,
+    mask: Union[RoiMask, np.ndarray],
     uncrop_output: bool,
 ) -> torch.Tensor:
-
-    if len(mask_np.shape) == 3:
-        mask_np = np.expand_dims(mask_np, axis=0)
-    elif len(mask_np.shape) == 4:
-        assert mask_np.shape[0] == 1
-    else:
-        raise ValueError(
-            "ROI masks must be 3D or 4D tensors. "
-            f"The dimension of your ROI mask is {len(mask_np.shape)}."
-        )
-
-    roi_tensor = image_tensor * mask_np
-    if not uncrop_output:
-        roi_tensor = roi_tensor[
-            np.ix_(
-                mask_np.any((1, 2, 3)),
-                mask_np.any((0, 2, 3)),
-                mask_np.any((0, 1, 3)),
-                mask_np.any((0, 1, 2)),
-            )
-        ]
-    return roi_tensor.float().clone()
+    """Extracts a single region from image_tensor, mask may be compiled with RoiMask"""
+    if not isinstance(mask, RoiMask):
+        mask = RoiMask(mask)
+    return mask.extract(image_tensor, uncrop_output)
 
 
 def extract_roi_path(img_path: str, mask_path: str, uncrop_output: bool) -> str:
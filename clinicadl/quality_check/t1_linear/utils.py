@@ -4,14 +4,14 @@ Copied from https://github.com/vfonov/deep-qc/blob/master/python/model/resnet_qc
 
 from os import path
 
-import nibabel as nib
 import torch
 import torch.nn as nn
 from clinica.utils.input_files import T1W_LINEAR_CROPPED
-from clinica.utils.inputs import clinica_file_reader
 from torch.utils.data import Dataset
 
+from clinicadl.utils.caps_dataset.caps_index import get_caps_index
 from clinicadl.utils.caps_dataset.data import CapsDatasetImage
+from clinicadl.utils.nifti import load_nifti_image
 
 
 def conv3x3(in_planes, out_planes, stride=1):
@@ -201,6 +201,9 @@ class QCDataset(Dataset):
             label_presence=False,
             all_transformations=MinMaxNormalization(),
         )
+        self.caps_index = get_caps_index(img_dir, T1W_LINEAR_CROPPED).update(
+            self.df.participant_id.values, self.df.session_id.values
+        )
 
     def __len__(self):
         return len(self.df)
@@ -212,10 +215,8 @@ class QCDataset(Dataset):
         else:
             subject = self.df.loc[idx, "participant_id"]
             session = self.df.loc[idx, "session_id"]
-            image_path = clinica_file_reader(
-                [subject], [session], self.img_dir, T1W_LINEAR_CROPPED
-            )[0]
-            image = nib.load(image_path[0])
+            image_path = self.caps_index.read_files([subject], [session])
+            image = load_nifti_image(image_path[0])
             image = self.nii_transform(image)
 
         sample = {"image": image, "participant_id": subject, "session_id": session}
@@ -228,7 +229,8 @@ class QCDataset(Dataset):
         import torch
         from skimage import transform
 
-        sample = np.array(image.get_data())
+        # Voxel values keep their stored type, as with the former get_data
+        sample = np.array(np.asanyarray(image.dataobj))
 
         # normalize input
         _min = np.min(sample)
@@ -5,11 +5,12 @@ import os
 from os import path
 from pathlib import Path
 
-import nibabel as nib
 import numpy as np
 import pandas as pd
 from clinica.utils.inputs import RemoteFileStructure, fetch_file
 
+from clinicadl.utils.nifti import read_nifti
+
 
 def extract_metrics(caps_dir, output_dir, group_label):
     if not path.exists(output_dir):
@@ -36,8 +37,7 @@ def extract_metrics(caps_dir, output_dir, group_label):
         except IOError as err:
             raise IOError("Unable to download required eyes segmentation for QC:", err)
 
-    segmentation_nii = nib.load(segmentation_file)
-    segmentation_np = segmentation_nii.get_fdata()
+    segmentation_np = read_nifti(segmentation_file)
 
     # Get the GM template
     template_path = path.join(
@@ -47,8 +47,7 @@ def extract_metrics(caps_dir, output_dir, group_label):
         "t1",
         f"group-{group_label}_template.nii.gz",
     )
-    template_nii = nib.load(template_path)
-    template_np = template_nii.get_fdata()
+    template_np = read_nifti(template_path)
     template_np = np.sum(template_np, axis=3)
     template_segmentation_np = template_np * segmentation_np
 
@@ -85,8 +84,7 @@ def extract_metrics(caps_dir, output_dir, group_label):
 
             if path.exists(image_path):
                 # GM analysis
-                image_nii = nib.load(image_path)
-                image_np = image_nii.get_fdata()
+                image_np = read_nifti(image_path)
                 image_segmentation_np = image_np * segmentation_np
                 eyes_nmi_value = nmi(
                     occlusion1=template_segmentation_np,
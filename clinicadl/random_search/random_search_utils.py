@@ -108,8 +108,12 @@ def random_sampling(rs_options: Dict[str, Any]) -> Dict[str, Any]:
     options = dict()
     sampling_dict = {
         "accumulation_steps": "randint",
+        "amp": "fixed",
         "baseline": "choice",
+        "batch_augmentation": "fixed",
         "batch_size": "fixed",
+        "batched_networks": "fixed",
+        "cache_mode": "fixed",
         "caps_directory": "fixed",
         "channels_limit": "fixed",
         "compensation": "fixed",
@@ -118,32 +122,46 @@ def random_sampling(rs_options: Dict[str, Any]) -> Dict[str, Any]:
         "diagnoses": "fixed",
         "dropout": "uniform",
         "epochs": "fixed",
+        "evaluation_batch_size": "fixed",
         "evaluation_steps": "fixed",
         "gpu": "fixed",
+        "image_cache_size": "fixed",
         "label": "fixed",
         "learning_rate": "exponent",
         "normalize": "choice",
+        "normalization_scope": "fixed",
         "mode": "fixed",
         "multi_cohort": "fixed",
         "multi_network": "choice",
+        "multiprocessing_context": "fixed",
         "n_fcblocks": "randint",
         "n_splits": "fixed",
         "n_proc": "fixed",
         "network_task": "fixed",
         "network_normalization": "choice",
         "optimizer": "choice",
+        "parallel_splits": "fixed",
         "patience": "fixed",
+        "persistent_workers": "fixed",
+        "pin_memory": "fixed",
+        "prefetch_factor": "fixed",
         "preprocessing_dict": "fixed",
+        "resolution_level": "choice",
         "sampler": "choice",
+        "sampler_window": "fixed",
         "seed": "fixed",
         "selection_metrics": "fixed",
+        "shared_cache_size": "fixed",
         "split": "fixed",
         "tolerance": "fixed",
+        "train_metrics": "fixed",
+        "train_metrics_fraction": "fixed",
         "transfer_path": "choice",
         "transfer_selection_metric": "choice",
         "tsv_path": "fixed",
         "wd_bool": "choice",
         "weight_decay": "exponent",
+        "world_size": "fixed",
     }
 
     for name, sampling_type in sampling_dict.items():
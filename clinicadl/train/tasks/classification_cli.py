@@ -14,9 +14,17 @@ from .task_utils import task_launcher
 @train_option.config_file
 # Computational
 @train_option.gpu
+@train_option.amp
+@train_option.world_size
+@train_option.parallel_splits
 @train_option.n_proc
 @train_option.batch_size
 @train_option.evaluation_steps
+@train_option.train_metrics
+@train_option.train_metrics_fraction
+@train_option.image_cache_size
+@train_option.cache_mode
+@train_option.shared_cache_size
 # Reproducibility
 @train_option.seed
 @train_option.deterministic
@@ -24,13 +32,24 @@ from .task_utils import task_launcher
 # Model
 @train_option.architecture
 @train_option.multi_network
+@train_option.batched_networks
 # Data
 @train_option.multi_cohort
 @train_option.diagnoses
 @train_option.baseline
 @train_option.normalize
+@train_option.normalization_scope
+@train_option.resolution_level
 @train_option.data_augmentation
+@train_option.batch_augmentation
 @train_option.sampler
+@train_option.sampler_window
+# Data pipeline
+@train_option.pin_memory
+@train_option.persistent_workers
+@train_option.prefetch_factor
+@train_option.evaluation_batch_size
+@train_option.multiprocessing_context
 # Cross validation
 @train_option.n_splits
 @train_option.split
@@ -33,28 +33,46 @@ def task_launcher(network_task: str, task_options_list: List[str], **kwargs):
     # Change value in train dict depending on user provided options
     standard_options_list = [
         "accumulation_steps",
+        "amp",
         "architecture",
         "baseline",
+        "batch_augmentation",
         "batch_size",
+        "batched_networks",
+        "cache_mode",
         "data_augmentation",
         "deterministic",
         "diagnoses",
         "dropout",
         "epochs",
+        "evaluation_batch_size",
         "evaluation_steps",
         "gpu",
+        "image_cache_size",
         "learning_rate",
         "multi_cohort",
         "multi_network",
+        "multiprocessing_context",
         "n_proc",
         "n_splits",
+        "normalization_scope",
         "normalize",
         "optimizer",
+        "parallel_splits",
         "patience",
+        "persistent_workers",
+        "pin_memory",
+        "prefetch_factor",
+        "resolution_level",
+        "shared_cache_size",
         "tolerance",
+        "train_metrics",
+        "train_metrics_fraction",
         "transfer_selection_metric",
         "weight_decay",
+        "world_size",
         "sampler",
+        "sampler_window",
         "seed",
         "split",
         "compensation",
@@ -23,6 +23,27 @@ gpu = cli_param.option_group.computational_group.option(
     default=None,
     help="Use GPU by default. Please specify `--no-gpu` to force using CPU.",
 )
+amp = cli_param.option_group.computational_group.option(
+    "--amp/--no-amp",
+    type=bool,
+    default=None,
+    help="Enables automatic mixed precision during training and inference: "
+    "bfloat16 on CPU, float16 with loss scaling on GPU.",
+)
+world_size = cli_param.option_group.computational_group.option(
+    "--world_size",
+    type=click.IntRange(min=1),
+    # default=1,
+    help="Number of data-parallel processes training the model on this machine "
+    "(DistributedDataParallel on the gloo backend). The batch size is the one of each process.",
+)
+parallel_splits = cli_param.option_group.computational_group.option(
+    "--parallel_splits",
+    type=click.IntRange(min=1),
+    # default=1,
+    help="Number of splits trained at the same time, each one in its own process. "
+    "The CPU threads and the DataLoader workers (n_proc) are shared between the splits.",
+)
 n_proc = cli_param.option_group.computational_group.option(
     "-np",
     "--n_proc",
@@ -44,6 +65,40 @@ evaluation_steps = cli_param.option_group.computational_group.option(
     help="Fix the number of iterations to perform before computing an evaluation. Default will only "
     "perform one evaluation at the end of each epoch.",
 )
+train_metrics = cli_param.option_group.computational_group.option(
+    "--train_metrics",
+    type=click.Choice(["full", "running", "subset"]),
+    # default="full",
+    help="Computation of the metrics on the training set logged during training: "
+    "evaluation of the whole training set (full), of a fixed random subset of it (subset), "
+    "or accumulation of the results of the training forward passes of the epoch (running).",
+)
+train_metrics_fraction = cli_param.option_group.computational_group.option(
+    "--train_metrics_fraction",
+    type=float,
+    # default=0.1,
+    help="Fraction of the training set evaluated when train_metrics is subset.",
+)
+image_cache_size = cli_param.option_group.computational_group.option(
+    "--image_cache_size",
+    type=float,
+    # default=0,
+    help="Size (in MB) of the cache of decoded images of each DataLoader worker. "
+    "Only used in patch, roi and slice modes when elements are extracted on-the-fly.",
+)
+cache_mode = cli_param.option_group.computational_group.option(
+    "--cache_mode",
+    type=click.Choice(["none", "shared"]),
+    # default="none",
+    help="If 'shared', tensors are loaded once in shared memory before the DataLoader "
+    "workers are started, instead of being read from disk by each worker.",
+)
+shared_cache_size = cli_param.option_group.computational_group.option(
+    "--shared_cache_size",
+    type=float,
+    # default=1024,
+    help="Memory budget (in MB) of the shared cache. Tensors that do not fit are read from disk.",
+)
 # Reproducibility
 seed = cli_param.option_group.reproducibility_group.option(
     "--seed",
@@ -79,6 +134,13 @@ multi_network = cli_param.option_group.model_group.option(
     default=None,
     help="If provided uses a multi-network framework.",
 )
+batched_networks = cli_param.option_group.model_group.option(
+    "--batched_networks/--sequential_networks",
+    type=bool,
+    default=None,
+    help="""If provided, the networks of the multi-network framework are trained together,
+    reading each image once per epoch, instead of one after the other.""",
+)
 # Task
 label = cli_param.option_group.task_group.option(
     "--label",
@@ -161,6 +223,20 @@ normalize = cli_param.option_group.data_group.option(
     default=None,
     help="Disable default MinMaxNormalization.",
 )
+normalization_scope = cli_param.option_group.data_group.option(
+    "--normalization_scope",
+    type=click.Choice(["element", "image"]),
+    # default="element",
+    help="Range used by the min-max normalization of patches, slices and regions: "
+    "their own range (element) or the range of their whole image (image).",
+)
+resolution_level = cli_param.option_group.data_group.option(
+    "--resolution_level",
+    type=click.IntRange(min=0),
+    # default=0,
+    help="Level of the resolution pyramid written by extract used as input, "
+    "each level halving the resolution of the images. 0 uses the original images.",
+)
 data_augmentation = cli_param.option_group.data_group.option(
     "--data_augmentation",
     "-da",
@@ -169,13 +245,57 @@ data_augmentation = cli_param.option_group.data_group.option(
     multiple=True,
     help="Randomly applies transforms on the training set.",
 )
+batch_augmentation = cli_param.option_group.data_group.option(
+    "--batch_augmentation/--sample_augmentation",
+    type=bool,
+    default=None,
+    help="Applies data augmentation on the collated batches, on the device of the model, "
+    "instead of on each sample in the DataLoader workers.",
+)
 sampler = cli_param.option_group.data_group.option(
     "--sampler",
     "-s",
-    type=click.Choice(["random", "weighted"]),
+    type=click.Choice(["random", "weighted", "grouped"]),
     # default="random",
     help="Sampler used to load the training data set.",
 )
+sampler_window = cli_param.option_group.data_group.option(
+    "--sampler_window",
+    type=int,
+    # default=1,
+    help="Number of images whose elements are shuffled together by the grouped sampler.",
+)
+# Data pipeline
+pin_memory = cli_param.option_group.data_pipeline_group.option(
+    "--pin_memory/--no_pin_memory",
+    type=bool,
+    default=None,
+    help="Loads batches in pinned memory to speed up their copy to the GPU.",
+)
+persistent_workers = cli_param.option_group.data_pipeline_group.option(
+    "--persistent_workers/--no_persistent_workers",
+    type=bool,
+    default=None,
+    help="Keeps the DataLoader workers alive between two iterations over a data set.",
+)
+prefetch_factor = cli_param.option_group.data_pipeline_group.option(
+    "--prefetch_factor",
+    type=int,
+    # default=2,
+    help="Number of batches loaded in advance by each DataLoader worker.",
+)
+evaluation_batch_size = cli_param.option_group.data_pipeline_group.option(
+    "--evaluation_batch_size",
+    type=int,
+    # default=0,
+    help="Size of the batches used for evaluation. Default uses the value of batch_size.",
+)
+multiprocessing_context = cli_param.option_group.data_pipeline_group.option(
+    "--multiprocessing_context",
+    type=click.Choice(["default", "fork", "spawn", "forkserver"]),
+    # default="default",
+    help="Method used to start the DataLoader workers.",
+)
 # Cross validation
 n_splits = cli_param.option_group.cross_validation.option(
     "--n_splits",
@@ -0,0 +1,255 @@
+# coding: utf8
+
+"""
+Persistent index of the files of a CAPS directory.
+
+`clinica_file_reader` performs a recursive glob in the session folder each time
+it is called. The index resolves the same (participant, session, file_type)
+queries once, stores the result in `<caps_directory>/tensor_extraction/caps_index`
+and only scans again the sessions whose directories were modified since.
+Sessions are validated again each time a list of sessions is read, so that files
+added in the meantime, by the current or another process, are found.
+"""
+
+import hashlib
+import json
+import os
+from fnmatch import fnmatch
+from logging import getLogger
+from os import path
+from typing import Dict, List, Sequence, Tuple
+
+from clinica.utils.exceptions import ClinicaCAPSError
+
+logger = getLogger("clinicadl.caps_index")
+
+INDEX_VERSION = 1
+
+# Folders of deeplearning_prepare_data which only contain extracted elements
+# (patches, slices, regions) and never whole images.
+SKIPPED_FOLDERS = {"patch_based", "slice_based", "roi_based"}
+
+_caps_index_cache: Dict[Tuple[str, str], "CapsFileIndex"] = dict()
+
+
+class CapsFileIndex:
+    """
+    Index of the files matching one clinica file type in a CAPS directory.
+
+    Queries are pure dictionary lookups once the sessions were registered with `update`.
+    Each session entry stores the modification times of all the directories of the
+    session tree, so that stale entries can be detected without globbing: adding or
+    removing a file or a folder anywhere in the tree modifies one of them.
+    """
+
+    def __init__(self, caps_directory: str, file_type: Dict[str, str]):
+        """
+        Args:
+            caps_directory: path to the CAPS directory.
+            file_type: clinica file type (dictionary with at least "pattern" and "description" keys).
+        """
+        self.caps_directory = path.abspath(caps_directory)
+        self.pattern = file_type["pattern"]
+        self.description = file_type.get("description", self.pattern)
+        self.needed_pipeline = file_type.get("needed_pipeline")
+        self._pattern_parts = self.pattern.lower().strip("/").split("/")
+
+        digest = hashlib.sha1(self.pattern.encode("utf-8")).hexdigest()[:16]
+        self.index_path = path.join(
+            self.caps_directory, "tensor_extraction", "caps_index", f"{digest}.json"
+        )
+        self._sessions = self._read()
+        self._checked = set()
+
+    def update(
+        self, participants: Sequence[str], sessions: Sequence[str]
+    ) -> "CapsFileIndex":
+        """
+        Checks that the entries of the given sessions are up-to-date, scans the sessions
+        which are missing or outdated and saves the index if it was modified.
+        Sessions are checked at each call, even if they were already checked before.
+
+        Args:
+            participants: list of participant IDs.
+            sessions: list of session IDs (same length as participants).
+        Returns:
+            the index itself.
+        """
+        modified = False
+        for participant, session in zip(participants, sessions):
+            key = f"{participant}/{session}"
+            entry = self._sessions.get(key)
+            if entry is None or not self._is_valid(entry):
+                self._sessions[key] = self._scan(participant, session)
+                modified = True
+            self._checked.add(key)
+
+        if modified:
+            self._write()
+        return self
+
+    def find(self, participant: str, session: str) -> List[str]:
+        """
+        Gives the files of a session matching the pattern of the index.
+
+        Args:
+            participant: ID of the participant.
+            session: ID of the session.
+        Returns:
+            list of absolute paths (empty if no file matches).
+        """
+        key = f"{participant}/{session}"
+        if key not in self._checked:
+            self.update([participant], [session])
+        return [
+            path.join(self.caps_directory, filename)
+            for filename in self._sessions[key]["files"]
+        ]
+
+    def read_files(
+        self,
+        participants: Sequence[str],
+        sessions: Sequence[str],
+        raise_exception: bool = True,
+    ) -> List[str]:
+        """
+        Equivalent of clinica_file_reader based on the index.
+
+        Args:
+            participants: list of participant IDs.
+            sessions: list of session IDs (same length as participants).
+            raise_exception: if True an error is raised when a session does not have exactly one file.
+        Returns:
+            list of the files found, ordered as the input sessions.
+        Raises:
+            ClinicaCAPSError: if raise_exception is True and a session does not have exactly one file.
+        """
+        self.update(participants, sessions)
+
+        files, errors = list(), list()
+        for participant, session in zip(participants, sessions):
+            found = self.find(participant, session)
+            if len(found) == 1:
+                files.append(found[0])
+            elif len(found) == 0:
+                errors.append(f"\t* ({participant} | {session}): No file found\n")
+            else:
+                error = f"\t*  ({participant} | {session}): More than 1 file found:\n"
+                for found_file in found:
+                    error += f"\t\t{found_file}\n"
+                errors.append(error)
+
+        if len(errors) > 0 and raise_exception:
+            # Same message as clinica_file_reader
+            error_message = (
+                f"Clinica encountered {len(errors)} problem(s) while getting "
+                f"{self.description}:\n"
+            )
+            if self.needed_pipeline:
+                error_message += (
+                    "Please note that the following clinica pipeline(s) must have run "
+                    f"to obtain these files: {self.needed_pipeline}\n"
+                )
+            raise ClinicaCAPSError(error_message + "\n".join(errors))
+        return files
+
+    def _scan(self, participant: str, session: str) -> Dict[str, Dict]:
+        """Walks the session folder once to find the files matching the pattern."""
+        session_dir = path.join("subjects", participant, session)
+        session_path = path.join(self.caps_directory, session_dir)
+
+        if not path.isdir(session_path):
+            # Watch the closest existing parent to detect the creation of the session
+            for watched_dir in [path.join("subjects", participant), "subjects"]:
+                if path.isdir(path.join(self.caps_directory, watched_dir)):
+                    return {"files": [], "mtimes": self._get_mtimes([watched_dir])}
+            return {"files": [], "mtimes": {}}
+
+        files, visited_dirs = list(), list()
+        for root, dirnames, filenames in os.walk(session_path):
+            dirnames[:] = [
+                dirname for dirname in dirnames if dirname not in SKIPPED_FOLDERS
+            ]
+            relative_root = path.relpath(root, self.caps_directory)
+            visited_dirs.append(relative_root)
+            for filename in filenames:
+                relative_path = path.join(relative_root, filename)
+                if self._match(path.relpath(relative_path, session_dir)):
+                    files.append(relative_path)
+        files.sort()
+
+        # A matching file may be added anywhere in the tree, even when files were found
+        return {"files": files, "mtimes": self._get_mtimes(visited_dirs)}
+
+    def _match(self, relative_path: str) -> bool:
+        """Reproduces the case insensitive glob `<session>/**/<pattern>`."""
+        path_parts = relative_path.lower().split(os.sep)
+        if len(path_parts) < len(self._pattern_parts):
+            return False
+        return all(
+            fnmatch(path_part, pattern_part)
+            for path_part, pattern_part in zip(
+                path_parts[-len(self._pattern_parts) :], self._pattern_parts
+            )
+        )
+
+    def _get_mtimes(self, directories) -> Dict[str, int]:
+        return {
+            directory: os.stat(path.join(self.caps_directory, directory)).st_mtime_ns
+            for directory in directories
+        }
+
+    def _is_valid(self, entry: Dict[str, Dict]) -> bool:
+        try:
+            return entry["mtimes"] == self._get_mtimes(entry["mtimes"].keys())
+        except FileNotFoundError:
+            return False
+
+    def _read(self) -> Dict[str, Dict]:
+        if not path.isfile(self.index_path):
+            return dict()
+        try:
+            with open(self.index_path, "r") as f:
+                index_dict = json.load(f)
+        except (OSError, ValueError):
+            logger.warning(f"CAPS index at {self.index_path} is corrupted and ignored.")
+            return dict()
+        if (
+            index_dict.get("version") != INDEX_VERSION
+            or index_dict.get("pattern") != self.pattern
+        ):
+            return dict()
+        return index_dict["sessions"]
+
+    def _write(self):
+        """Writes the index atomically. Read-only CAPS are silently left untouched."""
+        index_dict = {
+            "version": INDEX_VERSION,
+            "pattern": self.pattern,
+            "sessions": self._sessions,
+        }
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(path.dirname(self.index_path), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(index_dict, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as error:
+            logger.debug(f"CAPS index could not be saved at {self.index_path}: {error}")
+
+
+def get_caps_index(caps_directory: str, file_type: Dict[str, str]) -> CapsFileIndex:
+    """
+    Returns the index of a CAPS directory for a file type.
+    Indices are shared by all the objects of the current process.
+
+    Args:
+        caps_directory: path to the CAPS directory.
+        file_type: clinica file type (dictionary with at least a "pattern" key).
+    Returns:
+        the corresponding index.
+    """
+    key = (path.abspath(caps_directory), file_type["pattern"])
+    if key not in _caps_index_cache:
+        _caps_index_cache[key] = CapsFileIndex(caps_directory, file_type)
+    return _caps_index_cache[key]
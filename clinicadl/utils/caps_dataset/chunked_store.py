@@ -0,0 +1,291 @@
+# coding: utf8
+
+"""
+Compressed storage of the tensors extracted by prepare_data.
+
+All the tensors extracted from one image form a chunk, which is compressed on its own
+and appended to a single data file. A TSV index gives the location of the chunk of
+each image and the offset, the shape and the quantization parameters of each tensor
+in its chunk, so that any tensor is read by decompressing a single chunk.
+
+Before compression, the bytes of the values are shuffled (all the first bytes, then
+all the second bytes, ...), which groups the exponents and the signs of float values
+and makes them much more compressible.
+"""
+
+import os
+import shutil
+import zlib
+from collections import OrderedDict
+from logging import getLogger
+from os import path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+
+from clinicadl.utils.caps_dataset.memmap_store import INDEX_FILENAME
+from clinicadl.utils.caps_dataset.quantization import (
+    check_tensor_dtype,
+    decode_tensor,
+    encode_tensor,
+    from_numpy,
+    get_numpy_dtype,
+    to_numpy,
+)
+from clinicadl.utils.exceptions import ClinicaDLArgumentError
+
+logger = getLogger("clinicadl.chunked_store")
+
+DATA_FILENAME = "chunks.bin"
+COMPRESSION_LEVEL = 1
+
+
+def shuffle_bytes(array: np.ndarray) -> bytes:
+    """Groups the bytes of the values of array by significance."""
+    byte_array = np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+    return byte_array.reshape(-1, array.itemsize).T.tobytes()
+
+
+def unshuffle_bytes(buffer: bytes, dtype: np.dtype) -> np.ndarray:
+    """Inverse of shuffle_bytes. Returns a flat array of type dtype."""
+    byte_array = np.frombuffer(buffer, dtype=np.uint8).reshape(dtype.itemsize, -1)
+    return byte_array.T.copy(order="C").view(dtype).reshape(-1)
+
+
+class ChunkedStore:
+    """
+    Read access to the tensors of a compressed store.
+
+    The data file is opened lazily so that each DataLoader worker has its own file handle.
+    The last decompressed chunks are kept in memory, as consecutive elements of a dataset
+    often come from the same image.
+    """
+
+    def __init__(self, store_dir: str, n_cached_chunks: int = 2):
+        """
+        Args:
+            store_dir: path to the folder of the store.
+            n_cached_chunks: number of decompressed chunks kept in memory.
+        Raises:
+            FileNotFoundError: if the store does not exist.
+        """
+        self.store_dir = store_dir
+        self.data_path = path.join(store_dir, DATA_FILENAME)
+        index_path = path.join(store_dir, INDEX_FILENAME)
+        if not path.isfile(self.data_path) or not path.isfile(index_path):
+            raise FileNotFoundError(
+                f"No tensor store was found at {store_dir}. "
+                f"Please run prepare_data with the chunked format first."
+            )
+
+        index_df = pd.read_csv(index_path, sep="\t")
+        self.tensor_dtype = index_df.dtype.iloc[0]
+        shapes = [
+            tuple(int(dim) for dim in shape.split("x")) for shape in index_df["shape"]
+        ]
+        self._index: Dict[
+            Tuple[str, str, int], Tuple[int, Tuple[int, ...], float, float]
+        ] = dict(
+            zip(
+                zip(
+                    index_df.participant_id,
+                    index_df.session_id,
+                    index_df.elem_index.astype(int),
+                ),
+                zip(
+                    index_df.offset.astype(int),
+                    shapes,
+                    index_df.quant_scale.astype(float),
+                    index_df.quant_offset.astype(float),
+                ),
+            )
+        )
+        chunk_df = index_df.groupby(["participant_id", "session_id"]).first()
+        self._chunks: Dict[Tuple[str, str], Tuple[int, int]] = dict(
+            zip(
+                chunk_df.index,
+                zip(chunk_df.chunk_offset.astype(int), chunk_df.chunk_size.astype(int)),
+            )
+        )
+        self._n_elem = index_df.groupby(["participant_id", "session_id"]).size()
+        self.n_cached_chunks = n_cached_chunks
+        self._cached_chunks = OrderedDict()
+        self._file = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_file"] = None
+        state["_cached_chunks"] = OrderedDict()
+        return state
+
+    def _read_chunk(self, participant: str, session: str) -> np.ndarray:
+        """Returns the decompressed values of all the tensors of an image."""
+        key = (participant, session)
+        chunk = self._cached_chunks.get(key)
+        if chunk is not None:
+            self._cached_chunks.move_to_end(key)
+            return chunk
+
+        if self._file is None:
+            self._file = open(self.data_path, "rb")
+        chunk_offset, chunk_size = self._chunks[key]
+        self._file.seek(chunk_offset)
+        chunk = unshuffle_bytes(
+            zlib.decompress(self._file.read(chunk_size)),
+            get_numpy_dtype(self.tensor_dtype),
+        )
+
+        self._cached_chunks[key] = chunk
+        if len(self._cached_chunks) > self.n_cached_chunks:
+            self._cached_chunks.popitem(last=False)
+        return chunk
+
+    def get(self, participant: str, session: str, elem_index: int = 0) -> torch.Tensor:
+        """
+        Returns a tensor of the store.
+
+        Args:
+            participant: ID of the participant.
+            session: ID of the session.
+            elem_index: position of the element in the extraction order of the image
+                (0 for whole images).
+        Returns:
+            the float32 tensor. It does not share memory with the cached chunks.
+        Raises:
+            KeyError: if the element is not in the store.
+        """
+        key = (participant, session, elem_index)
+        if key not in self._index:
+            raise KeyError(
+                f"Element {elem_index} of ({participant} | {session}) "
+                f"was not found in the tensor store {self.store_dir}."
+            )
+        offset, shape, quant_scale, quant_offset = self._index[key]
+        chunk = self._read_chunk(participant, session)
+        array = chunk[offset : offset + int(np.prod(shape))].reshape(shape)
+        if self.tensor_dtype == "float32":
+            # Other types are decoded in a new tensor, which does not share the cached chunk
+            array = array.copy()
+        return decode_tensor(
+            from_numpy(array, self.tensor_dtype), quant_scale, quant_offset
+        )
+
+    def num_elem(self, participant: str, session: str) -> int:
+        """Gives the number of elements stored for an image."""
+        return int(self._n_elem.loc[(participant, session)])
+
+
+class ChunkedStoreWriter:
+    """
+    Appends the tensors of each image to a new compressed store, as one chunk per image.
+    The index is written when the writer is closed.
+    """
+
+    def __init__(self, store_dir: str, tensor_dtype: str = "float32"):
+        """
+        Args:
+            store_dir: path to the folder of the store.
+            tensor_dtype: storage dtype of the tensors (see quantization.TENSOR_DTYPES).
+        Raises:
+            ClinicaDLArgumentError: if a store already exists at this location.
+        """
+        if path.exists(store_dir):
+            raise ClinicaDLArgumentError(
+                f"A tensor store already exists at {store_dir}. "
+                f"Please choose another name for your preprocessing file."
+            )
+        check_tensor_dtype(tensor_dtype)
+        os.makedirs(store_dir)
+        self.store_dir = store_dir
+        self.tensor_dtype = tensor_dtype
+        self._file = open(path.join(store_dir, DATA_FILENAME), "wb")
+        self._chunk_offset = 0
+        self._uncompressed_size = 0
+        self._rows: List[List] = list()
+
+    def __enter__(self) -> "ChunkedStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # A partial store would prevent extracting again with the same name
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def write(self, participant: str, session: str, tensors: Sequence[torch.Tensor]):
+        """
+        Compresses all the tensors extracted from one image in a new chunk.
+
+        Args:
+            participant: ID of the participant.
+            session: ID of the session.
+            tensors: tensors extracted from the image, in extraction order.
+        """
+        arrays = list()
+        rows = list()
+        offset = 0
+        for elem_index, tensor in enumerate(tensors):
+            encoded_tensor, quant_scale, quant_offset = encode_tensor(
+                tensor, self.tensor_dtype
+            )
+            array = to_numpy(encoded_tensor).reshape(-1)
+            arrays.append(array)
+            rows.append(
+                [
+                    participant,
+                    session,
+                    elem_index,
+                    offset,
+                    "x".join(str(dim) for dim in encoded_tensor.shape),
+                    quant_scale,
+                    quant_offset,
+                    self.tensor_dtype,
+                ]
+            )
+            offset += array.size
+
+        chunk = np.concatenate(arrays)
+        compressed_chunk = zlib.compress(shuffle_bytes(chunk), COMPRESSION_LEVEL)
+        self._file.write(compressed_chunk)
+        for row in rows:
+            row += [self._chunk_offset, len(compressed_chunk)]
+        self._rows += rows
+        self._chunk_offset += len(compressed_chunk)
+        self._uncompressed_size += chunk.nbytes
+
+    def abort(self):
+        """Closes the data file and removes the store, without writing the index."""
+        self._file.close()
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+
+    def close(self):
+        """Closes the data file and writes the index."""
+        if self._file.closed:
+            return
+        self._file.close()
+        index_df = pd.DataFrame(
+            self._rows,
+            columns=[
+                "participant_id",
+                "session_id",
+                "elem_index",
+                "offset",
+                "shape",
+                "quant_scale",
+                "quant_offset",
+                "dtype",
+                "chunk_offset",
+                "chunk_size",
+            ],
+        )
+        index_df.to_csv(
+            path.join(self.store_dir, INDEX_FILENAME), sep="\t", index=False
+        )
+        if self._chunk_offset > 0:
+            logger.debug(
+                f"{len(index_df)} tensors saved in {self.store_dir} "
+                f"(compression ratio {self._uncompressed_size / self._chunk_offset:.2f})."
+            )
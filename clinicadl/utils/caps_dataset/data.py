@@ -1,6 +1,10 @@
 # coding: utf8
 
 import abc
+import multiprocessing as mp
+from collections import OrderedDict
+from copy import copy
+from functools import lru_cache
 from logging import getLogger
 from os import path
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
@@ -9,22 +13,45 @@ import numpy as np
 import pandas as pd
 import torch
 import torchvision.transforms as transforms
-from clinica.utils.exceptions import ClinicaCAPSError
 from torch.utils.data import Dataset
 
 from clinicadl.prepare_data.prepare_data_utils import (
     PATTERN_DICT,
     TEMPLATE_DICT,
+    RoiMask,
     compute_discarded_slices,
     compute_folder_and_file_type,
     extract_patch_path,
     extract_patch_tensor,
     extract_roi_path,
-    extract_roi_tensor,
     extract_slice_path,
     extract_slice_tensor,
     find_mask_path,
+    get_patch_grid,
 )
+from clinicadl.utils.caps_dataset.caps_index import get_caps_index
+from clinicadl.utils.caps_dataset.chunked_store import ChunkedStore
+from clinicadl.utils.caps_dataset.foreground import (
+    ForegroundIndex,
+    crop_to_bounding_box,
+    get_foreground_index_path,
+)
+from clinicadl.utils.caps_dataset.image_statistics import (
+    NORMALIZATION_SCOPES,
+    ImageStatistics,
+    ImageStatisticsIndex,
+    get_statistics_index_path,
+    normalize_tensor,
+)
+from clinicadl.utils.caps_dataset.memmap_store import MemmapStore, get_store_dir
+from clinicadl.utils.caps_dataset.pyramid import (
+    compute_pyramid,
+    get_level_path,
+    get_level_shape,
+    scale_bounding_box,
+)
+from clinicadl.utils.caps_dataset.quantization import load_tensor
+from clinicadl.utils.caps_dataset.shared_cache import SharedTensorCache
 from clinicadl.utils.exceptions import (
     ClinicaDLArgumentError,
     ClinicaDLConfigurationError,
@@ -34,6 +61,167 @@ from clinicadl.utils.exceptions import (
 logger = getLogger("clinicadl.datasets")
 
 
+#################################
+# Image cache
+#################################
+class ImageCache:
+    """
+    Least-recently-used cache of decoded images, bounded by the memory they occupy.
+
+    Each DataLoader worker owns a copy of the dataset, hence its own cache. Hits and
+    misses are counted in shared memory so that the main process can report the
+    hit rate of all the workers.
+    """
+
+    def __init__(self, max_size: float):
+        """
+        Args:
+            max_size: maximum memory occupied by the cached images (in MB).
+        """
+        self.max_size = int(max_size * 2**20)
+        self.size = 0
+        self._images = OrderedDict()
+        self._counts = mp.Array("q", 2)  # hits, misses
+
+    def get(self, image_path: str) -> torch.Tensor:
+        """
+        Returns the image stored at image_path, loads it if it is not in the cache.
+
+        Args:
+            image_path: path to the tensor image (*.pt).
+        Returns:
+            the image tensor. It is shared with the cache and must not be modified in-place.
+        """
+        image = self._images.get(image_path)
+        hit = image is not None
+        with self._counts.get_lock():
+            self._counts[0 if hit else 1] += 1
+
+        if hit:
+            self._images.move_to_end(image_path)
+            return image
+
+        image = load_tensor(image_path)
+        image_size = image.element_size() * image.nelement()
+        if image_size <= self.max_size:
+            while self.size + image_size > self.max_size:
+                _, removed_image = self._images.popitem(last=False)
+                self.size -= removed_image.element_size() * removed_image.nelement()
+            self._images[image_path] = image
+            self.size += image_size
+        return image
+
+    def reset_stats(self):
+        """Sets the counters of hits and misses to 0."""
+        with self._counts.get_lock():
+            self._counts[0] = 0
+            self._counts[1] = 0
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        """Ratio of requests served by the caches of all the workers since the last reset."""
+        hits, misses = self._counts[:]
+        if hits + misses == 0:
+            return None
+        return hits / (hits + misses)
+
+
+#################################
+# Meta-data
+#################################
+class CapsMetadata:
+    """
+    Meta-data of the images of a CapsDataset stored as compact numpy columns.
+
+    Participants, sessions and cohorts are stored as integer codes of categories and labels
+    are encoded once, so that getting the meta-data of a sample is an array index instead
+    of pandas lookups.
+    """
+
+    __slots__ = (
+        "participants",
+        "participant_codes",
+        "sessions",
+        "session_codes",
+        "cohorts",
+        "cohort_codes",
+        "labels",
+    )
+
+    def __init__(
+        self,
+        data_df: pd.DataFrame,
+        label: str = None,
+        label_fn: Callable[[Any], Any] = None,
+    ):
+        """
+        Args:
+            data_df: DataFrame with participant_id, session_id and cohort columns.
+            label: Name of the column in data_df containing the label.
+                If None no label is stored.
+            label_fn: function giving the value used in criterion from the value of the label.
+        """
+        self.participant_codes, self.participants = self._factorize(
+            data_df.participant_id
+        )
+        self.session_codes, self.sessions = self._factorize(data_df.session_id)
+        self.cohort_codes, self.cohorts = self._factorize(data_df.cohort)
+        if label is None:
+            self.labels = None
+        else:
+            self.labels = np.array([label_fn(target) for target in data_df[label]])
+
+    def __len__(self) -> int:
+        return len(self.participant_codes)
+
+    @staticmethod
+    def _factorize(column: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+        """Gives the codes of the values of the column and the array of categories."""
+        codes, categories = pd.factorize(column.values)
+        return codes.astype(np.int32), np.asarray(categories, dtype=object)
+
+    def get(self, image_idx: int) -> Tuple[str, str, str, Any]:
+        """
+        Args:
+            image_idx: position of the image in the DataFrame.
+        Returns:
+            participant, session, cohort and label of the image (-1 if there is no label).
+        """
+        return (
+            self.participants[self.participant_codes[image_idx]],
+            self.sessions[self.session_codes[image_idx]],
+            self.cohorts[self.cohort_codes[image_idx]],
+            self._decode_label(image_idx),
+        )
+
+    def get_batch(
+        self, image_indices: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Any]]:
+        """
+        Args:
+            image_indices: positions of the images in the DataFrame.
+        Returns:
+            participants, sessions, cohorts and labels of the images (-1 if there is no label).
+        """
+        labels = [self._decode_label(image_idx) for image_idx in image_indices]
+        return (
+            self.participants[self.participant_codes[image_indices]],
+            self.sessions[self.session_codes[image_indices]],
+            self.cohorts[self.cohort_codes[image_indices]],
+            labels,
+        )
+
+    def _decode_label(self, image_idx: int) -> Any:
+        """Gives the label of an image in the type returned by CapsDataset.label_fn."""
+        if self.labels is None:
+            return -1
+        label = self.labels[image_idx]
+        # Classification labels are scalars, regression labels are arrays of size 1
+        if self.labels.ndim == 1:
+            return label.item()
+        return label
+
+
 #################################
 # Datasets loaders
 #################################
@@ -51,9 +239,16 @@ class CapsDataset(Dataset):
         label_code: Dict[Any, int] = None,
         augmentation_transformations: Optional[Callable] = None,
         multi_cohort: bool = False,
+        image_cache_size: float = 0,
     ):
         self.caps_directory = caps_directory
         self.caps_dict = self.create_caps_dict(caps_directory, multi_cohort)
+        self.resolution_level = preprocessing_dict.get("resolution_level", 0)
+        self._check_resolution_level(preprocessing_dict)
+        if isinstance(transformations, Normalization):
+            transformations = transformations.configure(
+                preprocessing_dict.get("prenormalize"), self._elements_are_images()
+            )
         self.transformations = transformations
         self.augmentation_transformations = augmentation_transformations
         self.eval_mode = False
@@ -61,6 +256,10 @@ class CapsDataset(Dataset):
         self.label = label
         self.label_code = label_code
         self.preprocessing_dict = preprocessing_dict
+        self.image_cache = (
+            ImageCache(image_cache_size) if image_cache_size > 0 else None
+        )
+        self.shared_cache = None
 
         if not hasattr(self, "elem_index"):
             raise AttributeError(
@@ -80,9 +279,39 @@ class CapsDataset(Dataset):
                 f"the data file is not in the correct format."
                 f"Columns should include {mandatory_col}"
             )
+        self.metadata = CapsMetadata(
+            self.df,
+            self.label if self.label_presence else None,
+            self.label_fn,
+        )
+        self.image_statistics = self._load_image_statistics()
 
+        self.tensor_format = preprocessing_dict.get("tensor_format", "pt")
+        if self.tensor_format in ["memmap", "chunked"]:
+            store_class = (
+                MemmapStore if self.tensor_format == "memmap" else ChunkedStore
+            )
+            self.tensor_stores = {
+                cohort: store_class(
+                    get_store_dir(
+                        caps_path,
+                        preprocessing_dict["extract_json"],
+                        self.tensor_format,
+                    )
+                )
+                for cohort, caps_path in self.caps_dict.items()
+            }
+            self.image_paths = dict()
+        else:
+            self.tensor_stores = None
+            self.image_paths = self._compute_image_paths()
         self.elem_per_image = self.num_elem_per_image()
-        self.size = self[0]["image"].size()
+        self.elem_table = self._compute_elem_table()
+        elem_shape = self._get_elem_shape()
+        if elem_shape is None:
+            self.size = self[0]["image"].size()
+        else:
+            self.size = torch.Size(elem_shape)
 
     @property
     @abc.abstractmethod
@@ -108,14 +337,114 @@ class CapsDataset(Dataset):
         else:
             return self.label_code[str(target)]
 
+    def _elements_are_images(self) -> bool:
+        """Tells if the elements of the dataset are the whole images written by prepare_data."""
+        return False
+
+    def _check_resolution_level(self, preprocessing_dict: Dict[str, Any]):
+        """
+        Checks that the level of the resolution pyramid read by the dataset was extracted.
+
+        Args:
+            preprocessing_dict: preprocessing dict contained in the JSON file of extract.
+        Raises:
+            ClinicaDLConfigurationError: if the level cannot be read.
+        """
+        pyramid_levels = preprocessing_dict.get("pyramid_levels", 0)
+        if not 0 <= self.resolution_level <= pyramid_levels:
+            raise ClinicaDLConfigurationError(
+                f"Resolution level {self.resolution_level} cannot be used, as prepare_data "
+                f"wrote {pyramid_levels} level(s) of resolution pyramid after the images. "
+                f"Please run the extraction again with a larger pyramid_levels."
+            )
+
+    def _load_image_statistics(self) -> Optional[Dict[str, ImageStatisticsIndex]]:
+        """
+        Loads the statistics of the images recorded by prepare_data, used by the Normalization
+        transform. Images extracted by former versions have no statistics.
+
+        Returns:
+            the statistics index of each cohort, or None if they are not used.
+        Raises:
+            ClinicaDLConfigurationError: if the normalization needs statistics which were not recorded.
+        """
+        extract_json = self.preprocessing_dict.get("extract_json")
+        if not isinstance(self.transformations, Normalization) or extract_json is None:
+            return None
+
+        image_statistics = {
+            cohort: ImageStatisticsIndex(
+                get_statistics_index_path(caps_path, extract_json)
+            )
+            for cohort, caps_path in self.caps_dict.items()
+        }
+        if self.transformations.needs_statistics:
+            for participant, session, cohort in zip(
+                self.df.participant_id, self.df.session_id, self.df.cohort
+            ):
+                if (participant, session) not in image_statistics[cohort]:
+                    raise ClinicaDLConfigurationError(
+                        f"The normalization of the {self.mode}s with the statistics of their image "
+                        f"needs the statistics computed by prepare_data, which were not found for "
+                        f"({participant} | {session}). Please run the extraction again."
+                    )
+        return image_statistics
+
+    def _transform(
+        self, tensor: torch.Tensor, participant: str, session: str, cohort: str
+    ) -> torch.Tensor:
+        """
+        Applies the transformations performed in training and evaluation modes.
+
+        Args:
+            tensor: tensor of the element.
+            participant: ID of the participant.
+            session: ID of the session.
+            cohort: Name of the cohort.
+        Returns:
+            the transformed tensor.
+        """
+        if isinstance(self.transformations, Normalization):
+            statistics = None
+            if self.image_statistics is not None:
+                statistics = self.image_statistics[cohort].get(participant, session)
+            return self.transformations(tensor, statistics)
+        elif self.transformations:
+            return self.transformations(tensor)
+        return tensor
+
     def __len__(self) -> int:
-        return len(self.df) * self.elem_per_image
+        if self.elem_table is not None:
+            return len(self.elem_table[0])
+        return len(self.metadata) * self.elem_per_image
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Samples are built from self.metadata only. The DataFrame, read by the samplers
+        # and the task managers in the main process, is not copied to the DataLoader
+        # workers when they are started with spawn or forkserver.
+        state = self.__dict__.copy()
+        state["df"] = None
+        return state
+
+    def _compute_elem_table(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Lists the elements of the dataset when images do not all have the same elements.
+
+        Returns:
+            the position of the image in self.df and the index of the element of each sample,
+            sorted by image. None if all the images have elem_per_image elements.
+        """
+        return None
+
+    def num_elem_of_images(self) -> np.ndarray:
+        """Gives the number of elements of each image of self.df in the dataset."""
+        if self.elem_table is not None:
+            return np.bincount(self.elem_table[0], minlength=len(self.df))
+        return np.full(len(self.df), self.elem_per_image)
 
     @staticmethod
     def create_caps_dict(caps_directory: str, multi_cohort: bool) -> Dict[str, str]:
 
-        from clinica.utils.inputs import check_caps_folder
-
         if multi_cohort:
             if not caps_directory.endswith(".tsv"):
                 raise ClinicaDLArgumentError(
@@ -128,15 +457,77 @@ class CapsDataset(Dataset):
                 for idx in range(len(caps_df)):
                     cohort = caps_df.loc[idx, "cohort"]
                     caps_path = caps_df.loc[idx, "path"]
-                    check_caps_folder(caps_path)
+                    _check_caps_folder(caps_path)
                     caps_dict[cohort] = caps_path
         else:
-            check_caps_folder(caps_directory)
+            _check_caps_folder(caps_directory)
             caps_dict = {"single": caps_directory}
 
         return caps_dict
 
-    def _get_image_path(self, participant: str, session: str, cohort: str) -> str:
+    def _compute_image_paths(self) -> Dict[Tuple[str, str, str], str]:
+        """
+        Resolves once the paths to the tensor images (*.pt) of all the sessions of self.df
+        with the CAPS index, so that no file system query is done when loading samples.
+
+        Returns:
+            dictionary linking (participant, session, cohort) to the path of the tensor image.
+        """
+        file_type = self.preprocessing_dict["file_type"]
+        folder = None
+
+        image_paths = dict()
+        for cohort, cohort_df in self.df.groupby("cohort"):
+            participants = cohort_df.participant_id.values
+            sessions = cohort_df.session_id.values
+            nifti_index = get_caps_index(self.caps_dict[cohort], file_type).update(
+                participants, sessions
+            )
+            missing_sessions = list()
+            for participant, session in zip(participants, sessions):
+                # Try to find .nii.gz file
+                nifti_paths = nifti_index.find(participant, session)
+                if len(nifti_paths) == 1:
+                    if folder is None:
+                        folder, _ = compute_folder_and_file_type(
+                            self.preprocessing_dict
+                        )
+                    image_filename = path.basename(nifti_paths[0]).replace(
+                        ".nii.gz", ".pt"
+                    )
+                    image_paths[(participant, session, cohort)] = path.join(
+                        self.caps_dict[cohort],
+                        "subjects",
+                        participant,
+                        session,
+                        "deeplearning_prepare_data",
+                        "image_based",
+                        folder,
+                        image_filename,
+                    )
+                else:
+                    missing_sessions.append((participant, session))
+
+            # Try to find .pt file
+            if len(missing_sessions) > 0:
+                missing_participants, missing_sessions = zip(*missing_sessions)
+                tensor_index = get_caps_index(
+                    self.caps_dict[cohort], self._get_tensor_file_type()
+                ).update(missing_participants, missing_sessions)
+                for participant, session in zip(missing_participants, missing_sessions):
+                    tensor_paths = tensor_index.find(participant, session)
+                    if len(tensor_paths) == 1:
+                        image_paths[(participant, session, cohort)] = tensor_paths[0]
+
+        return image_paths
+
+    def _get_image_path(
+        self,
+        participant: str,
+        session: str,
+        cohort: str,
+        resolution_level: Optional[int] = None,
+    ) -> str:
         """
         Gets the path to the tensor image (*.pt)
 
@@ -144,39 +535,149 @@ class CapsDataset(Dataset):
             participant: ID of the participant.
             session: ID of the session.
             cohort: Name of the cohort.
+            resolution_level: level of the resolution pyramid. If None the level of the
+                dataset is used.
         Returns:
             image_path: path to the tensor containing the whole image.
+        Raises:
+            ClinicaCAPSError: if the image cannot be found in the CAPS.
         """
-        from clinica.utils.inputs import clinica_file_reader
+        if (participant, session, cohort) not in self.image_paths:
+            # Raises the error explaining why the image was not found
+            get_caps_index(
+                self.caps_dict[cohort], self._get_tensor_file_type()
+            ).read_files([participant], [session])
+
+        if resolution_level is None:
+            resolution_level = self.resolution_level
+        return get_level_path(
+            self.image_paths[(participant, session, cohort)], resolution_level
+        )
 
-        # Try to find .nii.gz file
-        try:
-            file_type = self.preprocessing_dict["file_type"]
-            image_path_list, _ = clinica_file_reader(
-                [participant], [session], self.caps_dict[cohort], file_type
+    def _get_tensor_path(
+        self, participant: str, session: str, cohort: str, elem_idx: int
+    ) -> str:
+        """
+        Gets the path to the tensor file read to build an element.
+
+        Args:
+            participant: ID of the participant.
+            session: ID of the session.
+            cohort: Name of the cohort.
+            elem_idx: Index of the part of the image.
+        Returns:
+            path to the tensor (*.pt). It is the path to the whole image if elements are
+            extracted on-the-fly.
+        """
+        return self._get_image_path(participant, session, cohort)
+
+    def _load_tensor(self, tensor_path: str) -> torch.Tensor:
+        """
+        Loads a tensor, from the shared cache if it is stored there.
+
+        Args:
+            tensor_path: path to the tensor (*.pt).
+        Returns:
+            the tensor. It may be shared with the caches and must not be modified in-place.
+        """
+        if self.shared_cache is not None:
+            tensor = self.shared_cache.get(tensor_path)
+            if tensor is not None:
+                return tensor
+        return load_tensor(tensor_path)
+
+    def _load_image(self, image_path: str) -> torch.Tensor:
+        """
+        Loads a tensor image, from the shared cache or the image cache if they are enabled.
+
+        Args:
+            image_path: path to the tensor image (*.pt).
+        Returns:
+            the image tensor.
+        """
+        if self.image_cache is None or (
+            self.shared_cache is not None and image_path in self.shared_cache
+        ):
+            return self._load_tensor(image_path)
+        return self.image_cache.get(image_path)
+
+    def fill_shared_cache(self, shared_cache: SharedTensorCache):
+        """
+        Loads the tensors read by the dataset in shared memory, until the memory budget of
+        the cache is exhausted. The remaining tensors are still read from disk.
+
+        Must be called before the DataLoader workers are started, so that they all index into
+        the same memory instead of reading the tensors again.
+
+        Args:
+            shared_cache: cache in which tensors are stored. It can be shared by several datasets.
+        """
+        self.shared_cache = shared_cache
+        if self.tensor_stores is not None:
+            logger.info(
+                f"Tensors are stored in the {self.tensor_format} format, whose files are "
+                f"already shared between workers by the page cache. The shared cache is not used."
             )
-            image_filename = path.basename(image_path_list[0]).replace(".nii.gz", ".pt")
-            folder, _ = compute_folder_and_file_type(self.preprocessing_dict)
-            image_dir = path.join(
-                self.caps_dict[cohort],
-                "subjects",
-                participant,
-                session,
-                "deeplearning_prepare_data",
-                "image_based",
-                folder,
+            return
+
+        participants, sessions, cohorts, elem_indices, _ = self._get_meta_data_batch(
+            np.arange(len(self))
+        )
+        tensor_paths = OrderedDict()
+        for participant, session, cohort, elem_idx in zip(
+            participants, sessions, cohorts, elem_indices
+        ):
+            tensor_path = self._get_tensor_path(
+                participant, session, cohort, int(elem_idx)
             )
-            image_path = path.join(image_dir, image_filename)
-        # Try to find .pt file
-        except ClinicaCAPSError:
-            file_type = self.preprocessing_dict["file_type"]
-            file_type["pattern"] = file_type["pattern"].replace(".nii.gz", ".pt")
-            image_path_list, _ = clinica_file_reader(
-                [participant], [session], self.caps_dict[cohort], file_type
+            tensor_paths[tensor_path] = None
+
+        n_cached = 0
+        for tensor_path in tensor_paths:
+            if tensor_path not in shared_cache and not shared_cache.add(
+                tensor_path, load_tensor(tensor_path)
+            ):
+                break
+            n_cached += 1
+
+        logger.info(
+            f"{n_cached}/{len(tensor_paths)} tensors of the {self.mode} dataset are stored "
+            f"in shared memory ({shared_cache.size / 2 ** 20:.0f} MB used by the cache)."
+        )
+        if n_cached < len(tensor_paths):
+            logger.info(
+                "The memory budget of the shared cache is exhausted, "
+                "the other tensors will be read from disk."
+            )
+
+    def _get_image_source(
+        self, participant: str, session: str, cohort: str
+    ) -> Tuple[torch.Tensor, str]:
+        """
+        Gets the whole image and the location it was read from, in the .pt format or in a tensor store.
+
+        Args:
+            participant: ID of the participant.
+            session: ID of the session.
+            cohort: Name of the cohort.
+        Returns:
+            the image tensor and the path to the file containing it.
+        """
+        if self.tensor_stores is not None:
+            # Levels of the resolution pyramid are stored after the image
+            store = self.tensor_stores[cohort]
+            return (
+                store.get(participant, session, self.resolution_level),
+                store.data_path,
             )
-            image_path = image_path_list[0]
 
-        return image_path
+        image_path = self._get_image_path(participant, session, cohort)
+        return self._load_image(image_path), image_path
+
+    def _get_tensor_file_type(self) -> Dict[str, str]:
+        """Gives the file type of tensor images, used when NifTi images are not in the CAPS."""
+        file_type = self.preprocessing_dict["file_type"]
+        return {**file_type, "pattern": file_type["pattern"].replace(".nii.gz", ".pt")}
 
     def _get_meta_data(self, idx: int) -> Tuple[str, str, str, int, int]:
         """
@@ -191,22 +692,85 @@ class CapsDataset(Dataset):
             elem_index (int): Index of the part of the image.
             label (str or float or int): value of the label to be used in criterion.
         """
-        image_idx = idx // self.elem_per_image
-        participant = self.df.loc[image_idx, "participant_id"]
-        session = self.df.loc[image_idx, "session_id"]
-        cohort = self.df.loc[image_idx, "cohort"]
-        if self.elem_index is None:
-            elem_idx = idx % self.elem_per_image
+        if self.elem_table is not None:
+            image_idx = self.elem_table[0][idx]
+            elem_idx = int(self.elem_table[1][idx])
         else:
-            elem_idx = self.elem_index
+            image_idx = idx // self.elem_per_image
+            if self.elem_index is None:
+                elem_idx = idx % self.elem_per_image
+            else:
+                elem_idx = self.elem_index
+        participant, session, cohort, label = self.metadata.get(image_idx)
 
-        if self.label_presence and self.label is not None:
-            target = self.df.loc[image_idx, self.label]
-            label = self.label_fn(target)
+        return participant, session, cohort, elem_idx, label
+
+    def _get_meta_data_batch(
+        self, indices: List[int]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, List[Any]]:
+        """
+        Gets the meta data of several samples at once, see _get_meta_data.
+
+        Args:
+            indices: indices of the samples.
+        Returns:
+            participants, sessions, cohorts, element indices and labels of the samples.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if self.elem_table is not None:
+            image_indices = self.elem_table[0][indices]
+            elem_indices = self.elem_table[1][indices]
         else:
-            label = -1
+            image_indices = indices // self.elem_per_image
+            if self.elem_index is None:
+                elem_indices = indices % self.elem_per_image
+            else:
+                elem_indices = np.full(len(indices), self.elem_index)
+        participants, sessions, cohorts, labels = self.metadata.get_batch(image_indices)
 
-        return participant, session, cohort, elem_idx, label
+        return participants, sessions, cohorts, elem_indices, labels
+
+    def _get_recorded_shape(self) -> Optional[Tuple[int, ...]]:
+        """
+        Gives the shape of the tensors written by prepare_data, if it was recorded in the
+        preprocessing JSON (same shape for all the tensors of the extraction).
+        """
+        tensor_shape = self.preprocessing_dict.get("tensor_shape")
+        if tensor_shape is None:
+            return None
+        # Levels of the resolution pyramid are only written for whole images
+        return get_level_shape(tuple(tensor_shape), self.resolution_level)
+
+    def _get_image_shape(self) -> Tuple[int, ...]:
+        """
+        Gives the shape of the whole images, from the preprocessing JSON if the images were
+        extracted and their shape recorded, else from the first image.
+        """
+        image_shape = self._get_recorded_shape()
+        if image_shape is not None and (self.mode == "image" or not self.prepare_dl):
+            return image_shape
+        return tuple(self._get_full_image().shape)
+
+    def _get_elem_shape(self) -> Optional[Tuple[int, ...]]:
+        """
+        Gives the shape of the elements without loading any tensor, if the shapes of the
+        tensors were recorded by prepare_data.
+
+        Returns:
+            the shape of the elements, or None if it can only be known by loading an element.
+        """
+        tensor_shape = self._get_recorded_shape()
+        if tensor_shape is None or self.mode == "image" or self.prepare_dl:
+            return tensor_shape
+        return self._compute_elem_shape(tensor_shape)
+
+    def _compute_elem_shape(self, image_shape: Tuple[int, ...]) -> Tuple[int, ...]:
+        """Computes the shape of the elements extracted on-the-fly from an image shape."""
+        return image_shape
+
+    def _get_num_tensors(self) -> Optional[int]:
+        """Gives the number of tensors written per image by prepare_data, if it was recorded."""
+        return self.preprocessing_dict.get("num_tensors")
 
     def _get_full_image(self) -> torch.Tensor:
         """
@@ -216,34 +780,116 @@ class CapsDataset(Dataset):
         Returns:
             image tensor of the full image first image.
         """
-        import nibabel as nib
-        from clinica.utils.inputs import clinica_file_reader
+        from clinicadl.utils.nifti import read_nifti
 
-        participant_id = self.df.loc[0, "participant_id"]
-        session_id = self.df.loc[0, "session_id"]
-        cohort = self.df.loc[0, "cohort"]
+        participant_id, session_id, cohort, _ = self.metadata.get(0)
+
+        if self.tensor_stores is not None and (
+            self.mode == "image" or not self.prepare_dl
+        ):
+            return self.tensor_stores[cohort].get(
+                participant_id, session_id, self.resolution_level
+            )
 
         try:
             image_path = self._get_image_path(participant_id, session_id, cohort)
-            image = torch.load(image_path)
+            image = load_tensor(image_path)
         except IndexError:
             file_type = self.preprocessing_dict["file_type"]
-            image_path_list, _ = clinica_file_reader(
-                [participant_id], [session_id], self.caps_dict[cohort], file_type
-            )
-            image_nii = nib.load(image_path_list[0])
-            image_np = image_nii.get_fdata()
+            image_path_list = get_caps_index(
+                self.caps_dict[cohort], file_type
+            ).read_files([participant_id], [session_id])
+            image_np = read_nifti(image_path_list[0])
             image = ToTensor()(image_np)
+            if self.resolution_level > 0:
+                levels = compute_pyramid(torch.nan_to_num(image), self.resolution_level)
+                image = levels[-1]
 
         return image
 
-    @abc.abstractmethod
+    def _num_stored_elem(self) -> int:
+        """Gives the number of elements stored for the first image in the tensor store."""
+        participant_id, session_id, cohort, _ = self.metadata.get(0)
+        return self.tensor_stores[cohort].num_elem(participant_id, session_id)
+
+    def get_stored_tensors(
+        self, participant: str, session: str, cohort: str
+    ) -> List[torch.Tensor]:
+        """
+        Gets the tensors written by prepare_data for an image, in extraction order.
+
+        Args:
+            participant: ID of the participant.
+            session: ID of the session.
+            cohort: Name of the cohort.
+        Returns:
+            the whole image followed by the levels of its resolution pyramid if elements
+            are extracted on-the-fly, else all its elements.
+        """
+        if self.mode == "image" or not self.preprocessing_dict["prepare_dl"]:
+            n_levels = 1 + self.preprocessing_dict.get("pyramid_levels", 0)
+            if self.tensor_stores is None:
+                return [
+                    load_tensor(
+                        self._get_image_path(participant, session, cohort, level)
+                    )
+                    for level in range(n_levels)
+                ]
+            elem_indices = range(n_levels)
+        else:
+            elem_indices = range(self.elem_per_image)
+
+        if self.tensor_stores is not None:
+            return [
+                self.tensor_stores[cohort].get(participant, session, elem_idx)
+                for elem_idx in elem_indices
+            ]
+        return [
+            load_tensor(self._get_tensor_path(participant, session, cohort, elem_idx))
+            for elem_idx in elem_indices
+        ]
+
     def __getitem__(self, idx: int) -> Dict[str, Any]:
         """
         Gets the sample containing all the information needed for training and testing tasks.
 
         Args:
             idx: row number of the meta-data contained in self.df
+        Returns:
+            the sample, see _get_sample.
+        """
+        return self._get_sample(*self._get_meta_data(idx))
+
+    def __getitems__(self, indices: List[int]) -> List[Dict[str, Any]]:
+        """
+        Gets a list of samples, the meta-data of all the samples being read at once.
+        Used by the DataLoader to fetch a batch.
+
+        Args:
+            indices: row numbers of the samples.
+        Returns:
+            the list of samples, see _get_sample.
+        """
+        return [
+            self._get_sample(participant, session, cohort, int(elem_idx), label)
+            for participant, session, cohort, elem_idx, label in zip(
+                *self._get_meta_data_batch(indices)
+            )
+        ]
+
+    @abc.abstractmethod
+    def _get_sample(
+        self, participant: str, session: str, cohort: str, elem_idx: int, label: Any
+    ) -> Dict[str, Any]:
+        """
+        Builds the sample of an element from its meta-data.
+
+        Args:
+            participant: ID of the participant.
+            session: ID of the session.
+            cohort: Name of the cohort.
+            elem_idx: Index of the part of the image.
+            label: value of the label to be used in criterion.
         Returns:
             dictionary with following items:
                 - "image" (torch.Tensor): the input given to the model,
@@ -302,6 +948,15 @@ class CapsDatasetImage(CapsDataset):
         """
 
         self.mode = "image"
+        foreground_bbox = preprocessing_dict.get("foreground_bbox")
+        self.foreground_bbox = (
+            None
+            if foreground_bbox is None
+            else scale_bounding_box(
+                tuple(tuple(dim_range) for dim_range in foreground_bbox),
+                preprocessing_dict.get("resolution_level", 0),
+            )
+        )
         super().__init__(
             caps_directory,
             data_file,
@@ -318,14 +973,13 @@ class CapsDatasetImage(CapsDataset):
     def elem_index(self):
         return None
 
-    def __getitem__(self, idx):
-        participant, session, cohort, _, label = self._get_meta_data(idx)
+    def _get_sample(self, participant, session, cohort, elem_idx, label):
 
-        image_path = self._get_image_path(participant, session, cohort)
-        image = torch.load(image_path)
+        image, image_path = self._get_image_source(participant, session, cohort)
+        if self.foreground_bbox is not None:
+            image = crop_to_bounding_box(image, self.foreground_bbox).contiguous()
 
-        if self.transformations:
-            image = self.transformations(image)
+        image = self._transform(image, participant, session, cohort)
 
         if self.augmentation_transformations and not self.eval_mode:
             image = self.augmentation_transformations(image)
@@ -344,6 +998,17 @@ class CapsDatasetImage(CapsDataset):
     def num_elem_per_image(self):
         return 1
 
+    def _elements_are_images(self):
+        return self.foreground_bbox is None and self.resolution_level == 0
+
+    def _get_elem_shape(self):
+        elem_shape = super()._get_elem_shape()
+        if elem_shape is None or self.foreground_bbox is None:
+            return elem_shape
+        return (elem_shape[0],) + tuple(
+            end - start for start, end in self.foreground_bbox
+        )
+
 
 class CapsDatasetPatch(CapsDataset):
     def __init__(
@@ -358,6 +1023,7 @@ class CapsDatasetPatch(CapsDataset):
         label_code: Dict[str, int] = None,
         all_transformations: Optional[Callable] = None,
         multi_cohort: bool = False,
+        image_cache_size: float = 0,
     ):
         """
         Args:
@@ -372,6 +1038,8 @@ class CapsDatasetPatch(CapsDataset):
             label_code: label code that links the output node number to label value.
             all_transformations: Optional transform to be applied during training and evaluation.
             multi_cohort: If True caps_directory is the path to a TSV file linking cohort names and paths.
+            image_cache_size: maximum size (in MB) of the cache of decoded images used when elements
+                are extracted on-the-fly. Each DataLoader worker has its own cache. 0 disables the cache.
 
         """
         self.patch_size = preprocessing_dict["patch_size"]
@@ -389,33 +1057,45 @@ class CapsDatasetPatch(CapsDataset):
             label_code=label_code,
             transformations=all_transformations,
             multi_cohort=multi_cohort,
+            image_cache_size=image_cache_size,
         )
 
     @property
     def elem_index(self):
         return self.patch_index
 
-    def __getitem__(self, idx):
-        participant, session, cohort, patch_idx, label = self._get_meta_data(idx)
+    def _get_tensor_path(self, participant, session, cohort, elem_idx):
         image_path = self._get_image_path(participant, session, cohort)
+        if not self.prepare_dl:
+            return image_path
+
+        patch_dir = path.dirname(image_path).replace(
+            "image_based", f"{self.mode}_based"
+        )
+        patch_filename = extract_patch_path(
+            image_path, self.patch_size, self.stride_size, elem_idx
+        )
+        return path.join(patch_dir, patch_filename)
 
-        if self.prepare_dl:
-            patch_dir = path.dirname(image_path).replace(
-                "image_based", f"{self.mode}_based"
+    def _get_sample(self, participant, session, cohort, patch_idx, label):
+
+        if self.prepare_dl and self.tensor_stores is not None:
+            patch_tensor = self.tensor_stores[cohort].get(
+                participant, session, patch_idx
             )
-            patch_filename = extract_patch_path(
-                image_path, self.patch_size, self.stride_size, patch_idx
+
+        elif self.prepare_dl:
+            patch_tensor = self._load_tensor(
+                self._get_tensor_path(participant, session, cohort, patch_idx)
             )
-            patch_tensor = torch.load(path.join(patch_dir, patch_filename))
 
         else:
-            image = torch.load(image_path)
+            image, _ = self._get_image_source(participant, session, cohort)
             patch_tensor = extract_patch_tensor(
                 image, self.patch_size, self.stride_size, patch_idx
             )
 
-        if self.transformations:
-            patch_tensor = self.transformations(patch_tensor)
+        patch_tensor = self._transform(patch_tensor, participant, session, cohort)
 
         if self.augmentation_transformations and not self.eval_mode:
             patch_tensor = self.augmentation_transformations(patch_tensor)
@@ -434,19 +1114,62 @@ class CapsDatasetPatch(CapsDataset):
         if self.elem_index is not None:
             return 1
 
-        image = self._get_full_image()
+        if self.prepare_dl and self._get_num_tensors() is not None:
+            return self._get_num_tensors()
+
+        if self.prepare_dl and self.tensor_stores is not None:
+            return self._num_stored_elem()
 
-        patches_tensor = (
-            image.unfold(1, self.patch_size, self.stride_size)
-            .unfold(2, self.patch_size, self.stride_size)
-            .unfold(3, self.patch_size, self.stride_size)
-            .contiguous()
+        return get_patch_grid(
+            self._get_image_shape(), self.patch_size, self.stride_size
+        ).num_patches
+
+    def _compute_elem_shape(self, image_shape):
+        return (image_shape[0],) + (self.patch_size,) * 3
+
+    def _check_resolution_level(self, preprocessing_dict):
+        super()._check_resolution_level(preprocessing_dict)
+        if (
+            self.resolution_level > 0
+            and preprocessing_dict.get("foreground_threshold") is not None
+        ):
+            raise ClinicaDLConfigurationError(
+                "The foreground patches were found in the original images and cannot be "
+                "used with a lower resolution level."
+            )
+
+    def _compute_elem_table(self):
+        # Only the patches containing foreground are used, with their index in the grid
+        if (
+            self.elem_index is not None
+            or self.preprocessing_dict.get("foreground_threshold") is None
+        ):
+            return None
+
+        foreground_indices = {
+            cohort: ForegroundIndex(
+                get_foreground_index_path(
+                    caps_path, self.preprocessing_dict["extract_json"]
+                )
+            )
+            for cohort, caps_path in self.caps_dict.items()
+        }
+        patch_ids_list = list()
+        for image_idx in range(len(self.metadata)):
+            participant, session, cohort, _ = self.metadata.get(image_idx)
+            patch_ids_list.append(
+                foreground_indices[cohort].get_patch_ids(participant, session)
+            )
+        image_indices = np.repeat(
+            np.arange(len(patch_ids_list)),
+            [len(patch_ids) for patch_ids in patch_ids_list],
         )
-        patches_tensor = patches_tensor.view(
-            -1, self.patch_size, self.patch_size, self.patch_size
+        elem_indices = np.concatenate(patch_ids_list).astype(np.int64)
+        logger.debug(
+            f"{len(elem_indices)} patches out of {len(self.df) * self.elem_per_image} "
+            f"contain foreground."
         )
-        num_patches = patches_tensor.shape[0]
-        return num_patches
+        return image_indices, elem_indices
 
 
 class CapsDatasetRoi(CapsDataset):
@@ -462,6 +1185,7 @@ class CapsDatasetRoi(CapsDataset):
         label_code: Dict[str, int] = None,
         all_transformations: Optional[Callable] = None,
         multi_cohort: bool = False,
+        image_cache_size: float = 0,
     ):
         """
         Args:
@@ -476,6 +1200,8 @@ class CapsDatasetRoi(CapsDataset):
             label_code: label code that links the output node number to label value.
             all_transformations: Optional transform to be applied during training and evaluation.
             multi_cohort: If True caps_directory is the path to a TSV file linking cohort names and paths.
+            image_cache_size: maximum size (in MB) of the cache of decoded images used when elements
+                are extracted on-the-fly. Each DataLoader worker has its own cache. 0 disables the cache.
 
         """
         self.roi_index = roi_index
@@ -483,7 +1209,7 @@ class CapsDatasetRoi(CapsDataset):
         self.roi_list = preprocessing_dict["roi_list"]
         self.uncropped_roi = preprocessing_dict["uncropped_roi"]
         self.prepare_dl = preprocessing_dict["prepare_dl"]
-        self.mask_paths, self.mask_arrays = self._get_mask_paths_and_tensors(
+        self.mask_paths, self.roi_masks = self._get_mask_paths_and_tensors(
             caps_directory, multi_cohort, preprocessing_dict
         )
         super().__init__(
@@ -496,15 +1222,24 @@ class CapsDatasetRoi(CapsDataset):
             label_code=label_code,
             transformations=all_transformations,
             multi_cohort=multi_cohort,
+            image_cache_size=image_cache_size,
         )
 
     @property
     def elem_index(self):
         return self.roi_index
 
-    def __getitem__(self, idx):
-        participant, session, cohort, roi_idx, label = self._get_meta_data(idx)
+    def _get_tensor_path(self, participant, session, cohort, elem_idx):
         image_path = self._get_image_path(participant, session, cohort)
+        if not self.prepare_dl:
+            return image_path
+
+        mask_path = self.mask_paths[elem_idx]
+        roi_dir = path.dirname(image_path).replace("image_based", f"{self.mode}_based")
+        roi_filename = extract_roi_path(image_path, mask_path, self.uncropped_roi)
+        return path.join(roi_dir, roi_filename)
+
+    def _get_sample(self, participant, session, cohort, roi_idx, label):
 
         if self.roi_list is None:
             raise NotImplementedError(
@@ -512,21 +1247,20 @@ class CapsDatasetRoi(CapsDataset):
                 "Please define appropriate masks and give a roi_list."
             )
 
-        if self.prepare_dl:
-            mask_path = self.mask_paths[roi_idx]
-            roi_dir = path.dirname(image_path).replace(
-                "image_based", f"{self.mode}_based"
+        if self.prepare_dl and self.tensor_stores is not None:
+            roi_tensor = self.tensor_stores[cohort].get(participant, session, roi_idx)
+
+        elif self.prepare_dl:
+            roi_tensor = self._load_tensor(
+                self._get_tensor_path(participant, session, cohort, roi_idx)
             )
-            roi_filename = extract_roi_path(image_path, mask_path, self.uncropped_roi)
-            roi_tensor = torch.load(path.join(roi_dir, roi_filename))
 
         else:
-            image = torch.load(image_path)
-            mask_array = self.mask_arrays[roi_idx]
-            roi_tensor = extract_roi_tensor(image, mask_array, self.uncropped_roi)
+            image, _ = self._get_image_source(participant, session, cohort)
+            roi_mask = self.roi_masks[roi_idx]
+            roi_tensor = roi_mask.extract(image, self.uncropped_roi)
 
-        if self.transformations:
-            roi_tensor = self.transformations(roi_tensor)
+        roi_tensor = self._transform(roi_tensor, participant, session, cohort)
 
         if self.augmentation_transformations and not self.eval_mode:
             roi_tensor = self.augmentation_transformations(roi_tensor)
@@ -549,15 +1283,35 @@ class CapsDatasetRoi(CapsDataset):
         else:
             return len(self.roi_list)
 
+    def _check_resolution_level(self, preprocessing_dict):
+        super()._check_resolution_level(preprocessing_dict)
+        if self.resolution_level > 0:
+            raise ClinicaDLConfigurationError(
+                "Regions cannot be extracted from a lower resolution level, "
+                "as their masks are defined in the original images."
+            )
+
+    def _get_elem_shape(self):
+        # Regions extracted on-the-fly have the shape given by their mask
+        if self.prepare_dl or self.roi_list is None:
+            return super()._get_elem_shape()
+
+        roi_idx = 0 if self.elem_index is None else self.elem_index
+        roi_mask = self.roi_masks[roi_idx]
+        if self.uncropped_roi:
+            return tuple(roi_mask.mask_shape)
+        return tuple(roi_mask.cropped_mask.shape)
+
     def _get_mask_paths_and_tensors(
         self,
         caps_directory: str,
         multi_cohort: bool,
         preprocessing_dict: Dict[str, Any],
-    ) -> Tuple[List[str], List]:
-        """Loads the masks necessary to regions extraction"""
-        import nibabel as nib
-
+    ) -> Tuple[List[str], List[RoiMask]]:
+        """
+        Loads the masks necessary to regions extraction. They are compiled and stored in
+        shared memory, so that DataLoader workers do not copy them.
+        """
         caps_dict = self.create_caps_dict(caps_directory, multi_cohort)
 
         if len(caps_dict) > 1:
@@ -599,17 +1353,16 @@ class CapsDatasetRoi(CapsDataset):
 
         mask_location = path.join(caps_directory, "masks", f"tpl-{template_name}")
 
-        mask_paths, mask_arrays = list(), list()
+        mask_paths, roi_masks = list(), list()
         for roi in self.roi_list:
             logger.info(f"Find mask for roi {roi}.")
             mask_path, desc = find_mask_path(mask_location, roi, pattern, True)
             if mask_path is None:
                 raise FileNotFoundError(desc)
-            mask_nii = nib.load(mask_path)
             mask_paths.append(mask_path)
-            mask_arrays.append(mask_nii.get_fdata())
+            roi_masks.append(_load_roi_mask(mask_path))
 
-        return mask_paths, mask_arrays
+        return mask_paths, roi_masks
 
 
 class CapsDatasetSlice(CapsDataset):
@@ -625,6 +1378,7 @@ class CapsDatasetSlice(CapsDataset):
         label_code: Dict[str, int] = None,
         all_transformations: Optional[Callable] = None,
         multi_cohort: bool = False,
+        image_cache_size: float = 0,
     ):
         """
         Args:
@@ -639,6 +1393,8 @@ class CapsDatasetSlice(CapsDataset):
             label_code: label code that links the output node number to label value.
             all_transformations: Optional transform to be applied during training and evaluation.
             multi_cohort: If True caps_directory is the path to a TSV file linking cohort names and paths.
+            image_cache_size: maximum size (in MB) of the cache of decoded images used when elements
+                are extracted on-the-fly. Each DataLoader worker has its own cache. 0 disables the cache.
         """
         self.slice_index = slice_index
         self.slice_direction = preprocessing_dict["slice_direction"]
@@ -662,35 +1418,52 @@ class CapsDatasetSlice(CapsDataset):
             label_code=label_code,
             transformations=all_transformations,
             multi_cohort=multi_cohort,
+            image_cache_size=image_cache_size,
         )
 
     @property
     def elem_index(self):
         return self.slice_index
 
-    def __getitem__(self, idx):
-        participant, session, cohort, slice_idx, label = self._get_meta_data(idx)
-        slice_idx = slice_idx + self.discarded_slices[0]
+    def _get_tensor_path(self, participant, session, cohort, elem_idx):
         image_path = self._get_image_path(participant, session, cohort)
+        if not self.prepare_dl:
+            return image_path
+
+        slice_dir = path.dirname(image_path).replace(
+            "image_based", f"{self.mode}_based"
+        )
+        slice_filename = extract_slice_path(
+            image_path,
+            self.slice_direction,
+            self.slice_mode,
+            elem_idx + self.discarded_slices[0],
+        )
+        return path.join(slice_dir, slice_filename)
 
-        if self.prepare_dl:
-            slice_dir = path.dirname(image_path).replace(
-                "image_based", f"{self.mode}_based"
+    def _get_sample(self, participant, session, cohort, slice_idx, label):
+        slice_idx = slice_idx + self.discarded_slices[0]
+
+        if self.prepare_dl and self.tensor_stores is not None:
+            # Slices are stored from the first slice which was not discarded
+            slice_tensor = self.tensor_stores[cohort].get(
+                participant, session, slice_idx - self.discarded_slices[0]
             )
-            slice_filename = extract_slice_path(
-                image_path, self.slice_direction, self.slice_mode, slice_idx
+
+        elif self.prepare_dl:
+            slice_tensor = self._load_tensor(
+                self._get_tensor_path(
+                    participant, session, cohort, slice_idx - self.discarded_slices[0]
+                )
             )
-            slice_tensor = torch.load(path.join(slice_dir, slice_filename))
 
         else:
-            image_path = self._get_image_path(participant, session, cohort)
-            image = torch.load(image_path)
+            image, _ = self._get_image_source(participant, session, cohort)
             slice_tensor = extract_slice_tensor(
                 image, self.slice_direction, self.slice_mode, slice_idx
             )
 
-        if self.transformations:
-            slice_tensor = self.transformations(slice_tensor)
+        slice_tensor = self._transform(slice_tensor, participant, session, cohort)
 
         if self.augmentation_transformations and not self.eval_mode:
             slice_tensor = self.augmentation_transformations(slice_tensor)
@@ -712,13 +1485,45 @@ class CapsDatasetSlice(CapsDataset):
         if self.num_slices is not None:
             return self.num_slices
 
-        image = self._get_full_image()
+        if self.prepare_dl and self._get_num_tensors() is not None:
+            return self._get_num_tensors()
+
+        if self.prepare_dl and self.tensor_stores is not None:
+            return self._num_stored_elem()
+
+        image_shape = self._get_image_shape()
         return (
-            image.size(self.slice_direction + 1)
+            image_shape[self.slice_direction + 1]
             - self.discarded_slices[0]
             - self.discarded_slices[1]
         )
 
+    def _compute_elem_shape(self, image_shape):
+        n_channels = image_shape[0] * 3 if self.slice_mode == "rgb" else image_shape[0]
+        slice_shape = [
+            dim_size
+            for dim, dim_size in enumerate(image_shape[1:])
+            if dim != self.slice_direction
+        ]
+        return (n_channels, *slice_shape)
+
+
+@lru_cache(maxsize=None)
+def _check_caps_folder(caps_directory: str):
+    """Checks a CAPS folder once per process, as datasets are created many times."""
+    from clinica.utils.inputs import check_caps_folder
+
+    check_caps_folder(caps_directory)
+
+
+@lru_cache(maxsize=None)
+def _load_roi_mask(mask_path: str) -> RoiMask:
+    """Loads and compiles a ROI mask once per process, in shared memory."""
+    from clinicadl.utils.nifti import read_nifti
+
+    mask_np = read_nifti(mask_path)
+    return RoiMask(mask_np).share_memory_()
+
 
 def return_dataset(
     input_dir: str,
@@ -731,6 +1536,7 @@ def return_dataset(
     cnn_index: int = None,
     label_presence: bool = True,
     multi_cohort: bool = False,
+    image_cache_size: float = 0,
 ) -> CapsDataset:
     """
     Return appropriate Dataset according to given options.
@@ -745,6 +1551,8 @@ def return_dataset(
         cnn_index: Index of the CNN in a multi-CNN paradigm (optional).
         label_presence: If True the diagnosis will be extracted from the given DataFrame.
         multi_cohort: If True caps_directory is the path to a TSV file linking cohort names and paths.
+        image_cache_size: maximum size (in MB) of the cache of decoded images of each worker
+            (only used in patch, roi and slice modes when elements are extracted on-the-fly).
 
     Returns:
          the corresponding dataset.
@@ -778,6 +1586,7 @@ def return_dataset(
             label=label,
             label_code=label_code,
             multi_cohort=multi_cohort,
+            image_cache_size=image_cache_size,
         )
     elif preprocessing_dict["mode"] == "roi":
         return CapsDatasetRoi(
@@ -791,6 +1600,7 @@ def return_dataset(
             label=label,
             label_code=label_code,
             multi_cohort=multi_cohort,
+            image_cache_size=image_cache_size,
         )
     elif preprocessing_dict["mode"] == "slice":
         return CapsDatasetSlice(
@@ -804,6 +1614,7 @@ def return_dataset(
             label=label,
             label_code=label_code,
             multi_cohort=multi_cohort,
+            image_cache_size=image_cache_size,
         )
     else:
         raise NotImplementedError(
@@ -901,6 +1712,120 @@ class MinMaxNormalization(object):
         return (image - image.min()) / (image.max() - image.min())
 
 
+class Normalization(object):
+    """
+    Removes NaN values and, if normalize is True, normalizes tensors between 0 and 1.
+
+    With the element scope, each tensor (image, patch, slice or region) is normalized with
+    its own minimum and maximum. With the image scope, the elements of an image are
+    normalized with the minimum and maximum of the whole image.
+
+    Datasets give the statistics of the image computed by prepare_data: tensors of images
+    without NaN values are then not scanned, and the normalization of whole images or with
+    the image scope is a single affine operation. Tensors already normalized by prepare_data
+    are left unchanged.
+    """
+
+    def __init__(self, normalize: bool = True, scope: str = "element"):
+        """
+        Args:
+            normalize: if True, performs the min-max normalization.
+            scope: statistics used by the normalization (element or image).
+        Raises:
+            ClinicaDLArgumentError: if the scope does not exist.
+        """
+        if scope not in NORMALIZATION_SCOPES:
+            raise ClinicaDLArgumentError(
+                f"Normalization scope {scope} is not implemented. "
+                f"Please choose between {', '.join(NORMALIZATION_SCOPES)}."
+            )
+        self.normalize = normalize
+        self.scope = scope
+        self.prenormalized = None
+        self.elements_are_images = False
+        self.nan_detected = False  # Avoid warning each time new data is seen
+
+    @property
+    def needs_statistics(self) -> bool:
+        """Tells if the statistics of the images are needed to normalize the tensors."""
+        return (
+            self.normalize
+            and self.scope == "image"
+            and self.prenormalized is None
+            and not self.elements_are_images
+        )
+
+    def configure(
+        self, prenormalized: Optional[str], elements_are_images: bool
+    ) -> "Normalization":
+        """
+        Gives a copy of the transform adapted to the tensors of a dataset.
+
+        Args:
+            prenormalized: scope of the normalization performed by prepare_data (None if the
+                tensors were not normalized).
+            elements_are_images: True if the elements of the dataset are whole images.
+        Returns:
+            the configured transform.
+        Raises:
+            ClinicaDLConfigurationError: if the elements cannot be normalized with this scope.
+        """
+        if (
+            self.normalize
+            and self.scope == "image"
+            and prenormalized == "element"
+            and not elements_are_images
+        ):
+            raise ClinicaDLConfigurationError(
+                "Tensors were normalized by prepare_data with their own statistics and cannot "
+                "be normalized with the statistics of their image. Please use the element scope."
+            )
+        if not self.normalize and prenormalized is not None:
+            logger.warning(
+                "Tensors were normalized by prepare_data and will be used normalized."
+            )
+        transform = copy(self)
+        transform.prenormalized = prenormalized
+        transform.elements_are_images = elements_are_images
+        return transform
+
+    def __call__(self, tensor, statistics: Optional[ImageStatistics] = None):
+        if self.prenormalized is not None:
+            if (
+                self.elements_are_images
+                or not self.normalize
+                or self.prenormalized == self.scope
+            ):
+                return tensor
+            # Elements of normalized images are normalized again with their own statistics
+            return normalize_tensor(tensor)
+
+        if statistics is not None:
+            has_nan = statistics.has_nan
+        else:
+            has_nan = torch.isnan(tensor).any().item()
+        if has_nan:
+            if not self.nan_detected:
+                logger.warning(
+                    "NaN values were found in your images and will be removed."
+                )
+                self.nan_detected = True
+            tensor = torch.nan_to_num(tensor)
+
+        if not self.normalize:
+            return tensor
+        if statistics is not None and (
+            self.scope == "image" or self.elements_are_images
+        ):
+            return tensor.sub(statistics.min).div_(statistics.max - statistics.min)
+        if self.scope == "image" and not self.elements_are_images:
+            raise ClinicaDLConfigurationError(
+                "The statistics of the image are needed to normalize its elements."
+            )
+        min_value, max_value = tensor.min(), tensor.max()
+        return tensor.sub(min_value).div_(max_value - min_value)
+
+
 class NanRemoval(object):
     def __init__(self):
         self.nan_detected = False  # Avoid warning each time new data is seen
@@ -917,15 +1842,165 @@ class NanRemoval(object):
             return image
 
 
+class BatchRandomNoising(object):
+    """Adds a Gaussian noise to a batch, with a random standard deviation per sample"""
+
+    def __init__(self, sigma=0.1):
+        self.sigma = sigma
+
+    def __call__(self, images):
+        sigma = self.sigma * torch.rand(
+            (images.size(0),) + (1,) * (images.dim() - 1), device=images.device
+        )
+        return images + torch.randn_like(images) * sigma
+
+
+class BatchRandomSmoothing(object):
+    """
+    Applies a Gaussian smoothing to a batch, with a random standard deviation per sample.
+    Separable convolutions reproduce scipy gaussian_filter (truncate=4.0, mode="reflect").
+    """
+
+    def __init__(self, sigma=1):
+        self.sigma = sigma
+
+    def __call__(self, images):
+        sigma = self.sigma * torch.rand(images.size(0), device=images.device)
+        return self._smooth(images, sigma)
+
+    @classmethod
+    def _smooth(cls, images: torch.Tensor, sigma: torch.Tensor) -> torch.Tensor:
+        """Smoothes each sample of the batch with the standard deviation of the same index."""
+        batch_size, n_channels = images.shape[:2]
+        n_dims = images.dim() - 2
+        conv_fn = [
+            torch.nn.functional.conv1d,
+            torch.nn.functional.conv2d,
+            torch.nn.functional.conv3d,
+        ][n_dims - 1]
+
+        kernels = cls._gaussian_kernels(sigma).repeat_interleave(n_channels, dim=0)
+        radius = (kernels.size(1) - 1) // 2
+
+        # Channels of all samples are convolved as groups of a single sample
+        output = images.reshape(1, batch_size * n_channels, *images.shape[2:])
+        for dim in range(2, n_dims + 2):
+            kernel_shape = [batch_size * n_channels, 1] + [1] * n_dims
+            kernel_shape[dim] = kernels.size(1)
+            output = cls._reflect_pad(output, radius, dim)
+            output = conv_fn(
+                output, kernels.view(kernel_shape), groups=batch_size * n_channels
+            )
+
+        return output.view(images.shape)
+
+    @staticmethod
+    def _gaussian_kernels(sigma: torch.Tensor) -> torch.Tensor:
+        """Computes one normalized 1D kernel per value of sigma, padded to the same size."""
+        radii = (4.0 * sigma + 0.5).long()
+        max_radius = int(radii.max())
+        x = torch.arange(-max_radius, max_radius + 1, device=sigma.device)
+        sigma = sigma.clamp(min=1e-6).unsqueeze(1)
+        kernels = torch.exp(-0.5 * (x / sigma) ** 2)
+        kernels = kernels * (x.abs() <= radii.unsqueeze(1))
+        return kernels / kernels.sum(dim=1, keepdim=True)
+
+    @staticmethod
+    def _reflect_pad(tensor: torch.Tensor, radius: int, dim: int) -> torch.Tensor:
+        """Pads a dimension by reflecting the edge values (d c b a | a b c d)."""
+        if radius == 0:
+            return tensor
+        left = tensor.narrow(dim, 0, radius).flip(dim)
+        right = tensor.narrow(dim, tensor.size(dim) - radius, radius).flip(dim)
+        return torch.cat((left, tensor, right), dim=dim)
+
+
+class BatchRandomCropPad(object):
+    """Shifts each sample of a batch by a random number of voxels in each dimension"""
+
+    def __init__(self, length):
+        self.length = length
+
+    def __call__(self, images):
+        batch_size = images.size(0)
+        for dim in range(2, images.dim()):
+            shifts = torch.randint(
+                -self.length, self.length, (batch_size,), device=images.device
+            )
+            images = self._shift(images, shifts, dim)
+        return images
+
+    @staticmethod
+    def _shift(images: torch.Tensor, shifts: torch.Tensor, dim: int) -> torch.Tensor:
+        """Output voxel i of a sample is its input voxel i + shift, or 0 if outside."""
+        dim_size = images.size(dim)
+        index_shape = [1] * images.dim()
+        index_shape[dim] = dim_size
+        shift_shape = [images.size(0)] + [1] * (images.dim() - 1)
+        index = torch.arange(dim_size, device=images.device).view(
+            index_shape
+        ) + shifts.view(shift_shape)
+        valid = (index >= 0) & (index < dim_size)
+        index = index.clamp(0, dim_size - 1).expand(images.shape)
+        return images.gather(dim, index) * valid
+
+
+class BatchRandomErasing(object):
+    """Applies RandomErasing to each sample of a batch"""
+
+    def __init__(self):
+        self.erasing = transforms.RandomErasing()
+
+    def __call__(self, images):
+        return torch.stack([self.erasing(image) for image in images])
+
+
+class BatchAugmentation(object):
+    """
+    Data augmentation applied to collated batches, on the device where the batch is.
+    Samples of the batch are augmented with different random parameters.
+    """
+
+    def __init__(self, data_augmentation: List[str] = None):
+        """
+        Args:
+            data_augmentation: list of data augmentation performed on the training set.
+        """
+        augmentation_dict = {
+            "Noise": BatchRandomNoising(sigma=0.1),
+            "Erasing": BatchRandomErasing(),
+            "CropPad": BatchRandomCropPad(10),
+            "Smoothing": BatchRandomSmoothing(),
+            "None": None,
+        }
+        if data_augmentation:
+            self.augmentation_list = [
+                augmentation_dict[augmentation]
+                for augmentation in data_augmentation
+                if augmentation_dict[augmentation] is not None
+            ]
+        else:
+            self.augmentation_list = []
+
+    def __call__(self, images: torch.Tensor) -> torch.Tensor:
+        for augmentation in self.augmentation_list:
+            images = augmentation(images)
+        return images
+
+
 def get_transforms(
-    normalize: bool = True, data_augmentation: List[str] = None
-) -> Tuple[transforms.Compose, transforms.Compose]:
+    normalize: bool = True,
+    data_augmentation: List[str] = None,
+    normalization_scope: str = "element",
+) -> Tuple[transforms.Compose, Normalization]:
     """
     Outputs the transformations that will be applied to the dataset
 
     Args:
-        normalize: if True will perform MinMaxNormalization.
+        normalize: if True will perform a min-max normalization.
         data_augmentation: list of data augmentation performed on the training set.
+        normalization_scope: statistics used by the normalization of the elements of an image,
+            element (each element is normalized with its own range) or image (range of the image).
 
     Returns:
         transforms to apply in train and evaluation mode / transforms to apply in evaluation mode only.
@@ -944,12 +2019,7 @@ def get_transforms(
     else:
         augmentation_list = []
 
-    if normalize:
-        transformations_list = [NanRemoval(), MinMaxNormalization()]
-    else:
-        transformations_list = [NanRemoval()]
-
-    all_transformations = transforms.Compose(transformations_list)
+    all_transformations = Normalization(normalize, normalization_scope)
     train_transformations = transforms.Compose(augmentation_list)
 
     return train_transformations, all_transformations
@@ -0,0 +1,202 @@
+# coding: utf8
+
+"""
+Foreground of the images extracted by prepare_data.
+
+A voxel belongs to the foreground if its intensity is above FOREGROUND_INTENSITY of the
+intensity range of its image. For each image, prepare_data records in a TSV index the
+bounding box of the foreground and the patches whose fraction of foreground voxels reaches
+a threshold, so that datasets can crop the background margins and skip empty patches.
+Patches keep the index they have in the full patch grid of the image.
+"""
+
+import os
+from os import path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+
+FOREGROUND_INTENSITY = 0.1
+INDEX_COLUMNS = ["participant_id", "session_id", "bounding_box", "patch_ids"]
+
+BoundingBox = Tuple[Tuple[int, int], ...]
+
+
+def get_foreground_index_path(caps_directory: str, extract_json: str) -> str:
+    """Gives the path to the foreground index of an extraction."""
+    index_name = path.splitext(extract_json)[0]
+    return path.join(
+        caps_directory, "tensor_extraction", f"{index_name}_foreground.tsv"
+    )
+
+
+def compute_foreground_mask(image_tensor: torch.Tensor) -> torch.Tensor:
+    """
+    Args:
+        image_tensor: image of shape C * D * H * W.
+    Returns:
+        boolean mask of shape D * H * W of the voxels in the foreground of any channel.
+        NaN values are replaced by 0, as done by NanRemoval during training.
+    """
+    image_tensor = torch.nan_to_num(image_tensor)
+    min_value = image_tensor.min()
+    threshold = min_value + FOREGROUND_INTENSITY * (image_tensor.max() - min_value)
+    return (image_tensor > threshold).any(dim=0)
+
+
+def compute_bounding_box(mask: torch.Tensor) -> BoundingBox:
+    """
+    Args:
+        mask: boolean mask of shape D * H * W.
+    Returns:
+        the first and last (excluded) positions of the mask along each dimension.
+        The whole image is given if the mask is empty.
+    """
+    bounding_box = list()
+    for dim in range(mask.ndim):
+        other_dims = [other_dim for other_dim in range(mask.ndim) if other_dim != dim]
+        positions = torch.nonzero(mask.any(dim=other_dims[1]).any(dim=other_dims[0]))
+        if len(positions) == 0:
+            return tuple((0, dim_size) for dim_size in mask.shape)
+        bounding_box.append((int(positions[0]), int(positions[-1]) + 1))
+    return tuple(bounding_box)
+
+
+def union_bounding_box(bounding_boxes: Sequence[BoundingBox]) -> BoundingBox:
+    """Gives the smallest bounding box containing all the bounding boxes."""
+    return tuple(
+        (min(start for start, _ in dim_ranges), max(end for _, end in dim_ranges))
+        for dim_ranges in zip(*bounding_boxes)
+    )
+
+
+def crop_to_bounding_box(
+    image_tensor: torch.Tensor, bounding_box: BoundingBox
+) -> torch.Tensor:
+    """
+    Args:
+        image_tensor: image of shape C * D * H * W.
+        bounding_box: range kept along each spatial dimension.
+    Returns:
+        a view of the cropped image.
+    """
+    for dim, (start, end) in enumerate(bounding_box, start=1):
+        image_tensor = image_tensor.narrow(dim, start, end - start)
+    return image_tensor
+
+
+def compute_foreground_patches(
+    mask: torch.Tensor, patch_size: int, stride_size: int, threshold: float
+) -> List[int]:
+    """
+    Finds the patches containing enough foreground voxels.
+
+    Args:
+        mask: boolean mask of shape D * H * W.
+        patch_size: size of a single patch.
+        stride_size: size of the stride leading to next patch.
+        threshold: minimal fraction of foreground voxels in a patch.
+    Returns:
+        the indices of the patches in the patch grid of the image (see PatchGrid).
+        The patch with the most foreground is kept if no patch reaches the threshold.
+    """
+    fractions = mask.float()
+    for dim in range(3):
+        fractions = fractions.unfold(dim, patch_size, stride_size)
+    fractions = fractions.mean(dim=(-3, -2, -1)).reshape(-1)
+    patch_ids = torch.nonzero(fractions >= threshold).view(-1).tolist()
+    if len(patch_ids) == 0 and len(fractions) > 0:
+        patch_ids = [int(fractions.argmax())]
+    return patch_ids
+
+
+class ForegroundIndex:
+    """
+    Bounding box of the foreground and foreground patches of each image of an extraction.
+
+    Entries are appended to the index file as soon as images are extracted. The last
+    entry of an image replaces the previous ones.
+    """
+
+    def __init__(self, index_path: str):
+        """
+        Args:
+            index_path: path to the index (*.tsv). It is created with the first entry.
+        """
+        self.index_path = index_path
+        self._entries: Dict[Tuple[str, str], Tuple[BoundingBox, np.ndarray]] = dict()
+
+        if path.isfile(index_path):
+            index_df = pd.read_csv(index_path, sep="\t", dtype=str)
+            for entry in index_df.to_dict("records"):
+                bounding_box = tuple(
+                    tuple(int(pos) for pos in dim_range.split(":"))
+                    for dim_range in entry["bounding_box"].split(";")
+                )
+                patch_ids = (
+                    np.array([], dtype=np.int64)
+                    if pd.isna(entry["patch_ids"])
+                    else np.array(entry["patch_ids"].split(";"), dtype=np.int64)
+                )
+                key = (entry["participant_id"], entry["session_id"])
+                self._entries[key] = (bounding_box, patch_ids)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self._entries
+
+    def _get_entry(
+        self, participant: str, session: str
+    ) -> Tuple[BoundingBox, np.ndarray]:
+        key = (participant, session)
+        if key not in self._entries:
+            raise KeyError(
+                f"({participant} | {session}) was not found in the foreground index "
+                f"{self.index_path}. Please run prepare_data on this image first."
+            )
+        return self._entries[key]
+
+    def get_bounding_box(self, participant: str, session: str) -> BoundingBox:
+        """Gives the bounding box of the foreground of an image."""
+        return self._get_entry(participant, session)[0]
+
+    def get_patch_ids(self, participant: str, session: str) -> np.ndarray:
+        """Gives the indices of the foreground patches of an image, in increasing order."""
+        return self._get_entry(participant, session)[1]
+
+    def add(
+        self,
+        participant: str,
+        session: str,
+        bounding_box: BoundingBox,
+        patch_ids: Sequence[int] = (),
+    ):
+        """
+        Records the foreground of an image and appends it to the index file.
+
+        Args:
+            participant: ID of the participant.
+            session: ID of the session.
+            bounding_box: bounding box of the foreground.
+            patch_ids: indices of the foreground patches.
+        """
+        self._entries[(participant, session)] = (
+            bounding_box,
+            np.array(patch_ids, dtype=np.int64),
+        )
+        entry = {
+            "participant_id": participant,
+            "session_id": session,
+            "bounding_box": ";".join(f"{start}:{end}" for start, end in bounding_box),
+            "patch_ids": ";".join(str(patch_id) for patch_id in patch_ids),
+        }
+        write_header = not path.isfile(self.index_path)
+        if write_header:
+            os.makedirs(path.dirname(self.index_path), exist_ok=True)
+        pd.DataFrame([entry], columns=INDEX_COLUMNS).to_csv(
+            self.index_path, sep="\t", index=False, header=write_header, mode="a"
+        )
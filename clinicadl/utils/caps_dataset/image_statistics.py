@@ -0,0 +1,125 @@
+# coding: utf8
+
+"""
+Intensity statistics of the images extracted by prepare_data.
+
+For each image, prepare_data records in a TSV index whether it contains NaN values and
+its minimum and maximum (after the removal of NaN values). Datasets then skip the scan
+for NaN values of the tensors of clean images, and can normalize the elements of an image
+with the statistics of the whole image in a single affine operation.
+"""
+
+import os
+from os import path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import pandas as pd
+import torch
+
+NORMALIZATION_SCOPES = ("element", "image")
+INDEX_COLUMNS = ["participant_id", "session_id", "has_nan", "min", "max"]
+
+
+class ImageStatistics(NamedTuple):
+    has_nan: bool
+    min: float
+    max: float
+
+
+def get_statistics_index_path(caps_directory: str, extract_json: str) -> str:
+    """Gives the path to the statistics index of an extraction."""
+    index_name = path.splitext(extract_json)[0]
+    return path.join(
+        caps_directory, "tensor_extraction", f"{index_name}_statistics.tsv"
+    )
+
+
+def compute_image_statistics(image_tensor: torch.Tensor) -> ImageStatistics:
+    """Computes the statistics of an image tensor."""
+    has_nan = bool(torch.isnan(image_tensor).any())
+    if has_nan:
+        image_tensor = torch.nan_to_num(image_tensor)
+    return ImageStatistics(
+        has_nan, float(image_tensor.min()), float(image_tensor.max())
+    )
+
+
+def normalize_tensor(
+    tensor: torch.Tensor, statistics: Optional[ImageStatistics] = None
+) -> torch.Tensor:
+    """
+    Removes the NaN values of a tensor and normalizes it between 0 and 1.
+
+    Args:
+        tensor: tensor to normalize.
+        statistics: statistics of the image used for the normalization.
+            If None, the statistics of the tensor are used.
+    Returns:
+        the normalized tensor.
+    """
+    if statistics is None:
+        statistics = compute_image_statistics(tensor)
+    if statistics.has_nan:
+        tensor = torch.nan_to_num(tensor)
+    return tensor.sub(statistics.min).div_(statistics.max - statistics.min)
+
+
+class ImageStatisticsIndex:
+    """
+    Statistics of each image of an extraction.
+
+    Entries are appended to the index file as soon as images are extracted. The last
+    entry of an image replaces the previous ones.
+    """
+
+    def __init__(self, index_path: str):
+        """
+        Args:
+            index_path: path to the index (*.tsv). It is created with the first entry.
+        """
+        self.index_path = index_path
+        self._entries: Dict[Tuple[str, str], ImageStatistics] = dict()
+
+        if path.isfile(index_path):
+            index_df = pd.read_csv(
+                index_path,
+                sep="\t",
+                dtype={"participant_id": str, "session_id": str, "has_nan": bool},
+            )
+            for participant, session, has_nan, min_value, max_value in zip(
+                index_df.participant_id,
+                index_df.session_id,
+                index_df.has_nan,
+                index_df["min"].astype(float),
+                index_df["max"].astype(float),
+            ):
+                self._entries[(participant, session)] = ImageStatistics(
+                    bool(has_nan), min_value, max_value
+                )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self._entries
+
+    def get(self, participant: str, session: str) -> Optional[ImageStatistics]:
+        """Gives the statistics of an image, or None if they were not recorded."""
+        return self._entries.get((participant, session))
+
+    def add(self, participant: str, session: str, statistics: ImageStatistics):
+        """
+        Records the statistics of an image and appends them to the index file.
+
+        Args:
+            participant: ID of the participant.
+            session: ID of the session.
+            statistics: statistics of the image.
+        """
+        self._entries[(participant, session)] = statistics
+        write_header = not path.isfile(self.index_path)
+        if write_header:
+            os.makedirs(path.dirname(self.index_path), exist_ok=True)
+        pd.DataFrame(
+            [[participant, session, *statistics]], columns=INDEX_COLUMNS
+        ).to_csv(self.index_path, sep="\t", index=False, header=write_header, mode="a")
@@ -0,0 +1,28 @@
+# coding: utf8
+
+from time import perf_counter
+from typing import Any, Iterator
+
+from torch.utils.data import DataLoader
+
+
+class TimedDataLoader(DataLoader):
+    """
+    DataLoader measuring the time spent before the first batch of each iteration.
+
+    This start-up time includes the start of the workers and the copy of the dataset
+    in each of them, unless the workers are persistent and already running.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.startup_time = 0.0
+
+    def __iter__(self) -> Iterator[Any]:
+        start = perf_counter()
+        first_batch = True
+        for batch in super().__iter__():
+            if first_batch:
+                self.startup_time += perf_counter() - start
+                first_batch = False
+            yield batch
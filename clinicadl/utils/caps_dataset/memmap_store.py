@@ -0,0 +1,244 @@
+# coding: utf8
+
+"""
+Consolidated storage of the tensors extracted by prepare_data.
+
+All the tensors of one extraction are concatenated in a single raw file, described
+by a TSV index giving the offset, the shape and the quantization parameters of each
+tensor. Float32 tensors are then read as zero-copy views of a memory-mapped array.
+"""
+
+import os
+import shutil
+from logging import getLogger
+from os import path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+
+from clinicadl.utils.caps_dataset.quantization import (
+    check_tensor_dtype,
+    decode_tensor,
+    encode_tensor,
+    from_numpy,
+    get_numpy_dtype,
+    to_numpy,
+)
+from clinicadl.utils.exceptions import ClinicaDLArgumentError
+
+logger = getLogger("clinicadl.memmap_store")
+
+DATA_FILENAME = "tensors.dat"
+INDEX_FILENAME = "index.tsv"
+
+
+def get_store_dir(
+    caps_directory: str, extract_json: str, tensor_format: str = "memmap"
+) -> str:
+    """
+    Gives the folder of the store corresponding to an extraction.
+
+    Args:
+        caps_directory: path to the CAPS directory.
+        extract_json: name of the JSON file describing the extraction.
+        tensor_format: format of the store (memmap or chunked).
+    Returns:
+        path to the folder of the store.
+    """
+    store_name = path.splitext(extract_json)[0]
+    return path.join(
+        caps_directory, "tensor_extraction", f"{store_name}_{tensor_format}"
+    )
+
+
+class MemmapStore:
+    """
+    Read access to the tensors of a store.
+
+    The memory map is opened lazily so that each DataLoader worker opens its own
+    map instead of receiving a copy of the data.
+    """
+
+    def __init__(self, store_dir: str):
+        """
+        Args:
+            store_dir: path to the folder of the store.
+        Raises:
+            FileNotFoundError: if the store does not exist.
+        """
+        self.store_dir = store_dir
+        self.data_path = path.join(store_dir, DATA_FILENAME)
+        index_path = path.join(store_dir, INDEX_FILENAME)
+        if not path.isfile(self.data_path) or not path.isfile(index_path):
+            raise FileNotFoundError(
+                f"No tensor store was found at {store_dir}. "
+                f"Please run prepare_data with the memmap format first."
+            )
+
+        index_df = pd.read_csv(index_path, sep="\t")
+        # Stores written before reduced-precision storage only contain float32 tensors
+        if "dtype" in index_df.columns:
+            self.tensor_dtype = index_df.dtype.iloc[0]
+        else:
+            self.tensor_dtype = "float32"
+            index_df["quant_scale"] = 1.0
+            index_df["quant_offset"] = 0.0
+        shapes = [
+            tuple(int(dim) for dim in shape.split("x")) for shape in index_df["shape"]
+        ]
+        self._index: Dict[
+            Tuple[str, str, int], Tuple[int, Tuple[int, ...], float, float]
+        ] = dict(
+            zip(
+                zip(
+                    index_df.participant_id,
+                    index_df.session_id,
+                    index_df.elem_index.astype(int),
+                ),
+                zip(
+                    index_df.offset.astype(int),
+                    shapes,
+                    index_df.quant_scale.astype(float),
+                    index_df.quant_offset.astype(float),
+                ),
+            )
+        )
+        self._n_elem = index_df.groupby(["participant_id", "session_id"]).size()
+        self._data = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_data"] = None
+        return state
+
+    def get(self, participant: str, session: str, elem_index: int = 0) -> torch.Tensor:
+        """
+        Returns a tensor of the store.
+
+        Args:
+            participant: ID of the participant.
+            session: ID of the session.
+            elem_index: position of the element in the extraction order of the image
+                (0 for whole images).
+        Returns:
+            the float32 tensor. For float32 stores, it is a view of the memory-mapped file
+            and pages are copied only if the tensor is modified in-place.
+        Raises:
+            KeyError: if the element is not in the store.
+        """
+        if self._data is None:
+            self._data = np.memmap(
+                self.data_path, dtype=get_numpy_dtype(self.tensor_dtype), mode="c"
+            )
+
+        key = (participant, session, elem_index)
+        if key not in self._index:
+            raise KeyError(
+                f"Element {elem_index} of ({participant} | {session}) "
+                f"was not found in the tensor store {self.store_dir}."
+            )
+        offset, shape, quant_scale, quant_offset = self._index[key]
+        array = self._data[offset : offset + int(np.prod(shape))].reshape(shape)
+        return decode_tensor(
+            from_numpy(array, self.tensor_dtype), quant_scale, quant_offset
+        )
+
+    def num_elem(self, participant: str, session: str) -> int:
+        """Gives the number of elements stored for an image."""
+        return int(self._n_elem.loc[(participant, session)])
+
+
+class MemmapStoreWriter:
+    """
+    Appends tensors to a new store. The index is written when the writer is closed.
+    """
+
+    def __init__(self, store_dir: str, tensor_dtype: str = "float32"):
+        """
+        Args:
+            store_dir: path to the folder of the store.
+            tensor_dtype: storage dtype of the tensors (see quantization.TENSOR_DTYPES).
+        Raises:
+            ClinicaDLArgumentError: if a store already exists at this location.
+        """
+        if path.exists(store_dir):
+            raise ClinicaDLArgumentError(
+                f"A tensor store already exists at {store_dir}. "
+                f"Please choose another name for your preprocessing file."
+            )
+        check_tensor_dtype(tensor_dtype)
+        os.makedirs(store_dir)
+        self.store_dir = store_dir
+        self.tensor_dtype = tensor_dtype
+        self._file = open(path.join(store_dir, DATA_FILENAME), "wb")
+        self._offset = 0
+        self._rows: List[List] = list()
+
+    def __enter__(self) -> "MemmapStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # A partial store would prevent extracting again with the same name
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def write(self, participant: str, session: str, tensors: Sequence[torch.Tensor]):
+        """
+        Appends all the tensors extracted from one image.
+
+        Args:
+            participant: ID of the participant.
+            session: ID of the session.
+            tensors: tensors extracted from the image, in extraction order.
+        """
+        for elem_index, tensor in enumerate(tensors):
+            encoded_tensor, quant_scale, quant_offset = encode_tensor(
+                tensor, self.tensor_dtype
+            )
+            array = np.ascontiguousarray(to_numpy(encoded_tensor))
+            self._file.write(array.tobytes())
+            self._rows.append(
+                [
+                    participant,
+                    session,
+                    elem_index,
+                    self._offset,
+                    "x".join(str(dim) for dim in array.shape),
+                    quant_scale,
+                    quant_offset,
+                    self.tensor_dtype,
+                ]
+            )
+            self._offset += array.size
+
+    def abort(self):
+        """Closes the data file and removes the store, without writing the index."""
+        self._file.close()
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+
+    def close(self):
+        """Closes the data file and writes the index."""
+        if self._file.closed:
+            return
+        self._file.close()
+        index_df = pd.DataFrame(
+            self._rows,
+            columns=[
+                "participant_id",
+                "session_id",
+                "elem_index",
+                "offset",
+                "shape",
+                "quant_scale",
+                "quant_offset",
+                "dtype",
+            ],
+        )
+        index_df.to_csv(
+            path.join(self.store_dir, INDEX_FILENAME), sep="\t", index=False
+        )
+        logger.debug(f"{len(index_df)} tensors saved in {self.store_dir}.")
@@ -0,0 +1,70 @@
+# coding: utf8
+
+"""
+Resolution pyramid of the images extracted by prepare_data.
+
+Each level halves the resolution of the previous one by averaging blocks of 2x2x2 voxels,
+so that level l has 8^l times fewer voxels than the original image (level 0). Voxels at
+the end of dimensions of odd size are averaged with the voxels available.
+Levels are written next to the image: in files suffixed with the level in the pt format,
+and as the following elements of the image in tensor stores.
+"""
+
+from os import path
+from typing import List, Tuple
+
+import torch
+import torch.nn.functional as F
+
+PYRAMID_FACTOR = 2
+
+BoundingBox = Tuple[Tuple[int, int], ...]
+
+
+def compute_pyramid(image_tensor: torch.Tensor, n_levels: int) -> List[torch.Tensor]:
+    """
+    Args:
+        image_tensor: image of shape C * D * H * W, without NaN values.
+        n_levels: number of levels computed after the original image.
+    Returns:
+        the images of levels 1 to n_levels.
+    """
+    levels = list()
+    level_tensor = image_tensor.unsqueeze(0)
+    for _ in range(n_levels):
+        # Repeating the last voxels of odd dimensions leaves the average of the voxels
+        # available, also for dimensions of size 1
+        padding = [
+            (-dim_size) % PYRAMID_FACTOR
+            for dim_size in reversed(level_tensor.shape[2:])
+        ]
+        level_tensor = F.pad(
+            level_tensor,
+            [size for dim_padding in padding for size in (0, dim_padding)],
+            mode="replicate",
+        )
+        level_tensor = F.avg_pool3d(level_tensor, PYRAMID_FACTOR, PYRAMID_FACTOR)
+        levels.append(level_tensor[0])
+    return levels
+
+
+def get_level_shape(image_shape: Tuple[int, ...], level: int) -> Tuple[int, ...]:
+    """Gives the shape of a level from the shape C * D * H * W of the original image."""
+    factor = PYRAMID_FACTOR**level
+    return (image_shape[0],) + tuple(
+        -(-dim_size // factor) for dim_size in image_shape[1:]
+    )
+
+
+def get_level_path(tensor_path: str, level: int) -> str:
+    """Gives the path to the tensor (*.pt) of a level from the path to the original image."""
+    if level == 0:
+        return tensor_path
+    root, ext = path.splitext(tensor_path)
+    return f"{root}_level-{level}{ext}"
+
+
+def scale_bounding_box(bounding_box: BoundingBox, level: int) -> BoundingBox:
+    """Gives the smallest box of a level containing a box of the original image."""
+    factor = PYRAMID_FACTOR**level
+    return tuple((start // factor, -(-end // factor)) for start, end in bounding_box)
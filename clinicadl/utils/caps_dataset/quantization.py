@@ -0,0 +1,180 @@
+# coding: utf8
+
+"""
+Reduced-precision storage of the tensors extracted by prepare_data.
+
+Tensors can be stored as float16 or bfloat16, or quantized on 8 or 16 bits with a
+scale and an offset computed for each stored tensor:
+
+    tensor = quantized_tensor * scale + offset
+
+As unsigned 16-bit tensors are not supported by PyTorch, uint16 tensors are stored
+as int16 values shifted by 2**15, the shift being included in the offset.
+
+The scale and the offset are computed with the finite values of the tensor. The highest
+quantized value encodes NaN values, and infinite values are clipped to the range of
+the finite values.
+"""
+
+from typing import Tuple
+
+import numpy as np
+import torch
+
+from clinicadl.utils.exceptions import ClinicaDLArgumentError
+
+TENSOR_DTYPES = ("float32", "float16", "bfloat16", "uint8", "uint16")
+FLOAT_DTYPES = {
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+}
+QUANTIZED_DTYPES = {
+    "uint8": (torch.uint8, 2**8, 0),
+    "uint16": (torch.int16, 2**16, 2**15),
+}
+
+
+def check_tensor_dtype(tensor_dtype: str):
+    """Raises a ClinicaDLArgumentError if tensor_dtype cannot be used to store tensors."""
+    if tensor_dtype not in TENSOR_DTYPES:
+        raise ClinicaDLArgumentError(
+            f"Tensor dtype {tensor_dtype} is not implemented. "
+            f"Please choose between {', '.join(TENSOR_DTYPES)}."
+        )
+
+
+def encode_tensor(
+    tensor: torch.Tensor, tensor_dtype: str = "float32"
+) -> Tuple[torch.Tensor, float, float]:
+    """
+    Converts a float32 tensor to its storage dtype.
+
+    Args:
+        tensor: tensor to encode.
+        tensor_dtype: storage dtype (see TENSOR_DTYPES).
+    Returns:
+        the encoded tensor, the scale and the offset used to decode it.
+    Raises:
+        ClinicaDLArgumentError: if the tensor contains values out of the range of float16.
+    """
+    check_tensor_dtype(tensor_dtype)
+    if tensor_dtype == "float16":
+        finite_values = tensor[torch.isfinite(tensor)]
+        max_value = torch.finfo(torch.float16).max
+        if finite_values.numel() > 0 and finite_values.abs().max() > max_value:
+            raise ClinicaDLArgumentError(
+                f"The tensor contains values larger than {max_value} in absolute value, "
+                f"which cannot be stored as float16. Please choose another tensor dtype, "
+                f"for example bfloat16."
+            )
+    if tensor_dtype in FLOAT_DTYPES:
+        return tensor.to(FLOAT_DTYPES[tensor_dtype]), 1.0, 0.0
+
+    dtype, n_levels, shift = QUANTIZED_DTYPES[tensor_dtype]
+    tensor = tensor.float()
+    finite_values = tensor[torch.isfinite(tensor)]
+    if finite_values.numel() > 0:
+        min_value = finite_values.min().item()
+        max_value = finite_values.max().item()
+    else:
+        min_value, max_value = 0.0, 0.0
+    # The last level is kept for NaN values
+    scale = (max_value - min_value) / (n_levels - 2)
+    if scale == 0:
+        scale = 1.0
+    quantized_tensor = torch.round((tensor - min_value) / scale).clamp_(0, n_levels - 2)
+    quantized_tensor.masked_fill_(torch.isnan(tensor), n_levels - 1)
+    encoded_tensor = (quantized_tensor - shift).to(dtype)
+    return encoded_tensor, scale, min_value + shift * scale
+
+
+def decode_tensor(
+    tensor: torch.Tensor, scale: float = 1.0, offset: float = 0.0
+) -> torch.Tensor:
+    """
+    Converts a stored tensor back to float32.
+
+    Args:
+        tensor: encoded tensor.
+        scale: scale of the quantization.
+        offset: offset of the quantization.
+    Returns:
+        the float32 tensor. Float32 tensors are returned as is.
+    """
+    if tensor.dtype == torch.float32:
+        return tensor
+    elif tensor.is_floating_point():
+        return tensor.float()
+    nan_mask = tensor == torch.iinfo(tensor.dtype).max
+    return tensor.float().mul_(scale).add_(offset).masked_fill_(nan_mask, float("nan"))
+
+
+def save_tensor(tensor: torch.Tensor, tensor_path: str, tensor_dtype: str = "float32"):
+    """
+    Saves a tensor in the .pt format with the given storage dtype.
+
+    Float tensors are saved directly, quantized tensors are saved in a dictionary
+    with their scale and offset.
+
+    Args:
+        tensor: float32 tensor to save.
+        tensor_path: path to the output file (*.pt).
+        tensor_dtype: storage dtype (see TENSOR_DTYPES).
+    """
+    encoded_tensor, scale, offset = encode_tensor(tensor, tensor_dtype)
+    if tensor_dtype in QUANTIZED_DTYPES:
+        torch.save(
+            {"tensor": encoded_tensor, "scale": scale, "offset": offset}, tensor_path
+        )
+    else:
+        torch.save(encoded_tensor, tensor_path)
+
+
+def load_tensor(tensor_path: str) -> torch.Tensor:
+    """
+    Loads a tensor saved by save_tensor and converts it to float32.
+
+    Args:
+        tensor_path: path to the tensor (*.pt).
+    Returns:
+        the float32 tensor.
+    """
+    stored = torch.load(tensor_path)
+    if isinstance(stored, dict):
+        return decode_tensor(stored["tensor"], stored["scale"], stored["offset"])
+    return decode_tensor(stored)
+
+
+def to_numpy(encoded_tensor: torch.Tensor) -> np.ndarray:
+    """
+    Converts an encoded tensor to a numpy array. As numpy has no bfloat16 type,
+    bfloat16 tensors are converted to the uint16 array of their upper 16 bits.
+    """
+    if encoded_tensor.dtype == torch.bfloat16:
+        float_array = encoded_tensor.float().numpy()
+        return (float_array.view(np.uint32) >> 16).astype(np.uint16)
+    return encoded_tensor.numpy()
+
+
+def from_numpy(array: np.ndarray, tensor_dtype: str = "float32") -> torch.Tensor:
+    """
+    Converts an array written by to_numpy back to an encoded tensor.
+    Except for bfloat16, the tensor shares the memory of the array.
+    """
+    if tensor_dtype == "bfloat16":
+        float_array = (array.astype(np.uint32) << 16).view(np.float32)
+        return torch.from_numpy(float_array)
+    return torch.from_numpy(array)
+
+
+def get_numpy_dtype(tensor_dtype: str) -> np.dtype:
+    """Gives the dtype of the arrays written by to_numpy for a storage dtype."""
+    check_tensor_dtype(tensor_dtype)
+    if tensor_dtype == "bfloat16":
+        return np.dtype(np.uint16)
+    elif tensor_dtype in QUANTIZED_DTYPES:
+        torch_dtype = QUANTIZED_DTYPES[tensor_dtype][0]
+    else:
+        torch_dtype = FLOAT_DTYPES[tensor_dtype]
+    return np.dtype(torch.empty(0, dtype=torch_dtype).numpy().dtype)
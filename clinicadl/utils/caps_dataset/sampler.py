@@ -0,0 +1,176 @@
+# coding: utf8
+
+from typing import Iterable, Iterator, List, Optional, Sequence, Union
+
+import torch
+from torch.utils.data import RandomSampler, Sampler, WeightedRandomSampler
+
+from clinicadl.utils.exceptions import ClinicaDLArgumentError
+
+
+class ImageGroupedSampler(Sampler):
+    """
+    Samples the elements of a CapsDataset grouped by image.
+
+    The order of the images is shuffled, then the elements of `window` consecutive
+    images are shuffled together. Consecutive indices thus come from a few images only,
+    which can be served by the image cache of the dataset. window=1 yields all the
+    elements of an image in a row, larger windows get closer to uniform random sampling.
+    """
+
+    def __init__(
+        self,
+        n_images: int,
+        elem_per_image: Union[int, Sequence[int]],
+        window: int = 1,
+        generator: Optional[torch.Generator] = None,
+    ):
+        """
+        Args:
+            n_images: number of images in the dataset.
+            elem_per_image: number of elements (patches, slices, regions) per image,
+                or number of elements of each image if they differ between images.
+            window: number of images whose elements are shuffled together.
+            generator: generator used for the random permutations.
+        """
+        if window < 1:
+            raise ClinicaDLArgumentError(
+                f"The window of the grouped sampler must be a positive integer, got {window}."
+            )
+        self.n_images = n_images
+        if isinstance(elem_per_image, int):
+            self.elem_counts = torch.full((n_images,), elem_per_image, dtype=torch.long)
+        else:
+            self.elem_counts = torch.as_tensor(elem_per_image, dtype=torch.long)
+        # Elements of an image are consecutive in the dataset
+        self.elem_offsets = torch.cumsum(self.elem_counts, 0) - self.elem_counts
+        self.window = window
+        self.generator = generator
+
+    def __iter__(self) -> Iterator[int]:
+        image_order = torch.randperm(self.n_images, generator=self.generator)
+        for start in range(0, self.n_images, self.window):
+            images = image_order[start : start + self.window]
+            indices = torch.cat(
+                [
+                    torch.arange(self.elem_counts[image]) + self.elem_offsets[image]
+                    for image in images
+                ]
+            )
+            permutation = torch.randperm(len(indices), generator=self.generator)
+            yield from indices[permutation].tolist()
+
+    def __len__(self) -> int:
+        return int(self.elem_counts.sum())
+
+
+class DistributedSamplerWrapper(Sampler):
+    """
+    Samples the part of the indices of another sampler seen by a process of a distributed
+    training (see clinicadl.utils.distributed).
+
+    The wrapped sampler is iterated with the same random state in all the processes, so
+    that they share the same order of indices and each one takes one index out of
+    num_replicas. With pad=True, indices are repeated so that all the processes get the
+    same number of indices, and thus perform the same number of training steps.
+    """
+
+    def __init__(
+        self,
+        sampler: Iterable[int],
+        num_replicas: int,
+        rank: int,
+        seed: int = 0,
+        pad: bool = True,
+    ):
+        """
+        Args:
+            sampler: sampler wrapped, such as the ones of TaskManager.generate_sampler,
+                or sequence of indices.
+            num_replicas: number of processes of the distributed training.
+            rank: rank of the process.
+            seed: seed of the random state of the wrapped sampler, incremented at each epoch.
+            pad: If True all the processes get the same number of indices.
+        """
+        self.sampler = sampler
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.pad = pad
+        self.epoch = 0
+
+    def __iter__(self) -> Iterator[int]:
+        with torch.random.fork_rng(devices=[]):
+            torch.manual_seed(self.seed + self.epoch)
+            indices = list(self.sampler)
+        self.epoch += 1
+        if self.pad and len(indices) > 0:
+            indices = (indices * self.num_replicas)[: self._padded_size(len(indices))]
+        yield from indices[self.rank :: self.num_replicas]
+
+    def _padded_size(self, n_indices: int) -> int:
+        return -(-n_indices // self.num_replicas) * self.num_replicas
+
+    def __len__(self) -> int:
+        n_indices = len(self.sampler)
+        if self.pad:
+            return self._padded_size(n_indices) // self.num_replicas
+        return len(range(self.rank, n_indices, self.num_replicas))
+
+
+class ImageBatchSampler(Sampler):
+    """
+    Samples batches made of all the elements of a few images, image by image and in the
+    order of the elements, as expected by clinicadl.utils.network.multi_network.MultiCNN.
+    Images must have the same number of elements.
+    """
+
+    def __init__(
+        self, image_sampler: Iterable[int], elem_per_image: int, images_per_batch: int
+    ):
+        """
+        Args:
+            image_sampler: sampler of the indices of the images (see get_image_sampler),
+                or sequence of indices.
+            elem_per_image: number of elements (patches, slices, regions) per image.
+            images_per_batch: number of images in a batch (the last one may have fewer).
+        """
+        self.image_sampler = image_sampler
+        self.elem_per_image = elem_per_image
+        self.images_per_batch = images_per_batch
+
+    def __iter__(self) -> Iterator[List[int]]:
+        batch = list()
+        for image in self.image_sampler:
+            first_elem = int(image) * self.elem_per_image
+            batch += range(first_elem, first_elem + self.elem_per_image)
+            if len(batch) == self.images_per_batch * self.elem_per_image:
+                yield batch
+                batch = list()
+        if len(batch) > 0:
+            yield batch
+
+    def __len__(self) -> int:
+        return -(-len(self.image_sampler) // self.images_per_batch)
+
+
+def get_image_sampler(sampler: Sampler, elem_per_image: int) -> Sampler:
+    """
+    Gives the sampler of the images corresponding to a sampler of their elements, such as
+    the ones of TaskManager.generate_sampler. The elements of an image share the same label,
+    and thus the same weight: weighted samplers draw images with the weight of their elements,
+    the others draw a random permutation of the images.
+
+    Args:
+        sampler: sampler of the elements of a dataset with elem_per_image elements per image.
+        elem_per_image: number of elements (patches, slices, regions) per image.
+    Returns:
+        the sampler of the indices of the images.
+    """
+    if isinstance(sampler, WeightedRandomSampler):
+        return WeightedRandomSampler(
+            sampler.weights[::elem_per_image],
+            sampler.num_samples // elem_per_image,
+            replacement=sampler.replacement,
+        )
+    return RandomSampler(range(len(sampler) // elem_per_image))
@@ -0,0 +1,109 @@
+# coding: utf8
+
+import os
+from logging import getLogger
+from typing import Dict, Optional
+
+import torch
+
+logger = getLogger("clinicadl.shared_cache")
+
+# Tensors are packed in a few large shared blocks instead of one shared segment per
+# tensor, which would exhaust file descriptors with millions of patches. Blocks have
+# the dtype of the tensors they store, as PyTorch < 1.11 cannot view a block of bytes
+# as another dtype.
+BLOCK_SIZE = 256 * 2**20
+ALIGNMENT = 64
+SHM_DIRECTORY = "/dev/shm"
+
+
+class SharedTensorCache:
+    """
+    Tensors loaded once in shared memory, within a memory budget.
+
+    The cache must be filled before the DataLoader workers are started: the workers then
+    index into the same memory pages instead of reading the tensors from disk.
+    """
+
+    def __init__(self, max_size: float):
+        """
+        Args:
+            max_size: maximum memory occupied by the cache (in MB).
+        """
+        self.max_size = int(max_size * 2**20)
+        self.size = 0
+        self.full = False
+        # Block being filled for each dtype, and its first free element
+        self._blocks: Dict[torch.dtype, torch.Tensor] = dict()
+        self._block_offsets: Dict[torch.dtype, int] = dict()
+        self._tensors: Dict[str, torch.Tensor] = dict()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._tensors
+
+    def __len__(self) -> int:
+        return len(self._tensors)
+
+    def get(self, key: str) -> Optional[torch.Tensor]:
+        """
+        Args:
+            key: key of the tensor (usually its path).
+        Returns:
+            the tensor stored in shared memory, or None if it is not in the cache.
+            It is shared by all the workers and must not be modified in-place.
+        """
+        return self._tensors.get(key)
+
+    def add(self, key: str, tensor: torch.Tensor) -> bool:
+        """
+        Copies a tensor in shared memory.
+
+        Args:
+            key: key of the tensor (usually its path).
+            tensor: tensor to store.
+        Returns:
+            True if the tensor was stored, False if the memory budget is exhausted.
+        """
+        if key in self._tensors:
+            return True
+        if self.full:
+            return False
+
+        dtype, n_elem = tensor.dtype, tensor.nelement()
+        alignment = max(1, ALIGNMENT // tensor.element_size())
+        aligned_n_elem = -(-n_elem // alignment) * alignment
+        block = self._blocks.get(dtype)
+        if block is None or self._block_offsets[dtype] + n_elem > len(block):
+            if not self._allocate_block(dtype, aligned_n_elem):
+                self.full = True
+                return False
+            block = self._blocks[dtype]
+
+        offset = self._block_offsets[dtype]
+        shared_tensor = block[offset : offset + n_elem].view(tensor.shape)
+        shared_tensor.copy_(tensor)
+        self._tensors[key] = shared_tensor
+        self._block_offsets[dtype] = offset + aligned_n_elem
+        return True
+
+    def _allocate_block(self, dtype: torch.dtype, min_n_elem: int) -> bool:
+        """Allocates a new shared block of dtype able to store at least min_n_elem elements."""
+        element_size = torch.empty(0, dtype=dtype).element_size()
+        min_size = min_n_elem * element_size
+        block_size = min(max(BLOCK_SIZE, min_size), self.max_size - self.size)
+        if block_size < min_size:
+            return False
+        if os.path.isdir(SHM_DIRECTORY):
+            shm_stats = os.statvfs(SHM_DIRECTORY)
+            if block_size > shm_stats.f_bavail * shm_stats.f_frsize:
+                logger.warning(
+                    f"Not enough space left in {SHM_DIRECTORY} to extend the shared cache. "
+                    f"The remaining tensors will be read from disk."
+                )
+                return False
+
+        n_elem = block_size // element_size
+        self._blocks[dtype] = torch.empty(n_elem, dtype=dtype).share_memory_()
+        self._block_offsets[dtype] = 0
+        self.size += n_elem * element_size
+        return True
@@ -119,6 +119,71 @@ extract_json = click.option(
     help="Name of the JSON file created to describe the tensor extraction. "
     "Default will use format extract_{time_stamp}.json",
 )
+tensor_format = click.option(
+    "--format",
+    "tensor_format",
+    type=click.Choice(["pt", "memmap", "chunked"]),
+    default="pt",
+    show_default=True,
+    help="Format of the extracted tensors. `pt` saves one PyTorch file per tensor in the "
+    "subjects folders, `memmap` gathers all the tensors in a single file read with memory mapping, "
+    "`chunked` gathers all the tensors in a single file compressed image by image.",
+)
+n_decoders = click.option(
+    "--n_decoders",
+    type=int,
+    default=2,
+    show_default=True,
+    help="Number of threads decoding NifTi images. Images are then split by `n_proc` threads.",
+)
+n_writers = click.option(
+    "--n_writers",
+    type=int,
+    default=4,
+    show_default=True,
+    help="Number of threads writing the extracted tensors (only used with the pt format).",
+)
+prenormalize = click.option(
+    "--prenormalize",
+    type=click.Choice(["image", "element"]),
+    default=None,
+    help="Writes tensors without NaN values and min-max normalized with the statistics of "
+    "their whole image (`image`) or of each tensor (`element`), so that training skips "
+    "the normalization. Default will write the original values.",
+)
+foreground_threshold = click.option(
+    "--foreground_threshold",
+    type=float,
+    default=None,
+    help="Records the foreground of each image: images are cropped to the bounding box of "
+    "the foreground and only the patches with at least this fraction of foreground voxels "
+    "are used by datasets. Default will use the whole images and all the patches.",
+)
+pyramid_levels = click.option(
+    "--pyramid_levels",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help="Number of downsampled versions of the images written after them, each level "
+    "halving the resolution of the previous one. Only used when whole images are written.",
+)
+nifti_cache = click.option(
+    "--nifti_cache",
+    type=click.Path(file_okay=False, resolve_path=True),
+    default=None,
+    help="Folder in which decoded NifTi volumes are cached, "
+    "so that each image is decompressed only once across extractions.",
+)
+tensor_dtype = click.option(
+    "--dtype",
+    "tensor_dtype",
+    type=click.Choice(["float32", "float16", "bfloat16", "uint8", "uint16"]),
+    default="float32",
+    show_default=True,
+    help="Storage type of the extracted tensors. `float16` and `bfloat16` halve the size of the "
+    "tensors, `uint8` and `uint16` quantize each tensor with its own scale and offset. "
+    "Tensors are converted back to float32 when they are loaded.",
+)
 
 use_uncropped_image = click.option(
     "-uui",
@@ -10,6 +10,9 @@ model_group = OptionGroup(
     "Model options", help="Options allowing to choose the network trained."
 )
 data_group = OptionGroup("Data management", help="Options related to data management.")
+data_pipeline_group = OptionGroup(
+    "Data pipeline", help="Options of the DataLoaders feeding the network."
+)
 cross_validation = OptionGroup(
     "Validation setup", help="Allow to choose the validation framework to use."
 )
@@ -0,0 +1,174 @@
+# coding: utf8
+
+"""
+Data-parallel training in several processes of the same machine.
+
+Each process trains a replica of the model on its own part of the batches with
+torch DistributedDataParallel, which averages the gradients of the replicas after each
+backward pass. The gloo backend is used, so that the processes can run on CPU-only nodes.
+When no process group is initialized, the functions of this module behave as in a single
+process.
+"""
+
+import logging
+import os
+import socket
+from typing import Any, Callable, List, Sequence
+
+import torch
+import torch.distributed as dist
+from torch import nn
+from torch.nn.parallel import DistributedDataParallel
+
+BACKEND = "gloo"
+MASTER_ADDR = "127.0.0.1"
+
+
+def is_distributed() -> bool:
+    """Returns True if the process belongs to a distributed training."""
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank() -> int:
+    """Gives the rank of the process in the distributed training (0 without it)."""
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    """Gives the number of processes of the distributed training (1 without it)."""
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process() -> bool:
+    """Returns True if the process writes the outputs of the training."""
+    return get_rank() == 0
+
+
+def all_reduce_sum(value: float) -> float:
+    """Sums a value over all the processes."""
+    if not is_distributed():
+        return value
+    value_tensor = torch.tensor([value], dtype=torch.float64)
+    dist.all_reduce(value_tensor, op=dist.ReduceOp.SUM)
+    return float(value_tensor)
+
+
+def all_gather_list(values: List[Any]) -> List[Any]:
+    """Concatenates the lists of objects of all the processes, in the order of their rank."""
+    if not is_distributed():
+        return values
+    gathered_values = [None] * get_world_size()
+    dist.all_gather_object(gathered_values, values)
+    return [value for process_values in gathered_values for value in process_values]
+
+
+class _OutputsAndLoss(nn.Module):
+    def __init__(self, network: nn.Module):
+        super().__init__()
+        self.network = network
+
+    def forward(self, input_dict, criterion, use_labels=True):
+        return self.network.compute_outputs_and_loss(
+            input_dict, criterion, use_labels=use_labels
+        )
+
+
+class DistributedNetwork:
+    """
+    Replica of a Network whose gradients are averaged over the processes of the distributed
+    training during the backward pass of compute_outputs_and_loss.
+
+    The weights are those of the wrapped network, which must be used for all the other
+    operations (evaluation, state dict...).
+    """
+
+    def __init__(self, network: nn.Module):
+        """
+        Args:
+            network: the network trained (see clinicadl.utils.network.network.Network).
+                Its weights are replaced by the ones of the process of rank 0.
+        """
+        self.network = network
+        self.device = network.device
+        self._model = DistributedDataParallel(_OutputsAndLoss(network))
+
+    def compute_outputs_and_loss(self, input_dict, criterion, use_labels=True):
+        return self._model(input_dict, criterion, use_labels=use_labels)
+
+
+def _find_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((MASTER_ADDR, 0))
+        return sock.getsockname()[1]
+
+
+def _run_process(
+    rank: int,
+    function: Callable[..., Any],
+    args: Sequence[Any],
+    world_size: int,
+    master_port: int,
+    gpu_ids: Sequence[str],
+    logging_level: int,
+):
+    os.environ.update(
+        {
+            "MASTER_ADDR": MASTER_ADDR,
+            "MASTER_PORT": str(master_port),
+            "RANK": str(rank),
+            "WORLD_SIZE": str(world_size),
+        }
+    )
+    # Each process uses one of the visible GPUs, chosen before CUDA is initialized
+    if len(gpu_ids) > 0:
+        os.environ["CUDA_VISIBLE_DEVICES"] = gpu_ids[rank % len(gpu_ids)]
+
+    from clinicadl.utils import seed
+    from clinicadl.utils.logger import setup_logging
+
+    seed.global_rank = rank
+    setup_logging(verbose=logging_level <= logging.DEBUG and rank == 0)
+    if rank > 0:
+        logging.getLogger("clinicadl").setLevel(logging.WARNING)
+
+    dist.init_process_group(BACKEND, rank=rank, world_size=world_size)
+    try:
+        function(*args)
+    finally:
+        dist.destroy_process_group()
+
+
+def launch(function: Callable[..., Any], world_size: int, *args):
+    """
+    Runs a function in world_size processes of a distributed training on this machine.
+
+    Args:
+        function: picklable function called as function(*args) in each process.
+        world_size: number of processes.
+        args: arguments of the function.
+    Raises:
+        ProcessRaisedException: if a process raised an exception, once all the processes
+            are stopped.
+    """
+    from torch.multiprocessing import spawn
+
+    visible_devices = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible_devices is not None:
+        gpu_ids = [gpu_id for gpu_id in visible_devices.split(",") if gpu_id]
+    else:
+        gpu_ids = [str(gpu_id) for gpu_id in range(torch.cuda.device_count())]
+    logging_level = logging.getLogger("clinicadl").getEffectiveLevel()
+
+    spawn(
+        _run_process,
+        args=(
+            function,
+            args,
+            world_size,
+            _find_free_port(),
+            gpu_ids,
+            logging_level,
+        ),
+        nprocs=world_size,
+        join=True,
+    )
@@ -14,6 +14,21 @@ class StdLevelFilter(logging.Filter):
         return self.err
 
 
+class PrefixFilter(logging.Filter):
+    """Adds a prefix to the messages, for example to identify the process logging them."""
+
+    def __init__(self, prefix: str):
+        super().__init__()
+        self.prefix = prefix
+
+    def filter(self, record):
+        # The same record may go through several handlers
+        if not getattr(record, "prefixed", False):
+            record.msg = f"{self.prefix}{record.msg}"
+            record.prefixed = True
+        return True
+
+
 # Create formatter for console
 class ConsoleFormatter(logging.Formatter):
 
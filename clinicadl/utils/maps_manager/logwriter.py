@@ -17,7 +17,19 @@ class LogWriter:
         resume=False,
         beginning_epoch=0,
         network=None,
+        train_metrics="full",
     ):
+        """
+        Args:
+            maps_path (str): path to the MAPS.
+            evaluation_metrics (List[str]): metrics logged.
+            split (int): index of the split trained.
+            resume (bool): If True the logs of the previous epochs are kept.
+            beginning_epoch (int): epoch at which training begins.
+            network (int): index of the network trained (used in multi-network setting only).
+            train_metrics (str): method used to compute the metrics on the training set
+                (full, running or subset), recorded in each row.
+        """
         from time import time
 
         from torch.utils.tensorboard import SummaryWriter
@@ -29,10 +41,15 @@ class LogWriter:
         columns_valid = [
             selection.split("-")[0] + "_valid" for selection in evaluation_metrics
         ]
-        self.columns = ["epoch", "iteration", "time"] + columns_train + columns_valid
+        self.columns = (
+            ["epoch", "iteration", "time", "train_metrics"]
+            + columns_train
+            + columns_valid
+        )
 
         self.evaluation_metrics = evaluation_metrics
         self.maps_path = maps_path
+        self.train_metrics = train_metrics
 
         self.file_dir = path.join(self.maps_path, f"split-{split}", "training_logs")
         if network is not None:
@@ -53,6 +70,9 @@ class LogWriter:
                     f"{self.maps_path} does not exist."
                 )
             truncated_tsv = pd.read_csv(tsv_path, sep="\t")
+            # Logs written before the choice of the method always used the full training set
+            if "train_metrics" not in truncated_tsv.columns:
+                truncated_tsv.insert(3, "train_metrics", "full")
             truncated_tsv.set_index(["epoch", "iteration"], inplace=True)
             truncated_tsv.drop(self.beginning_epoch, level=0, inplace=True)
             if len(truncated_tsv) == 0:
@@ -85,7 +105,7 @@ class LogWriter:
         tsv_path = path.join(self.file_dir, "training.tsv")
 
         t_current = time() - self.beginning_time
-        general_row = [epoch, i, t_current]
+        general_row = [epoch, i, t_current, self.train_metrics]
         train_row = list()
         valid_row = list()
         for selection in self.evaluation_metrics:
@@ -2,22 +2,41 @@ import json
 import os
 import shutil
 import subprocess
+from copy import copy
 from datetime import datetime
 from glob import glob
 from logging import getLogger
 from os import listdir, makedirs, path
 from typing import Any, Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 import torch
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Sampler
 
 from clinicadl.utils.caps_dataset.data import (
+    BatchAugmentation,
+    CapsDataset,
     get_transforms,
     load_data_test,
     return_dataset,
 )
+from clinicadl.utils.caps_dataset.loader import TimedDataLoader
+from clinicadl.utils.caps_dataset.sampler import (
+    DistributedSamplerWrapper,
+    ImageBatchSampler,
+    get_image_sampler,
+)
+from clinicadl.utils.caps_dataset.shared_cache import SharedTensorCache
 from clinicadl.utils.cmdline_utils import check_gpu
+from clinicadl.utils.distributed import (
+    DistributedNetwork,
+    get_rank,
+    get_world_size,
+    is_distributed,
+    is_main_process,
+    launch,
+)
 from clinicadl.utils.early_stopping import EarlyStopping
 from clinicadl.utils.exceptions import (
     ClinicaDLArgumentError,
@@ -25,15 +44,22 @@ from clinicadl.utils.exceptions import (
     ClinicaDLDataLeakageError,
     MAPSError,
 )
-from clinicadl.utils.logger import setup_logging
+from clinicadl.utils.logger import PrefixFilter, setup_logging
 from clinicadl.utils.maps_manager.logwriter import LogWriter
 from clinicadl.utils.maps_manager.maps_manager_utils import (
     add_default_values,
     read_json,
 )
 from clinicadl.utils.metric_module import RetainBest
+from clinicadl.utils.network.mixed_precision import (
+    autocast,
+    compute_outputs_and_loss,
+    get_grad_scaler,
+)
+from clinicadl.utils.network.multi_network import MultiCNN
 from clinicadl.utils.network.network import Network
 from clinicadl.utils.seed import get_seed, pl_worker_init_function, seed_everything
+from clinicadl.utils.task_manager.task_manager import RunningMetrics
 
 logger = getLogger("clinicadl.maps_manager")
 
@@ -133,10 +159,7 @@ class MapsManager:
                 f"specify a list of splits not intersecting the previous list, "
                 f"or use overwrite to erase previously trained splits."
             )
-        if self.multi_network:
-            self._train_multi(split_list, resume=False)
-        else:
-            self._train_single(split_list, resume=False)
+        self._launch_training(split_list, resume=False)
 
     def resume(self, split_list: List[int] = None):
         """
@@ -164,10 +187,7 @@ class MapsManager:
                 f"Please try train command on these splits and resume only others."
             )
 
-        if self.multi_network:
-            self._train_multi(split_list, resume=True)
-        else:
-            self._train_single(split_list, resume=True)
+        self._launch_training(split_list, resume=True)
 
     def predict(
         self,
@@ -218,6 +238,7 @@ class MapsManager:
 
         _, all_transforms = get_transforms(
             normalize=self.normalize,
+            normalization_scope=self.normalization_scope,
             data_augmentation=self.data_augmentation,
         )
 
@@ -274,14 +295,13 @@ class MapsManager:
                         if label_code == "default"
                         else label_code,
                         cnn_index=network,
+                        image_cache_size=self.image_cache_size,
                     )
                     test_loader = DataLoader(
                         data_test,
-                        batch_size=batch_size
-                        if batch_size is not None
-                        else self.batch_size,
+                        batch_size=self._get_evaluation_batch_size(batch_size),
                         shuffle=False,
-                        num_workers=n_proc if n_proc is not None else self.n_proc,
+                        **self._get_dataloader_options(n_proc),
                     )
                     self._test_loader(
                         test_loader,
@@ -323,15 +343,14 @@ class MapsManager:
                     label_code=self.label_code
                     if label_code == "default"
                     else label_code,
+                    image_cache_size=self.image_cache_size,
                 )
 
                 test_loader = DataLoader(
                     data_test,
-                    batch_size=batch_size
-                    if batch_size is not None
-                    else self.batch_size,
+                    batch_size=self._get_evaluation_batch_size(batch_size),
                     shuffle=False,
-                    num_workers=n_proc if n_proc is not None else self.n_proc,
+                    **self._get_dataloader_options(n_proc),
                 )
                 self._test_loader(
                     test_loader,
@@ -429,6 +448,7 @@ class MapsManager:
 
         _, all_transforms = get_transforms(
             normalize=self.normalize,
+            normalization_scope=self.normalization_scope,
             data_augmentation=self.data_augmentation,
         )
 
@@ -456,12 +476,13 @@ class MapsManager:
                 label_presence=False,
                 label_code=self.label_code,
                 label=self.label,
+                image_cache_size=self.image_cache_size,
             )
             test_loader = DataLoader(
                 data_test,
-                batch_size=batch_size if batch_size is not None else self.batch_size,
+                batch_size=self._get_evaluation_batch_size(batch_size),
                 shuffle=False,
-                num_workers=n_proc if n_proc is not None else self.n_proc,
+                **self._get_dataloader_options(n_proc),
             )
 
             if selection_metrics is None:
@@ -498,11 +519,13 @@ class MapsManager:
 
                 cum_maps = [0] * data_test.elem_per_image
                 for data in test_loader:
-                    images = data["image"].to(model.device)
+                    images = data["image"].to(model.device, non_blocking=True)
 
-                    map_pt = interpreter.generate_gradients(
-                        images, target_node, level=level
-                    )
+                    with autocast(model.device, self.amp):
+                        map_pt = interpreter.generate_gradients(
+                            images, target_node, level=level
+                        )
+                    map_pt = map_pt.float()
                     for i in range(len(data["participant_id"])):
                         mode_id = data[f"{self.mode}_id"][i]
                         cum_maps[mode_id] += map_pt[i]
@@ -523,6 +546,102 @@ class MapsManager:
     ###################################
     # High-level functions templates  #
     ###################################
+    def _launch_training(self, split_list=None, resume=False):
+        """
+        Trains the splits one after the other in this process, in world_size data-parallel
+        processes, or parallel_splits at a time in separate processes.
+
+        Args:
+            split_list (list[int]): list of splits that are trained.
+            resume (bool): If True the job is resumed from checkpoint.
+        """
+        if self.world_size > 1 and not is_distributed():
+            logger.info(f"Training in {self.world_size} data-parallel processes")
+            launch(_train_process, self.world_size, self.maps_path, split_list, resume)
+            return
+
+        splits = list(self._init_split_manager(split_list).split_iterator())
+        if self.parallel_splits > 1 and len(splits) > 1:
+            self._train_parallel_splits(splits, resume=resume)
+            return
+
+        for split in splits:
+            beginning = datetime.now()
+            self._train_split(split, resume=resume)
+            if is_main_process():
+                self._write_split_time(split, beginning, datetime.now(), resume=resume)
+
+    def _train_parallel_splits(self, splits, resume=False):
+        """
+        Trains parallel_splits splits at a time, each one in its own process. The CPU threads
+        and the DataLoader workers are shared between the processes.
+
+        Args:
+            splits (list[int]): list of splits that are trained.
+            resume (bool): If True the job is resumed from checkpoint.
+
+        Raises:
+            MAPSError: if the training of a split failed, once the other splits are trained.
+        """
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        n_processes = min(self.parallel_splits, len(splits))
+        n_threads = max(1, torch.get_num_threads() // n_processes)
+        n_proc = self.n_proc // n_processes
+        if self.n_proc > 0:
+            n_proc = max(1, n_proc)
+        logger.info(
+            f"Training {len(splits)} splits, {n_processes} at a time, with {n_threads} "
+            f"threads and {n_proc} DataLoader workers per split"
+        )
+
+        failed_splits = dict()
+        with ProcessPoolExecutor(
+            n_processes, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = {
+                executor.submit(
+                    _train_split_process,
+                    self.maps_path,
+                    split,
+                    resume,
+                    n_threads,
+                    n_proc,
+                    getLogger("clinicadl").getEffectiveLevel(),
+                ): split
+                for split in splits
+            }
+            for future in as_completed(futures):
+                split = futures[future]
+                try:
+                    beginning, end = future.result()
+                except Exception as error:
+                    logger.error(f"Training of split {split} failed: {error}")
+                    failed_splits[split] = error
+                else:
+                    logger.info(f"Split {split} was trained in {end - beginning}")
+                    self._write_split_time(split, beginning, end, resume=resume)
+
+        if len(failed_splits) > 0:
+            raise MAPSError(
+                f"Training of splits {sorted(failed_splits)} failed. "
+                f"Other splits were trained."
+            ) from next(iter(failed_splits.values()))
+
+    def _train_split(self, split, resume=False):
+        """
+        Trains a single split.
+
+        Args:
+            split (int): index of the split trained.
+            resume (bool): If True the job is resumed from checkpoint.
+        """
+        if self.multi_network:
+            self._train_multi([split], resume=resume)
+        else:
+            self._train_single([split], resume=resume)
+
     def _train_single(self, split_list=None, resume=False):
         """
         Trains a single CNN for all inputs.
@@ -535,7 +654,10 @@ class MapsManager:
 
         train_transforms, all_transforms = get_transforms(
             normalize=self.normalize,
-            data_augmentation=self.data_augmentation,
+            normalization_scope=self.normalization_scope,
+            data_augmentation=None
+            if self.batch_augmentation
+            else self.data_augmentation,
         )
 
         split_manager = self._init_split_manager(split_list)
@@ -555,6 +677,7 @@ class MapsManager:
                 multi_cohort=self.multi_cohort,
                 label=self.label,
                 label_code=self.label_code,
+                image_cache_size=self.image_cache_size,
             )
             logger.debug("Loading validation data...")
             data_valid = return_dataset(
@@ -566,27 +689,24 @@ class MapsManager:
                 multi_cohort=self.multi_cohort,
                 label=self.label,
                 label_code=self.label_code,
+                image_cache_size=self.image_cache_size,
             )
+            self._fill_shared_cache(data_train, data_valid)
 
-            train_sampler = self.task_manager.generate_sampler(data_train, self.sampler)
+            train_sampler = self._generate_train_sampler(data_train)
 
             logger.debug(
                 f"Getting train and validation loader with batch size {self.batch_size}"
             )
-            train_loader = DataLoader(
+            train_loader = TimedDataLoader(
                 data_train,
                 batch_size=self.batch_size,
                 sampler=train_sampler,
-                num_workers=self.n_proc,
+                **self._get_dataloader_options(),
                 worker_init_fn=pl_worker_init_function,
             )
             logger.debug(f"Train loader size is {len(train_loader)}")
-            valid_loader = DataLoader(
-                data_valid,
-                batch_size=self.batch_size,
-                shuffle=False,
-                num_workers=self.n_proc,
-            )
+            valid_loader = self._get_evaluation_loader(data_valid)
             logger.debug(f"Validation loader size is {len(valid_loader)}")
 
             self._train(
@@ -596,18 +716,19 @@ class MapsManager:
                 resume=resume,
             )
 
-            self._ensemble_prediction(
-                "train",
-                split,
-                self.selection_metrics,
-            )
-            self._ensemble_prediction(
-                "validation",
-                split,
-                self.selection_metrics,
-            )
+            if is_main_process():
+                self._ensemble_prediction(
+                    "train",
+                    split,
+                    self.selection_metrics,
+                )
+                self._ensemble_prediction(
+                    "validation",
+                    split,
+                    self.selection_metrics,
+                )
 
-            self._erase_tmp(split)
+                self._erase_tmp(split)
 
     def _train_multi(self, split_list: List[int] = None, resume: bool = False):
         """
@@ -621,7 +742,10 @@ class MapsManager:
 
         train_transforms, all_transforms = get_transforms(
             normalize=self.normalize,
-            data_augmentation=self.data_augmentation,
+            normalization_scope=self.normalization_scope,
+            data_augmentation=None
+            if self.batch_augmentation
+            else self.data_augmentation,
         )
 
         split_manager = self._init_split_manager(split_list)
@@ -631,89 +755,563 @@ class MapsManager:
 
             split_df_dict = split_manager[split]
 
-            first_network = 0
-            if resume:
-                training_logs = [
-                    int(network_folder.split("-")[1])
-                    for network_folder in listdir(
-                        path.join(
-                            self.maps_path,
-                            f"{self.split_name}-{split}",
-                            "training_logs",
-                        )
+            if self.batched_networks:
+                self._train_batched(
+                    split_df_dict, split, train_transforms, all_transforms, resume
+                )
+            else:
+                self._train_networks(
+                    split_df_dict, split, train_transforms, all_transforms, resume
+                )
+
+            if is_main_process():
+                self._ensemble_prediction(
+                    "train",
+                    split,
+                    self.selection_metrics,
+                )
+                self._ensemble_prediction(
+                    "validation",
+                    split,
+                    self.selection_metrics,
+                )
+
+                self._erase_tmp(split)
+
+    def _train_networks(
+        self, split_df_dict, split, train_transforms, all_transforms, resume=False
+    ):
+        """
+        Trains the networks of the multi-network framework one after the other.
+
+        Args:
+            split_df_dict (dict[str, pd.DataFrame]): training and validation meta-data of the split.
+            split (int): Index of the split trained.
+            train_transforms (torchvision.transforms.Compose): transformations applied only to the training set.
+            all_transforms (torchvision.transforms.Compose): transformations applied to all the sets.
+            resume (bool): If True the job is resumed from checkpoint.
+        """
+        first_network = 0
+        if resume:
+            training_logs = [
+                int(network_folder.split("-")[1])
+                for network_folder in listdir(
+                    path.join(
+                        self.maps_path,
+                        f"{self.split_name}-{split}",
+                        "training_logs",
                     )
-                ]
-                first_network = max(training_logs)
-                if not path.exists(path.join(self.maps_path, "tmp")):
-                    first_network += 1
-                    resume = False
+                )
+            ]
+            first_network = max(training_logs)
+            if not path.exists(path.join(self.maps_path, "tmp")):
+                first_network += 1
+                resume = False
 
-            for network in range(first_network, self.num_networks):
-                logger.info(f"Train network {network}")
+        for network in range(first_network, self.num_networks):
+            logger.info(f"Train network {network}")
 
-                data_train = return_dataset(
-                    self.caps_directory,
-                    split_df_dict["train"],
-                    self.preprocessing_dict,
-                    train_transformations=train_transforms,
-                    all_transformations=all_transforms,
-                    multi_cohort=self.multi_cohort,
-                    label=self.label,
-                    label_code=self.label_code,
-                    cnn_index=network,
+            data_train = return_dataset(
+                self.caps_directory,
+                split_df_dict["train"],
+                self.preprocessing_dict,
+                train_transformations=train_transforms,
+                all_transformations=all_transforms,
+                multi_cohort=self.multi_cohort,
+                label=self.label,
+                label_code=self.label_code,
+                cnn_index=network,
+                image_cache_size=self.image_cache_size,
+            )
+            data_valid = return_dataset(
+                self.caps_directory,
+                split_df_dict["validation"],
+                self.preprocessing_dict,
+                train_transformations=train_transforms,
+                all_transformations=all_transforms,
+                multi_cohort=self.multi_cohort,
+                label=self.label,
+                label_code=self.label_code,
+                cnn_index=network,
+                image_cache_size=self.image_cache_size,
+            )
+            self._fill_shared_cache(data_train, data_valid)
+
+            train_sampler = self._generate_train_sampler(data_train)
+
+            train_loader = TimedDataLoader(
+                data_train,
+                batch_size=self.batch_size,
+                sampler=train_sampler,
+                **self._get_dataloader_options(),
+                worker_init_fn=pl_worker_init_function,
+            )
+
+            valid_loader = self._get_evaluation_loader(data_valid)
+
+            self._train(
+                train_loader,
+                valid_loader,
+                split,
+                network,
+                resume=resume,
+            )
+            resume = False
+
+    def _train_batched(
+        self, split_df_dict, split, train_transforms, all_transforms, resume=False
+    ):
+        """
+        Trains the networks of the multi-network framework together: each image is loaded
+        once per epoch, and its elements go through their networks in a single forward and
+        backward pass (see clinicadl.utils.network.multi_network).
+
+        As in _train, each network is evaluated, selected and saved on its own. Once the early
+        stopping criterion of a network is met, the network is frozen and its checkpoints and
+        logs are not updated anymore. The training stops once all the networks are stopped.
+
+        Args:
+            split_df_dict (dict[str, pd.DataFrame]): training and validation meta-data of the split.
+            split (int): Index of the split trained.
+            train_transforms (torchvision.transforms.Compose): transformations applied only to the training set.
+            all_transforms (torchvision.transforms.Compose): transformations applied to all the sets.
+            resume (bool): If True the job is resumed from the checkpoints.
+        """
+        logger.info(f"Train the {self.num_networks} networks together")
+
+        data_train = return_dataset(
+            self.caps_directory,
+            split_df_dict["train"],
+            self.preprocessing_dict,
+            train_transformations=train_transforms,
+            all_transformations=all_transforms,
+            multi_cohort=self.multi_cohort,
+            label=self.label,
+            label_code=self.label_code,
+            image_cache_size=self.image_cache_size,
+        )
+        data_valid = return_dataset(
+            self.caps_directory,
+            split_df_dict["validation"],
+            self.preprocessing_dict,
+            train_transformations=train_transforms,
+            all_transformations=all_transforms,
+            multi_cohort=self.multi_cohort,
+            label=self.label,
+            label_code=self.label_code,
+            image_cache_size=self.image_cache_size,
+        )
+        self._fill_shared_cache(data_train, data_valid)
+
+        # batch_size is the number of elements given to each network in a batch
+        train_loader = TimedDataLoader(
+            data_train,
+            batch_sampler=ImageBatchSampler(
+                get_image_sampler(
+                    self._generate_train_sampler(data_train), self.num_networks
+                ),
+                self.num_networks,
+                self.batch_size,
+            ),
+            **self._get_dataloader_options(),
+            worker_init_fn=pl_worker_init_function,
+        )
+        logger.debug(f"Train loader size is {len(train_loader)}")
+        train_eval_loader = self._get_evaluation_loader(data_train, batched=True)
+        valid_eval_loader = self._get_evaluation_loader(data_valid, batched=True)
+
+        networks = list()
+        for network in range(self.num_networks):
+            network_model, beginning_epoch = self._init_model(
+                split=split,
+                resume=resume,
+                transfer_path=self.transfer_path,
+                transfer_selection=self.transfer_selection_metric,
+                network=network,
+                checkpoint_filename=f"network-{network}_checkpoint.pth.tar",
+            )
+            networks.append(network_model)
+        model = MultiCNN(networks)
+        criterion = self.task_manager.get_criterion(self.loss)
+        logger.debug(f"Criterion for {self.network_task} is {criterion}")
+        optimizer = self._init_optimizer(model, split=split, resume=resume)
+        scaler = get_grad_scaler(model.device, self.amp)
+
+        model.train()
+        train_loader.dataset.train()
+
+        early_stoppings = [
+            EarlyStopping("min", min_delta=self.tolerance, patience=self.patience)
+            for _ in range(self.num_networks)
+        ]
+        stopped = [False] * self.num_networks
+        log_writers = [
+            LogWriter(
+                self.maps_path,
+                self.task_manager.evaluation_metrics + ["loss"],
+                split,
+                resume=resume,
+                beginning_epoch=beginning_epoch,
+                network=network,
+                train_metrics=self.train_metrics,
+            )
+            for network in range(self.num_networks)
+        ]
+        retain_bests = [
+            RetainBest(selection_metrics=list(self.selection_metrics))
+            for _ in range(self.num_networks)
+        ]
+        epoch = beginning_epoch
+
+        image_cache = data_train.image_cache
+        train_metrics_loader, _ = self._init_train_metrics(
+            train_loader, train_eval_loader
+        )
+        loaders = [train_loader, valid_eval_loader, train_metrics_loader]
+        batch_augmentation = (
+            BatchAugmentation(self.data_augmentation)
+            if self.batch_augmentation
+            else None
+        )
+
+        while epoch < self.epochs and not all(stopped):
+            logger.info(f"Beginning epoch {epoch}.")
+            if image_cache is not None:
+                image_cache.reset_stats()
+
+            model.zero_grad()
+            evaluation_flag, step_flag = True, True
+
+            for i, data in enumerate(train_loader):
+
+                if batch_augmentation is not None:
+                    data["image"] = batch_augmentation(
+                        data["image"].to(model.device, non_blocking=True)
+                    )
+
+                outputs, loss_dict = compute_outputs_and_loss(
+                    model, data, criterion, amp=self.amp
                 )
-                data_valid = return_dataset(
-                    self.caps_directory,
-                    split_df_dict["validation"],
-                    self.preprocessing_dict,
-                    train_transformations=train_transforms,
-                    all_transformations=all_transforms,
-                    multi_cohort=self.multi_cohort,
-                    label=self.label,
-                    label_code=self.label_code,
-                    cnn_index=network,
+                logger.debug(f"Train loss dictionnary {loss_dict}")
+                scaler.scale(loss_dict["loss"]).backward()
+                del outputs, loss_dict
+
+                if (i + 1) % self.accumulation_steps == 0:
+                    step_flag = False
+                    scaler.step(optimizer)
+                    scaler.update()
+                    optimizer.zero_grad()
+
+                    # Evaluate the model only when no gradients are accumulated
+                    if (
+                        self.evaluation_steps != 0
+                        and (i + 1) % self.evaluation_steps == 0
+                    ):
+                        evaluation_flag = False
+
+                        self._evaluate_networks(
+                            model,
+                            train_metrics_loader,
+                            valid_eval_loader,
+                            criterion,
+                            log_writers,
+                            stopped,
+                            epoch,
+                            i,
+                            len(train_loader),
+                        )
+
+                        model.train()
+                        train_loader.dataset.train()
+
+            # If no step has been performed, raise Exception
+            if step_flag:
+                raise Exception(
+                    "The model has not been updated once in the epoch. The accumulation step may be too large."
                 )
 
-                train_sampler = self.task_manager.generate_sampler(
-                    data_train, self.sampler
+            # If no evaluation has been performed, warn the user
+            elif evaluation_flag and self.evaluation_steps != 0:
+                logger.warning(
+                    f"Your evaluation steps {self.evaluation_steps} are too big "
+                    f"compared to the size of the dataset. "
+                    f"The model is evaluated only once at the end epochs."
                 )
 
-                train_loader = DataLoader(
-                    data_train,
-                    batch_size=self.batch_size,
-                    sampler=train_sampler,
-                    num_workers=self.n_proc,
-                    worker_init_fn=pl_worker_init_function,
+            # Update weights one last time if gradients were computed without update
+            if (i + 1) % self.accumulation_steps != 0:
+                scaler.step(optimizer)
+                scaler.update()
+                optimizer.zero_grad()
+
+            if image_cache is not None and image_cache.hit_rate is not None:
+                logger.info(
+                    f"Image cache hit rate is {image_cache.hit_rate:.1%} "
+                    f"at the end of epoch {epoch}"
                 )
 
-                valid_loader = DataLoader(
-                    data_valid,
-                    batch_size=self.batch_size,
-                    shuffle=False,
-                    num_workers=self.n_proc,
+            # Always test the results and save them once at the end of the epoch
+            model.zero_grad()
+            logger.debug(f"Last checkpoint at the end of the epoch {epoch}")
+
+            metrics_valid = self._evaluate_networks(
+                model,
+                train_metrics_loader,
+                valid_eval_loader,
+                criterion,
+                log_writers,
+                stopped,
+                epoch,
+                i,
+                len(train_loader),
+            )
+
+            model.train()
+            train_loader.dataset.train()
+
+            startup_time = sum(loader.startup_time for loader in loaders)
+            logger.info(
+                f"Data loaders spent {startup_time:.1f}s starting their iterations "
+                f"during epoch {epoch}"
+            )
+            for loader in loaders:
+                loader.startup_time = 0.0
+
+            # Save checkpoints and best models of each network still trained
+            for network in range(self.num_networks):
+                if stopped[network]:
+                    continue
+                best_dict = retain_bests[network].step(metrics_valid[network])
+                self._write_weights(
+                    {
+                        "model": model.network_state_dict(network),
+                        "epoch": epoch,
+                        "name": self.architecture,
+                    },
+                    best_dict,
+                    split,
+                    network=network,
+                    filename=f"network-{network}_checkpoint.pth.tar",
+                )
+                stopped[network] = early_stoppings[network].step(
+                    metrics_valid[network]["loss"]
                 )
+                if stopped[network]:
+                    logger.info(f"Network {network} stops training at epoch {epoch}")
+                    model.freeze_network(network)
+            self._write_weights(
+                {
+                    "optimizer": optimizer.state_dict(),
+                    "epoch": epoch,
+                    "name": self.optimizer,
+                },
+                None,
+                split,
+                filename="optimizer.pth.tar",
+            )
 
-                self._train(
-                    train_loader,
-                    valid_loader,
+            epoch += 1
+
+        # The best models of each network are evaluated on its elements
+        for network in range(self.num_networks):
+            for dataset, data_group in [
+                (data_train, "train"),
+                (data_valid, "validation"),
+            ]:
+                self._test_loader(
+                    self._get_evaluation_loader(
+                        dataset,
+                        sampler=list(range(network, len(dataset), self.num_networks)),
+                    ),
+                    criterion,
+                    data_group,
                     split,
-                    network,
-                    resume=resume,
+                    self.selection_metrics,
+                    network=network,
                 )
-                resume = False
 
-            self._ensemble_prediction(
-                "train",
-                split,
-                self.selection_metrics,
+    def _evaluate_networks(
+        self,
+        model,
+        train_metrics_loader,
+        valid_loader,
+        criterion,
+        log_writers,
+        stopped,
+        epoch,
+        i,
+        n_batches,
+    ):
+        """
+        Evaluates the networks trained together on the training and validation sets, and logs
+        the metrics of the networks still trained (see _train_batched).
+
+        Args:
+            model (MultiCNN): the networks trained together.
+            train_metrics_loader (torch.utils.data.DataLoader): DataLoader of the training set evaluated.
+            valid_loader (torch.utils.data.DataLoader): DataLoader of the validation set.
+            criterion (torch.nn.modules.loss._Loss): optimization criterion.
+            log_writers (list[LogWriter]): writers of the training logs of each network.
+            stopped (list[bool]): True for the networks whose training is stopped.
+            epoch (int): current epoch.
+            i (int): current iteration.
+            n_batches (int): number of batches in an epoch.
+        Returns:
+            (list[dict[str, float]]): the validation metrics of each network.
+        """
+        metrics_train = self.task_manager.test_networks(
+            model, train_metrics_loader, criterion, amp=self.amp
+        )
+        metrics_valid = self.task_manager.test_networks(
+            model, valid_loader, criterion, amp=self.amp
+        )
+        for network, log_writer in enumerate(log_writers):
+            if stopped[network]:
+                continue
+            log_writer.step(
+                epoch, i, metrics_train[network], metrics_valid[network], n_batches
             )
-            self._ensemble_prediction(
-                "validation",
-                split,
-                self.selection_metrics,
+            logger.debug(
+                f"Network {network}: {self.mode} level training loss is "
+                f"{metrics_train[network]['loss']} and validation loss is "
+                f"{metrics_valid[network]['loss']}"
+            )
+        logger.info(
+            f"{self.mode} level training loss is "
+            f"{sum(metrics['loss'] for metrics in metrics_train)} "
+            f"for all the networks at the end of iteration {i}"
+        )
+        logger.info(
+            f"{self.mode} level validation loss is "
+            f"{sum(metrics['loss'] for metrics in metrics_valid)} "
+            f"for all the networks at the end of iteration {i}"
+        )
+        return metrics_valid
+
+    def _get_dataloader_options(self, n_proc: int = None) -> Dict[str, Any]:
+        """
+        Gives the options of the DataLoaders set in the Data_pipeline section.
+
+        Args:
+            n_proc: If given, sets the value of num_workers, else use the same as in training step.
+        Returns:
+            keyword arguments of the DataLoaders (other than the batch size and the sampler).
+        """
+        num_workers = n_proc if n_proc is not None else self.n_proc
+        options = {
+            "num_workers": num_workers,
+            # Pinned memory is only useful for copies to a GPU
+            "pin_memory": self.pin_memory and torch.cuda.is_available(),
+        }
+        # These options are not accepted by the DataLoader without workers
+        if num_workers > 0:
+            options["persistent_workers"] = self.persistent_workers
+            options["prefetch_factor"] = self.prefetch_factor
+            if self.multiprocessing_context != "default":
+                options["multiprocessing_context"] = self.multiprocessing_context
+        return options
+
+    def _generate_train_sampler(self, dataset: CapsDataset) -> Sampler:
+        """
+        Gives the sampler of the training set. In a distributed training, each process
+        samples its own part of the indices of this sampler.
+
+        Args:
+            dataset: training set.
+        Returns:
+            the sampler of the training DataLoader.
+        """
+        sampler = self.task_manager.generate_sampler(
+            dataset,
+            self.sampler,
+            window=self.sampler_window,
+            generator=torch.Generator().manual_seed(self.seed),
+        )
+        if is_distributed():
+            sampler = DistributedSamplerWrapper(
+                sampler, get_world_size(), get_rank(), seed=self.seed
             )
+        return sampler
 
-            self._erase_tmp(split)
+    def _get_evaluation_loader(
+        self,
+        dataset: CapsDataset,
+        sampler: Optional[List[int]] = None,
+        distributed: bool = False,
+        batched: bool = False,
+    ) -> TimedDataLoader:
+        """
+        Gives the DataLoader used to evaluate the network on a dataset during training.
+
+        It works on a copy of the dataset in evaluation mode, which is not affected by the
+        mode of the original dataset. With persistent_workers, its workers are started once
+        for the whole training of the network instead of at each evaluation, at the cost of
+        keeping their memory during the whole training.
+
+        Args:
+            dataset: dataset evaluated.
+            sampler: If given, indices of the elements evaluated, else all the elements are evaluated.
+            distributed: If True and the training is distributed, each process evaluates
+                its own part of the elements, and the results are gathered by TaskManager.test.
+            batched: If True, batches are made of all the elements of their images, for the
+                networks trained together (see _train_batched), and sampler gives the indices
+                of the images evaluated.
+        Returns:
+            the evaluation DataLoader.
+        """
+        if batched:
+            return TimedDataLoader(
+                copy(dataset).eval(),
+                batch_sampler=ImageBatchSampler(
+                    sampler if sampler is not None else range(len(dataset.df)),
+                    dataset.elem_per_image,
+                    self._get_evaluation_batch_size(),
+                ),
+                **self._get_dataloader_options(),
+            )
+        if distributed and is_distributed():
+            sampler = DistributedSamplerWrapper(
+                sampler if sampler is not None else range(len(dataset)),
+                get_world_size(),
+                get_rank(),
+                pad=False,
+            )
+        return TimedDataLoader(
+            copy(dataset).eval(),
+            batch_size=self._get_evaluation_batch_size(),
+            shuffle=False,
+            sampler=sampler,
+            **self._get_dataloader_options(),
+        )
+
+    def _get_evaluation_batch_size(self, batch_size: int = None) -> int:
+        """
+        Args:
+            batch_size: If given, sets the value of batch_size, else use the evaluation batch size
+                of the training step (batch_size if evaluation_batch_size = 0).
+        Returns:
+            the batch size of the DataLoaders used for evaluation.
+        """
+        if batch_size is not None:
+            return batch_size
+        if self.evaluation_batch_size > 0:
+            return self.evaluation_batch_size
+        return self.batch_size
+
+    def _fill_shared_cache(self, *datasets: CapsDataset):
+        """
+        Loads the tensors of the datasets in shared memory if cache_mode is "shared".
+        The datasets share the same memory budget, the first ones being loaded first.
+
+        Args:
+            datasets: datasets that will be given to the DataLoaders.
+        """
+        if self.cache_mode != "shared":
+            return
+
+        shared_cache = SharedTensorCache(self.shared_cache_size)
+        for dataset in datasets:
+            dataset.fill_shared_cache(shared_cache)
 
     def _train(
         self,
@@ -744,6 +1342,9 @@ class MapsManager:
         logger.debug(f"Criterion for {self.network_task} is {criterion}")
         optimizer = self._init_optimizer(model, split=split, resume=resume)
         logger.debug(f"Optimizer used for training is optimizer")
+        scaler = get_grad_scaler(model.device, self.amp)
+        # The gradients of the training steps are averaged over the processes
+        train_model = DistributedNetwork(model) if is_distributed() else model
 
         model.train()
         train_loader.dataset.train()
@@ -753,34 +1354,72 @@ class MapsManager:
         )
         metrics_valid = {"loss": None}
 
-        log_writer = LogWriter(
-            self.maps_path,
-            self.task_manager.evaluation_metrics + ["loss"],
-            split,
-            resume=resume,
-            beginning_epoch=beginning_epoch,
-            network=network,
-        )
-        epoch = log_writer.beginning_epoch
+        log_writer = None
+        if is_main_process():
+            log_writer = LogWriter(
+                self.maps_path,
+                self.task_manager.evaluation_metrics + ["loss"],
+                split,
+                resume=resume,
+                beginning_epoch=beginning_epoch,
+                network=network,
+                train_metrics=self.train_metrics,
+            )
+        epoch = beginning_epoch
 
         retain_best = RetainBest(selection_metrics=list(self.selection_metrics))
+        image_cache = train_loader.dataset.image_cache
+        # The training set is evaluated without its sampler nor data augmentation
+        train_eval_loader = self._get_evaluation_loader(train_loader.dataset)
+        train_metrics_loader, running_metrics = self._init_train_metrics(
+            train_loader, train_eval_loader
+        )
+        # In a distributed training, each process evaluates a part of the validation set
+        valid_eval_loader = (
+            self._get_evaluation_loader(valid_loader.dataset, distributed=True)
+            if is_distributed()
+            else valid_loader
+        )
+        loaders = [train_loader, valid_eval_loader]
+        if train_metrics_loader is not None:
+            loaders.append(train_metrics_loader)
+        batch_augmentation = (
+            BatchAugmentation(self.data_augmentation)
+            if self.batch_augmentation
+            else None
+        )
 
         while epoch < self.epochs and not early_stopping.step(metrics_valid["loss"]):
             logger.info(f"Beginning epoch {epoch}.")
+            if image_cache is not None:
+                image_cache.reset_stats()
+            if running_metrics is not None:
+                running_metrics.reset()
 
             model.zero_grad()
             evaluation_flag, step_flag = True, True
 
             for i, data in enumerate(train_loader):
 
-                _, loss_dict = model.compute_outputs_and_loss(data, criterion)
+                if batch_augmentation is not None:
+                    data["image"] = batch_augmentation(
+                        data["image"].to(model.device, non_blocking=True)
+                    )
+
+                outputs, loss_dict = compute_outputs_and_loss(
+                    train_model, data, criterion, amp=self.amp
+                )
                 logger.debug(f"Train loss dictionnary {loss_dict}")
                 loss = loss_dict["loss"]
-                loss.backward()
+                scaler.scale(loss).backward()
+                if running_metrics is not None:
+                    running_metrics.update(data, outputs, loss_dict)
+                del outputs
 
                 if (i + 1) % self.accumulation_steps == 0:
                     step_flag = False
-                    optimizer.step()
+                    scaler.step(optimizer)
+                    scaler.update()
                     optimizer.zero_grad()
 
                     del loss
@@ -792,23 +1431,24 @@ class MapsManager:
                     ):
                         evaluation_flag = False
 
-                        _, metrics_train = self.task_manager.test(
-                            model, train_loader, criterion
+                        metrics_train = self._compute_train_metrics(
+                            model, train_metrics_loader, running_metrics, criterion
                         )
                         _, metrics_valid = self.task_manager.test(
-                            model, valid_loader, criterion
+                            model, valid_eval_loader, criterion, amp=self.amp
                         )
 
                         model.train()
                         train_loader.dataset.train()
 
-                        log_writer.step(
-                            epoch,
-                            i,
-                            metrics_train,
-                            metrics_valid,
-                            len(train_loader),
-                        )
+                        if log_writer is not None:
+                            log_writer.step(
+                                epoch,
+                                i,
+                                metrics_train,
+                                metrics_valid,
+                                len(train_loader),
+                            )
                         logger.info(
                             f"{self.mode} level training loss is {metrics_train['loss']} "
                             f"at the end of iteration {i}"
@@ -834,20 +1474,42 @@ class MapsManager:
 
             # Update weights one last time if gradients were computed without update
             if (i + 1) % self.accumulation_steps != 0:
-                optimizer.step()
+                scaler.step(optimizer)
+                scaler.update()
                 optimizer.zero_grad()
 
+            if image_cache is not None and image_cache.hit_rate is not None:
+                logger.info(
+                    f"Image cache hit rate is {image_cache.hit_rate:.1%} "
+                    f"at the end of epoch {epoch}"
+                )
+
             # Always test the results and save them once at the end of the epoch
             model.zero_grad()
             logger.debug(f"Last checkpoint at the end of the epoch {epoch}")
 
-            _, metrics_train = self.task_manager.test(model, train_loader, criterion)
-            _, metrics_valid = self.task_manager.test(model, valid_loader, criterion)
+            metrics_train = self._compute_train_metrics(
+                model, train_metrics_loader, running_metrics, criterion
+            )
+            _, metrics_valid = self.task_manager.test(
+                model, valid_eval_loader, criterion, amp=self.amp
+            )
 
             model.train()
             train_loader.dataset.train()
 
-            log_writer.step(epoch, i, metrics_train, metrics_valid, len(train_loader))
+            startup_time = sum(loader.startup_time for loader in loaders)
+            logger.info(
+                f"Data loaders spent {startup_time:.1f}s starting their iterations "
+                f"during epoch {epoch}"
+            )
+            for loader in loaders:
+                loader.startup_time = 0.0
+
+            if log_writer is not None:
+                log_writer.step(
+                    epoch, i, metrics_train, metrics_valid, len(train_loader)
+                )
             logger.info(
                 f"{self.mode} level training loss is {metrics_train['loss']} "
                 f"at the end of iteration {i}"
@@ -882,8 +1544,12 @@ class MapsManager:
 
             epoch += 1
 
+        # The best models are evaluated on the whole sets by the main process only
+        if not is_main_process():
+            return
+
         self._test_loader(
-            train_loader,
+            train_eval_loader,
             criterion,
             "train",
             split,
@@ -917,6 +1583,95 @@ class MapsManager:
                 network=network,
             )
 
+    def _init_train_metrics(
+        self, train_loader: DataLoader, train_eval_loader: DataLoader
+    ) -> Tuple[Optional[DataLoader], Optional[RunningMetrics]]:
+        """
+        Prepares the computation of the metrics on the training set logged during training.
+
+        With train_metrics = "full", the whole training set is evaluated. With "subset", only
+        a fixed random subset of its elements is evaluated. With "running", the metrics are
+        computed from the forward passes of the current epoch, without another pass.
+
+        Args:
+            train_loader: DataLoader wrapping the training set.
+            train_eval_loader: DataLoader evaluating the whole training set.
+        Returns:
+            the DataLoader evaluated (None with "running") and the accumulator of the results
+            of the forward passes (None without "running").
+        Raises:
+            ClinicaDLConfigurationError: if the method or the size of the subset is not valid.
+        """
+        if self.train_metrics == "full":
+            if is_distributed():
+                return (
+                    self._get_evaluation_loader(train_loader.dataset, distributed=True),
+                    None,
+                )
+            return train_eval_loader, None
+        if self.train_metrics == "running":
+            return None, RunningMetrics(self.task_manager, len(train_loader))
+        if self.train_metrics != "subset":
+            raise ClinicaDLConfigurationError(
+                f"train_metrics must be chosen in ['full', 'running', 'subset']. "
+                f"Value given is {self.train_metrics}."
+            )
+        if not 0 < self.train_metrics_fraction <= 1:
+            raise ClinicaDLConfigurationError(
+                f"train_metrics_fraction must be in ]0, 1]. "
+                f"Value given is {self.train_metrics_fraction}."
+            )
+
+        # Networks trained together are evaluated on all the elements of a subset of images
+        batched = self.multi_network and self.batched_networks
+        if batched:
+            n_elem, elem_name = len(train_loader.dataset.df), "image"
+        else:
+            n_elem, elem_name = len(train_loader.dataset), self.mode
+        subset_size = max(1, round(self.train_metrics_fraction * n_elem))
+        # Elements are read in the order of the dataset, image by image
+        subset_indices = np.sort(
+            np.random.default_rng(self.seed).choice(n_elem, subset_size, replace=False)
+        ).tolist()
+        logger.info(
+            f"Training metrics are computed on {subset_size} of the {n_elem} "
+            f"{elem_name}s of the training set."
+        )
+        return (
+            self._get_evaluation_loader(
+                train_loader.dataset,
+                sampler=subset_indices,
+                distributed=True,
+                batched=batched,
+            ),
+            None,
+        )
+
+    def _compute_train_metrics(
+        self,
+        model: Network,
+        train_metrics_loader: Optional[DataLoader],
+        running_metrics: Optional[RunningMetrics],
+        criterion,
+    ) -> Dict[str, float]:
+        """
+        Computes the metrics on the training set logged during training (see _init_train_metrics).
+
+        Args:
+            model: the model trained.
+            train_metrics_loader: DataLoader evaluated, if the metrics are not running metrics.
+            running_metrics: accumulator of the results of the forward passes of the epoch.
+            criterion: optimization criterion.
+        Returns:
+            the metrics on the training set.
+        """
+        if running_metrics is not None:
+            return running_metrics.compute()
+        _, metrics_train = self.task_manager.test(
+            model, train_metrics_loader, criterion, amp=self.amp
+        )
+        return metrics_train
+
     def _test_loader(
         self,
         dataloader,
@@ -966,7 +1721,7 @@ class MapsManager:
             )
 
             prediction_df, metrics = self.task_manager.test(
-                model, dataloader, criterion, use_labels=use_labels
+                model, dataloader, criterion, use_labels=use_labels, amp=self.amp
             )
             if use_labels:
                 if network is not None:
@@ -1027,12 +1782,9 @@ class MapsManager:
             for i in range(nb_imgs):
                 data = dataset[i]
                 image = data["image"]
-                output = (
-                    model.predict(image.unsqueeze(0).to(model.device))
-                    .squeeze(0)
-                    .detach()
-                    .cpu()
-                )
+                with autocast(model.device, self.amp):
+                    output = model.predict(image.unsqueeze(0).to(model.device))
+                output = output.squeeze(0).detach().float().cpu()
                 # Convert tensor to nifti image with appropriate affine
                 input_nii = nib.Nifti1Image(image[0].detach().cpu().numpy(), eye(4))
                 output_nii = nib.Nifti1Image(output[0].numpy(), eye(4))
@@ -1088,14 +1840,14 @@ class MapsManager:
             if nb_images is None:  # Compute outputs for the whole data set
                 nb_modes = len(dataset)
             else:
-                nb_modes = nb_images * dataset.elem_per_image
+                nb_modes = int(dataset.num_elem_of_images()[:nb_images].sum())
 
             for i in range(nb_modes):
                 data = dataset[i]
                 image = data["image"]
-                output = (
-                    model.predict(image.unsqueeze(0).to(model.device)).squeeze(0).cpu()
-                )
+                with autocast(model.device, self.amp):
+                    output = model.predict(image.unsqueeze(0).to(model.device))
+                output = output.squeeze(0).float().cpu()
                 participant_id = data["participant_id"]
                 session_id = data["session_id"]
                 mode_id = data[f"{self.mode}_id"]
@@ -1162,10 +1914,49 @@ class MapsManager:
 
         parameters = add_default_values(parameters)
         self.parameters = parameters
+        multiprocessing_contexts = ["default", "fork", "spawn", "forkserver"]
+        if self.parameters["multiprocessing_context"] not in multiprocessing_contexts:
+            raise ClinicaDLConfigurationError(
+                f"multiprocessing_context must be chosen in {multiprocessing_contexts}. "
+                f"Value given is {self.parameters['multiprocessing_context']}."
+            )
+        if self.parameters["cache_mode"] not in ["none", "shared"]:
+            raise ClinicaDLConfigurationError(
+                f"cache_mode must be chosen in ['none', 'shared']. "
+                f"Value given is {self.parameters['cache_mode']}."
+            )
+        if self.parameters["world_size"] < 1:
+            raise ClinicaDLConfigurationError(
+                f"world_size must be a positive integer. "
+                f"Value given is {self.parameters['world_size']}."
+            )
+        if self.parameters["parallel_splits"] < 1:
+            raise ClinicaDLConfigurationError(
+                f"parallel_splits must be a positive integer. "
+                f"Value given is {self.parameters['parallel_splits']}."
+            )
+        if self.parameters["parallel_splits"] > 1 and self.parameters["world_size"] > 1:
+            raise ClinicaDLConfigurationError(
+                "parallel_splits and world_size cannot both be greater than 1: "
+                "splits trained in parallel must each be trained in a single process."
+            )
         if self.parameters["gpu"]:
             check_gpu()
 
-        _, transformations = get_transforms(self.normalize)
+        if self.parameters["normalization_scope"] not in ["element", "image"]:
+            raise ClinicaDLConfigurationError(
+                f"normalization_scope must be chosen in ['element', 'image']. "
+                f"Value given is {self.parameters['normalization_scope']}."
+            )
+
+        _, transformations = get_transforms(
+            self.normalize, normalization_scope=self.parameters["normalization_scope"]
+        )
+        # Datasets read the level of the resolution pyramid in the preprocessing dict,
+        # so that the MAPS is evaluated at the resolution used for training
+        self.parameters["preprocessing_dict"]["resolution_level"] = self.parameters[
+            "resolution_level"
+        ]
 
         split_manager = self._init_split_manager(None)
         train_df = split_manager[0]["train"]
@@ -1213,6 +2004,8 @@ class MapsManager:
                 f"framework with only {self.parameters['num_networks']} element "
                 f"per image."
             )
+        if self.parameters["batched_networks"]:
+            self._check_batched_networks(full_dataset)
         possible_selection_metrics_set = set(self.task_manager.evaluation_metrics) | {
             "loss"
         }
@@ -1225,6 +2018,41 @@ class MapsManager:
                 f"{possible_selection_metrics_set}."
             )
 
+    def _check_batched_networks(self, dataset: CapsDataset):
+        """
+        Checks that the networks of the multi-network framework can be trained together.
+
+        Args:
+            dataset: training set of the first split, with all the elements of the images.
+        Raises:
+            ClinicaDLConfigurationError: if the training configuration is not compatible.
+        """
+        if not self.multi_network:
+            raise ClinicaDLConfigurationError(
+                "batched_networks can only be used to train the networks of the "
+                "multi-network framework (multi_network = true)."
+            )
+        if dataset.elem_table is not None:
+            raise ClinicaDLConfigurationError(
+                "The networks cannot be trained together if the images do not all have "
+                "the same elements (foreground patches). Please set batched_networks to False."
+            )
+        if self.parameters["network_task"] == "reconstruction":
+            raise ClinicaDLConfigurationError(
+                "Only the CNNs of classification and regression tasks can be trained together. "
+                "Please set batched_networks to False."
+            )
+        if self.parameters["world_size"] > 1:
+            raise ClinicaDLConfigurationError(
+                "The networks trained together cannot be trained in several data-parallel "
+                "processes. Please set world_size to 1 or batched_networks to False."
+            )
+        if self.parameters["train_metrics"] == "running":
+            raise ClinicaDLConfigurationError(
+                "Running training metrics are not available for networks trained together. "
+                "Please set train_metrics to 'full' or 'subset'."
+            )
+
     def _check_split_wording(self):
         """Finds if MAPS structure uses 'fold-X' or 'split-X' folders."""
         from glob import glob
@@ -1509,6 +2337,10 @@ class MapsManager:
             network: network number (multi-network framework).
             filename: name of the checkpoint file.
         """
+        # In a distributed training, the weights are the same in all the processes
+        if not is_main_process():
+            return
+
         checkpoint_dir = path.join(self.maps_path, f"{self.split_name}-{split}", "tmp")
         makedirs(checkpoint_dir, exist_ok=True)
         checkpoint_path = path.join(checkpoint_dir, filename)
@@ -1562,6 +2394,37 @@ class MapsManager:
 
         del model
 
+    def _write_split_time(self, split, beginning, end, resume=False):
+        """
+        Records the training time of a split in training_times.tsv at the root of the MAPS.
+        The rows of the previous trainings of the split are replaced, unless it is resumed.
+
+        Args:
+            split (int): index of the split trained.
+            beginning (datetime): beginning of the training.
+            end (datetime): end of the training.
+            resume (bool): If True the training was resumed from checkpoint.
+        """
+        tsv_path = path.join(self.maps_path, "training_times.tsv")
+        row_df = pd.DataFrame(
+            [
+                [
+                    split,
+                    beginning.isoformat(" ", "seconds"),
+                    end.isoformat(" ", "seconds"),
+                    round((end - beginning).total_seconds(), 1),
+                    resume,
+                ]
+            ],
+            columns=["split", "beginning", "end", "duration", "resumed"],
+        )
+        if path.exists(tsv_path):
+            times_df = pd.read_csv(tsv_path, sep="\t")
+            if not resume:
+                times_df = times_df[times_df.split != split]
+            row_df = pd.concat([times_df, row_df]).sort_values("split", kind="stable")
+        row_df.to_csv(tsv_path, sep="\t", index=False)
+
     def _erase_tmp(self, split):
         """Erase checkpoints of the model and optimizer at the end of training."""
         tmp_path = path.join(self.maps_path, f"{self.split_name}-{split}", "tmp")
@@ -1758,6 +2621,7 @@ class MapsManager:
         resume=False,
         gpu=None,
         network=None,
+        checkpoint_filename="checkpoint.pth.tar",
     ):
         """
         Instantiate the model
@@ -1769,6 +2633,7 @@ class MapsManager:
             resume (bool): If True initialize the network with the checkpoint weights.
             gpu (bool): If given, a new value for the device of the model will be computed.
             network (int): Index of the network trained (used in multi-network setting only).
+            checkpoint_filename (str): name of the checkpoint file loaded if resume is True.
         """
         import clinicadl.utils.network as network_package
 
@@ -1800,7 +2665,7 @@ class MapsManager:
                 self.maps_path,
                 f"{self.split_name}-{split}",
                 "tmp",
-                "checkpoint.pth.tar",
+                checkpoint_filename,
             )
             checkpoint_state = torch.load(checkpoint_path, map_location=device)
             model.load_state_dict(checkpoint_state["model"])
@@ -2144,3 +3009,44 @@ class MapsManager:
                 )
             )
         return map_pt
+
+
+def _train_process(maps_path: str, split_list: Optional[List[int]], resume: bool):
+    """Trains the splits of a MAPS in a process of a distributed training."""
+    maps_manager = MapsManager(maps_path, verbose=None)
+    maps_manager._launch_training(split_list, resume=resume)
+
+
+def _train_split_process(
+    maps_path: str,
+    split: int,
+    resume: bool,
+    n_threads: int,
+    n_proc: int,
+    logging_level: int,
+) -> Tuple[datetime, datetime]:
+    """
+    Trains a split of a MAPS in its own process (see MapsManager._train_parallel_splits).
+
+    Args:
+        maps_path: path to the MAPS.
+        split: index of the split trained.
+        resume: If True the job is resumed from checkpoint.
+        n_threads: number of CPU threads used by the process.
+        n_proc: number of DataLoader workers used by the process.
+        logging_level: logging level of the main process.
+    Returns:
+        the beginning and the end of the training.
+    """
+    import logging
+
+    torch.set_num_threads(n_threads)
+    setup_logging(verbose=logging_level <= logging.DEBUG)
+    for handler in getLogger("clinicadl").handlers:
+        handler.addFilter(PrefixFilter(f"Split {split} - "))
+
+    beginning = datetime.now()
+    maps_manager = MapsManager(maps_path, verbose=None)
+    maps_manager.parameters["n_proc"] = n_proc
+    maps_manager._train_split(split, resume=resume)
+    return beginning, datetime.now()
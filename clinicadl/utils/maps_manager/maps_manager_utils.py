@@ -75,6 +75,24 @@ def read_json(json_path: str) -> Dict[str, Any]:
     retro_add = {
         "optimizer": "Adam",
         "loss": None,
+        "image_cache_size": 0,
+        "sampler_window": 1,
+        "normalization_scope": "element",
+        "resolution_level": 0,
+        "cache_mode": "none",
+        "shared_cache_size": 1024,
+        "batch_augmentation": False,
+        "pin_memory": False,
+        "persistent_workers": False,
+        "prefetch_factor": 2,
+        "evaluation_batch_size": 0,
+        "train_metrics": "full",
+        "train_metrics_fraction": 0.1,
+        "multiprocessing_context": "default",
+        "amp": False,
+        "world_size": 1,
+        "parallel_splits": 1,
+        "batched_networks": False,
     }
 
     for old_name, new_name in retro_change_name.items():
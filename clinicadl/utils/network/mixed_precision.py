@@ -0,0 +1,84 @@
+# coding: utf8
+
+"""
+Automatic mixed precision (AMP) of the forward passes of the networks.
+
+In the autocast context, operations that are safe in lower precision (convolutions,
+linear layers...) run in bfloat16 on CPU and in float16 on GPU, while the others
+(losses, reductions...) keep running in float32. The weights are still stored and
+updated in float32. On GPU, the loss is scaled before the backward pass so that small
+float16 gradients do not underflow.
+"""
+
+from contextlib import nullcontext
+from typing import Any, ContextManager, Dict, Tuple
+
+import torch
+from torch.nn.modules.loss import _Loss
+
+from clinicadl.utils.exceptions import ClinicaDLConfigurationError
+
+
+def _device_type(device: str) -> str:
+    return "cuda" if str(device).startswith("cuda") else "cpu"
+
+
+def autocast(device: str, enabled: bool = True) -> ContextManager:
+    """
+    Args:
+        device: device of the model ("cpu", "cuda" or "cuda:<index>").
+        enabled: If False, the context does nothing.
+    Returns:
+        the autocast context of the device, in bfloat16 on CPU and float16 on GPU.
+    Raises:
+        ClinicaDLConfigurationError: if the installed version of PyTorch does not
+            support mixed precision on the device.
+    """
+    if not enabled:
+        return nullcontext()
+    device_type = _device_type(device)
+    if hasattr(torch, "autocast"):
+        dtype = torch.float16 if device_type == "cuda" else torch.bfloat16
+        return torch.autocast(device_type=device_type, dtype=dtype)
+    if device_type == "cuda":
+        return torch.cuda.amp.autocast()
+    raise ClinicaDLConfigurationError(
+        "Mixed precision on CPU requires PyTorch 1.10 or later. "
+        "Please upgrade PyTorch or set amp to False."
+    )
+
+
+def get_grad_scaler(device: str, enabled: bool = True):
+    """
+    Args:
+        device: device of the model ("cpu", "cuda" or "cuda:<index>").
+        enabled: If False, the scaler does nothing.
+    Returns:
+        the scaler of the loss (GradScaler), which is only enabled for float16 on GPU.
+    """
+    enabled = enabled and _device_type(device) == "cuda"
+    if hasattr(torch, "amp") and hasattr(torch.amp, "GradScaler"):
+        return torch.amp.GradScaler("cuda", enabled=enabled)
+    return torch.cuda.amp.GradScaler(enabled=enabled)
+
+
+def compute_outputs_and_loss(
+    model, input_dict: Dict[str, Any], criterion: _Loss, amp: bool = False, **kwargs
+) -> Tuple[torch.Tensor, Dict[str, torch.Tensor]]:
+    """
+    Calls the compute_outputs_and_loss method of a network in the autocast context.
+
+    Args:
+        model: the network (see clinicadl.utils.network.network.Network).
+        input_dict: batch given by a CapsDataset.
+        criterion: function to calculate the loss.
+        amp: If True, the forward pass is performed in mixed precision.
+        kwargs: other arguments of the compute_outputs_and_loss method.
+    Returns:
+        the outputs, in float32, and the loss dictionary.
+    """
+    with autocast(model.device, amp):
+        outputs, loss_dict = model.compute_outputs_and_loss(
+            input_dict, criterion, **kwargs
+        )
+    return outputs.float(), loss_dict
@@ -0,0 +1,112 @@
+# coding: utf8
+
+"""
+Networks of the multi-network framework trained together.
+
+The networks of a multi-network MAPS share the same architecture and each one receives
+one element (patch, region, slice) of the images. When they are trained together, the
+batches are made of all the elements of their images, so that each image is read once per
+epoch instead of once per network. The elements of a batch are routed to their network
+in a single forward pass, and the losses of the networks are summed so that a single
+backward pass computes the gradients of all the networks. Networks whose training is
+stopped are frozen, and only the other ones keep being optimized.
+"""
+
+from typing import Dict, Sequence
+
+import torch
+from torch import nn
+
+from clinicadl.utils.exceptions import ClinicaDLNetworksError
+from clinicadl.utils.network.network import Network
+from clinicadl.utils.network.sub_network import CNN
+
+
+class MultiCNN(Network):
+    """
+    CNNs of the multi-network framework trained together (see module docstring).
+
+    The batches are made of all the elements of their images, image by image and in the
+    order of the elements, as given by clinicadl.utils.caps_dataset.sampler.ImageBatchSampler.
+    The network of index n processes the elements of index n. The outputs are given per
+    element, in the order of the batch.
+    """
+
+    def __init__(self, networks: Sequence[CNN]):
+        """
+        Args:
+            networks: the networks, in the order of the elements, on the same device.
+        Raises:
+            ClinicaDLNetworksError: if the networks are not CNNs.
+        """
+        if not all(isinstance(network, CNN) for network in networks):
+            raise ClinicaDLNetworksError(
+                "Only CNNs of the multi-network framework can be trained together."
+            )
+        super().__init__(gpu=False)
+        self.device = networks[0].device
+        self.n_networks = len(networks)
+        self.n_classes = networks[0].n_classes
+        self.networks = nn.ModuleList(networks)
+        self.frozen_networks = set()
+
+    @property
+    def layers(self):
+        return self.networks
+
+    def train(self, mode=True):
+        super().train(mode)
+        # The normalization statistics of frozen networks are not updated either
+        for network in self.frozen_networks:
+            self.networks[network].eval()
+        return self
+
+    def freeze_network(self, network: int):
+        """
+        Stops the training of one of the networks: its loss is not optimized anymore and
+        the optimizer does not update its weights, as they have no gradient.
+        """
+        self.frozen_networks.add(network)
+        for param in self.networks[network].parameters():
+            param.requires_grad_(False)
+            param.grad = None
+        self.networks[network].eval()
+
+    def forward(self, x):
+        return torch.stack(
+            [network(x[:, idx]) for idx, network in enumerate(self.networks)], dim=1
+        )
+
+    def predict(self, x):
+        return self.forward(x)
+
+    def compute_outputs_and_loss(self, input_dict, criterion, use_labels=True):
+
+        images = input_dict["image"].to(self.device, non_blocking=True)
+        n_images = images.size(0) // self.n_networks
+        images = images.view(n_images, self.n_networks, *images.shape[1:])
+        train_output = self.forward(images)
+
+        if use_labels:
+            labels = input_dict["label"].to(self.device, non_blocking=True)
+            labels = labels[:: self.n_networks]
+            network_losses = torch.stack(
+                [
+                    criterion(train_output[:, idx], labels)
+                    for idx in range(self.n_networks)
+                ]
+            )
+        else:
+            network_losses = torch.zeros(self.n_networks)
+
+        trained_networks = [
+            idx for idx in range(self.n_networks) if idx not in self.frozen_networks
+        ]
+        return train_output.reshape(n_images * self.n_networks, -1), {
+            "loss": network_losses[trained_networks].sum(),
+            "network_losses": network_losses,
+        }
+
+    def network_state_dict(self, network: int) -> Dict[str, torch.Tensor]:
+        """Gives the weights of one of the networks, in the format of a single CNN."""
+        return self.networks[network].state_dict()
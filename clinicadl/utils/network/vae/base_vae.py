@@ -46,7 +46,7 @@ class BaseVAE(Network):
 
     def compute_outputs_and_loss(self, input_dict, criterion, use_labels=False):
 
-        images = input_dict["image"].to(self.device)
+        images = input_dict["image"].to(self.device, non_blocking=True)
         recon_images, mu, log_var = self.forward(images)
 
         recon_loss = criterion(recon_images, images)
@@ -0,0 +1,94 @@
+# coding: utf8
+
+"""
+Fast reading of NifTi images.
+
+Compressed images are read in one block and decompressed in a single call, which releases
+the GIL during the whole decompression so that several threads can decode images at the
+same time, instead of going through the small buffered reads of gzip.GzipFile.
+Voxel values are then converted directly to float32.
+
+Decoded volumes can also be kept in an on-disk cache, keyed by a digest of the content of
+the NifTi file, so that images are decompressed only once across runs.
+"""
+
+import hashlib
+import os
+import threading
+import zlib
+from io import BytesIO
+from os import path
+from typing import Optional
+
+import nibabel as nib
+import numpy as np
+from nibabel.fileholders import FileHolder
+
+
+def _gunzip(data: bytes) -> bytes:
+    """Decompresses gzip data, which may contain several members."""
+    chunks = list()
+    while data:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks.append(decompressor.decompress(data))
+        data = decompressor.unused_data
+    return b"".join(chunks)
+
+
+def _read_bytes(nii_path: str) -> bytes:
+    with open(nii_path, "rb") as nii_file:
+        return nii_file.read()
+
+
+def _image_from_bytes(data: bytes, nii_path: str) -> nib.Nifti1Image:
+    if nii_path.endswith(".gz"):
+        data = _gunzip(data)
+    # The size of the header gives the version of the format, in either byte order
+    if 540 in (int.from_bytes(data[:4], "little"), int.from_bytes(data[:4], "big")):
+        image_class = nib.Nifti2Image
+    else:
+        image_class = nib.Nifti1Image
+    file_holder = FileHolder(filename=nii_path, fileobj=BytesIO(data))
+    return image_class.from_file_map({"header": file_holder, "image": file_holder})
+
+
+def load_nifti_image(nii_path: str) -> nib.Nifti1Image:
+    """
+    Loads a NifTi image whose data is decompressed in memory.
+
+    Args:
+        nii_path: path to the NifTi image (*.nii or *.nii.gz).
+    Returns:
+        the NifTi image, giving access to the header and the affine of the image.
+    """
+    return _image_from_bytes(_read_bytes(nii_path), nii_path)
+
+
+def read_nifti(nii_path: str, cache_dir: Optional[str] = None) -> np.ndarray:
+    """
+    Reads the voxel values of a NifTi image as float32.
+
+    Args:
+        nii_path: path to the NifTi image (*.nii or *.nii.gz).
+        cache_dir: folder of the cache of decoded volumes. If None, volumes are not cached.
+    Returns:
+        the float32 array of the image, with scaling applied.
+    """
+    data = _read_bytes(nii_path)
+
+    if cache_dir is not None:
+        cache_path = path.join(cache_dir, f"{hashlib.sha1(data).hexdigest()}.npy")
+        if path.isfile(cache_path):
+            return np.load(cache_path)
+
+    image_np = _image_from_bytes(data, nii_path).get_fdata(dtype=np.float32)
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write the cache entry atomically, as several workers may decode the same image
+        tmp_path = f"{cache_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as cache_file:
+            np.save(cache_file, image_np)
+        os.replace(tmp_path, cache_path)
+
+    return image_np
@@ -4,14 +4,16 @@ import os
 from typing import Any, Dict
 
 
-def write_preprocessing(preprocessing_dict: Dict[str, Any], caps_directory: str):
+def write_preprocessing(
+    preprocessing_dict: Dict[str, Any], caps_directory: str, overwrite: bool = False
+):
     extract_dir = os.path.join(
         caps_directory,
         "tensor_extraction",
     )
     os.makedirs(extract_dir, exist_ok=True)
     json_path = os.path.join(extract_dir, preprocessing_dict["extract_json"])
-    if os.path.exists(json_path):
+    if os.path.exists(json_path) and not overwrite:
         raise FileExistsError(
             f"JSON file at {json_path} already exists. "
             f"Please choose another name for your preprocessing file."
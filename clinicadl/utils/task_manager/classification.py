@@ -7,6 +7,7 @@ from torch import nn
 from torch.nn.functional import softmax
 from torch.utils.data import sampler
 
+from clinicadl.utils.caps_dataset.sampler import ImageGroupedSampler
 from clinicadl.utils.exceptions import ClinicaDLArgumentError
 
 logger = getLogger("clinicadl.task_manager")
@@ -78,7 +79,9 @@ class ClassificationManager(TaskManager):
         return len(label_code)
 
     @staticmethod
-    def generate_sampler(dataset, sampler_option="random", n_bins=5):
+    def generate_sampler(
+        dataset, sampler_option="random", n_bins=5, window=1, generator=None
+    ):
         df = dataset.df
         labels = df[dataset.label].unique()
         codes = set()
@@ -94,12 +97,18 @@ class ClassificationManager(TaskManager):
         weight_per_class = 1 / np.array(count)
         weights = []
 
-        for idx, label in enumerate(df[dataset.label].values):
+        for label, n_elem in zip(
+            df[dataset.label].values, dataset.num_elem_of_images()
+        ):
             key = dataset.label_fn(label)
-            weights += [weight_per_class[key]] * dataset.elem_per_image
+            weights += [weight_per_class[key]] * n_elem
 
         if sampler_option == "random":
             return sampler.RandomSampler(weights)
+        elif sampler_option == "grouped":
+            return ImageGroupedSampler(
+                len(df), dataset.num_elem_of_images(), window, generator
+            )
         elif sampler_option == "weighted":
             return sampler.WeightedRandomSampler(weights, len(weights))
         else:
@@ -154,8 +163,9 @@ class ClassificationManager(TaskManager):
                 sub_level_accuracies[sub_level_accuracies < selection_threshold] = 0
             weight_series = sub_level_accuracies / sub_level_accuracies.sum()
         elif method == "hard":
-            n_modes = validation_df[f"{self.mode}_id"].nunique()
-            weight_series = pd.DataFrame(np.ones((n_modes, 1)))
+            weight_series = pd.Series(
+                1.0, index=validation_df[f"{self.mode}_id"].unique()
+            )
         else:
             raise NotImplementedError(
                 f"Ensemble method {method} was not implemented. "
@@ -174,8 +184,22 @@ class ClassificationManager(TaskManager):
             ["participant_id", "session_id"]
         ):
             label = subject_df["true_label"].unique().item()
+            # Images may not have all the elements (e.g. background patches are skipped)
+            weights = (
+                weight_series.reindex(subject_df[f"{self.mode}_id"].values)
+                .fillna(0)
+                .values
+            )
+            if weights.sum() == 0:
+                logger.warning(
+                    f"None of the {self.mode}s of ({subject} | {session}) has a weight "
+                    f"in the soft voting, as they were not seen in validation or their "
+                    f"accuracy is below the selection threshold. Their predictions are "
+                    f"averaged with the same weight."
+                )
+                weights = np.ones(len(weights))
             proba_list = [
-                np.average(subject_df[f"proba{i}"], weights=weight_series)
+                np.average(subject_df[f"proba{i}"], weights=weights)
                 for i in range(self.n_classes)
             ]
             prediction = proba_list.index(max(proba_list))
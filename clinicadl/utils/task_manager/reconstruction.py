@@ -1,6 +1,7 @@
 from torch import nn
 from torch.utils.data import sampler
 
+from clinicadl.utils.caps_dataset.sampler import ImageGroupedSampler
 from clinicadl.utils.exceptions import ClinicaDLArgumentError
 from clinicadl.utils.task_manager.task_manager import TaskManager
 
@@ -55,13 +56,19 @@ class ReconstructionManager(TaskManager):
         return None
 
     @staticmethod
-    def generate_sampler(dataset, sampler_option="random", n_bins=5):
+    def generate_sampler(
+        dataset, sampler_option="random", n_bins=5, window=1, generator=None
+    ):
         df = dataset.df
 
-        weights = [1] * len(df) * dataset.elem_per_image
+        weights = [1] * len(dataset)
 
         if sampler_option == "random":
             return sampler.RandomSampler(weights)
+        elif sampler_option == "grouped":
+            return ImageGroupedSampler(
+                len(df), dataset.num_elem_of_images(), window, generator
+            )
         else:
             raise NotImplementedError(
                 f"The option {sampler_option} for sampler on reconstruction task is not implemented"
@@ -3,6 +3,7 @@ import pandas as pd
 from torch import nn
 from torch.utils.data import sampler
 
+from clinicadl.utils.caps_dataset.sampler import ImageGroupedSampler
 from clinicadl.utils.exceptions import ClinicaDLArgumentError
 from clinicadl.utils.task_manager.task_manager import TaskManager
 
@@ -58,7 +59,9 @@ class RegressionManager(TaskManager):
         return 1
 
     @staticmethod
-    def generate_sampler(dataset, sampler_option="random", n_bins=5):
+    def generate_sampler(
+        dataset, sampler_option="random", n_bins=5, window=1, generator=None
+    ):
         df = dataset.df
 
         count = np.zeros(n_bins)
@@ -75,12 +78,18 @@ class RegressionManager(TaskManager):
         weight_per_class = 1 / np.array(count)
         weights = []
 
-        for idx, label in enumerate(df[dataset.label].values):
+        for label, n_elem in zip(
+            df[dataset.label].values, dataset.num_elem_of_images()
+        ):
             key = max(np.where((label >= np.array(thresholds)))[0])
-            weights += [weight_per_class[key]] * dataset.elem_per_image
+            weights += [weight_per_class[key]] * n_elem
 
         if sampler_option == "random":
             return sampler.RandomSampler(weights)
+        elif sampler_option == "grouped":
+            return ImageGroupedSampler(
+                len(df), dataset.num_elem_of_images(), window, generator
+            )
         elif sampler_option == "weighted":
             return sampler.WeightedRandomSampler(weights, len(weights))
         else:
@@ -120,9 +129,6 @@ class RegressionManager(TaskManager):
                 f"The only method implemented for regression is hard-voting."
             )
 
-        n_modes = validation_df[f"{self.mode}_id"].nunique()
-        weight_series = np.ones(n_modes)
-
         # Sort to allow weighted average computation
         performance_df.sort_values(
             ["participant_id", "session_id", f"{self.mode}_id"], inplace=True
@@ -134,9 +140,7 @@ class RegressionManager(TaskManager):
             ["participant_id", "session_id"]
         ):
             label = subject_df["true_label"].unique().item()
-            prediction = np.average(
-                subject_df["predicted_label"], weights=weight_series
-            )
+            prediction = np.average(subject_df["predicted_label"])
             row = [[subject, session, 0, label, prediction]]
             row_df = pd.DataFrame(row, columns=self.columns)
             df_final = df_final.append(row_df)
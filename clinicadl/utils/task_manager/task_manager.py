@@ -8,7 +8,10 @@ from torch.nn.modules.loss import _Loss
 from torch.utils.data import DataLoader, Sampler
 
 from clinicadl.utils.caps_dataset.data import CapsDataset
+from clinicadl.utils.caps_dataset.sampler import DistributedSamplerWrapper
+from clinicadl.utils.distributed import all_gather_list, all_reduce_sum
 from clinicadl.utils.metric_module import MetricModule
+from clinicadl.utils.network.mixed_precision import compute_outputs_and_loss
 from clinicadl.utils.network.network import Network
 
 
@@ -132,7 +135,11 @@ class TaskManager:
     @staticmethod
     @abstractmethod
     def generate_sampler(
-        dataset: CapsDataset, sampler_option: str = "random", n_bins: int = 5
+        dataset: CapsDataset,
+        sampler_option: str = "random",
+        n_bins: int = 5,
+        window: int = 1,
+        generator: Optional[torch.Generator] = None,
     ) -> Sampler:
         """
         Returns sampler according to the wanted options.
@@ -141,6 +148,8 @@ class TaskManager:
             dataset: the dataset to sample from.
             sampler_option: choice of sampler.
             n_bins: number of bins to used for a continuous variable (regression task).
+            window: number of images whose elements are shuffled together (grouped sampler).
+            generator: generator of the random permutations (grouped sampler).
         Returns:
              callable given to the training data loader.
         """
@@ -172,16 +181,22 @@ class TaskManager:
         dataloader: DataLoader,
         criterion: _Loss,
         use_labels: bool = True,
+        amp: bool = False,
     ) -> Tuple[pd.DataFrame, Dict[str, float]]:
         """
         Computes the predictions and evaluation metrics.
 
+        If the dataloader samples the part of the data set of a process of a distributed
+        training, the results of all the processes are gathered, so that this method
+        must be called by all of them.
+
         Args:
             model: the model trained.
             dataloader: wrapper of a CapsDataset.
             criterion: function to calculate the loss.
             use_labels: If True the true_label will be written in output DataFrame
                 and metrics dict will be created.
+            amp: If True, the forward passes are performed in mixed precision.
         Returns:
             the results and metrics on the image level.
         """
@@ -192,8 +207,8 @@ class TaskManager:
         total_loss = 0
         with torch.no_grad():
             for i, data in enumerate(dataloader):
-                outputs, loss_dict = model.compute_outputs_and_loss(
-                    data, criterion, use_labels=use_labels
+                outputs, loss_dict = compute_outputs_and_loss(
+                    model, data, criterion, amp=amp, use_labels=use_labels
                 )
                 total_loss += loss_dict["loss"].item()
 
@@ -204,7 +219,11 @@ class TaskManager:
                     results_df = pd.concat([results_df, row_df])
 
                 del outputs, loss_dict
-            results_df.reset_index(inplace=True, drop=True)
+
+        if isinstance(dataloader.sampler, DistributedSamplerWrapper):
+            results_df = pd.concat(all_gather_list([results_df]))
+            total_loss = all_reduce_sum(total_loss)
+        results_df.reset_index(inplace=True, drop=True)
 
         if not use_labels:
             metrics_dict = None
@@ -214,3 +233,118 @@ class TaskManager:
         torch.cuda.empty_cache()
 
         return results_df, metrics_dict
+
+    def test_networks(
+        self,
+        model: Network,
+        dataloader: DataLoader,
+        criterion: _Loss,
+        amp: bool = False,
+    ) -> List[Dict[str, float]]:
+        """
+        Computes the evaluation metrics of each network of a MultiCNN, with a single pass
+        over the data (see clinicadl.utils.network.multi_network).
+
+        Args:
+            model: the networks trained together.
+            dataloader: wrapper of a CapsDataset whose batches are made of all the elements
+                of their images (see clinicadl.utils.caps_dataset.sampler.ImageBatchSampler).
+            criterion: function to calculate the loss.
+            amp: If True, the forward passes are performed in mixed precision.
+        Returns:
+            the metrics of each network, in the order of the networks.
+        """
+        model.eval()
+        dataloader.dataset.eval()
+
+        rows = list()
+        total_losses = torch.zeros(model.n_networks, dtype=torch.float64)
+        with torch.no_grad():
+            for i, data in enumerate(dataloader):
+                outputs, loss_dict = compute_outputs_and_loss(
+                    model, data, criterion, amp=amp
+                )
+                total_losses += loss_dict["network_losses"].detach().cpu().double()
+
+                for idx in range(len(data["participant_id"])):
+                    rows += self.generate_test_row(idx, data, outputs)
+
+                del outputs, loss_dict
+
+        results_df = pd.DataFrame(rows, columns=self.columns)
+        metrics_list = list()
+        for network in range(model.n_networks):
+            # Rows are in the order of the batches, where the network of index n receives
+            # the elements of index n. Identifiers of elements may be shifted, like the
+            # ones of slices which start after the discarded slices.
+            metrics_dict = self.compute_metrics(
+                results_df.iloc[network :: model.n_networks].reset_index(drop=True)
+            )
+            metrics_dict["loss"] = total_losses[network].item()
+            metrics_list.append(metrics_dict)
+        torch.cuda.empty_cache()
+
+        return metrics_list
+
+
+class RunningMetrics:
+    """
+    Accumulates the results of the forward passes performed during a training epoch, so that
+    the metrics on the training set are computed without another pass over it.
+
+    The results come from the model in training mode, whose weights are updated during
+    the epoch, and from the augmented inputs.
+    """
+
+    def __init__(self, task_manager: TaskManager, n_batches: int):
+        """
+        Args:
+            task_manager: task manager computing the results and the metrics.
+            n_batches: number of batches in an epoch.
+        """
+        self.task_manager = task_manager
+        self.n_batches = n_batches
+        self.reset()
+
+    def reset(self):
+        """Forgets the results accumulated, at the beginning of an epoch."""
+        self._rows: List[List[Any]] = list()
+        self._total_loss = 0.0
+        self._n_seen = 0
+
+    def update(
+        self, data: Dict[str, Any], outputs: Tensor, loss_dict: Dict[str, Tensor]
+    ):
+        """
+        Adds the results of a training batch.
+
+        Args:
+            data: input batch generated by a DataLoader on a CapsDataset.
+            outputs: output batch generated by the forward pass in the model.
+            loss_dict: losses computed on the batch.
+        """
+        outputs = outputs.detach().cpu()
+        data = {**data, "image": data["image"].detach().cpu()}
+        for idx in range(len(data["participant_id"])):
+            self._rows += self.task_manager.generate_test_row(idx, data, outputs)
+        self._total_loss += loss_dict["loss"].item()
+        self._n_seen += 1
+
+    def compute(self) -> Dict[str, float]:
+        """
+        Computes the metrics of the results accumulated since the beginning of the epoch.
+        Like in TaskManager.test, the loss is the sum of the losses of the batches of an epoch:
+        it is extrapolated from the batches already seen. In a distributed training, the
+        results of all the processes are gathered.
+
+        Returns:
+            the metrics on the training set.
+        """
+        results_df = pd.DataFrame(
+            all_gather_list(self._rows), columns=self.task_manager.columns
+        )
+        metrics_dict = self.task_manager.compute_metrics(results_df)
+        metrics_dict["loss"] = all_reduce_sum(
+            self._total_loss * self.n_batches / max(self._n_seen, 1)
+        )
+        return metrics_dict
@@ -0,0 +1,94 @@
+# coding: utf8
+
+import random
+
+import numpy as np
+import pytest
+import torch
+
+from clinicadl.utils.caps_dataset.data import (
+    BatchAugmentation,
+    BatchRandomCropPad,
+    BatchRandomErasing,
+    BatchRandomNoising,
+    BatchRandomSmoothing,
+    RandomCropPad,
+    RandomSmoothing,
+)
+
+# Batches of 3D images (patches, ROI, images) and of 2D slices
+IMAGE_SHAPES = [(3, 1, 9, 11, 10), (3, 1, 12, 13)]
+
+
+@pytest.mark.parametrize("batch_shape", IMAGE_SHAPES)
+def test_batch_smoothing(monkeypatch, batch_shape):
+    images = torch.rand(batch_shape)
+    # No smoothing, a kernel of radius 1 and the largest kernel (radius 4)
+    sigmas = [0.0, 0.2, 1.0]
+
+    smoothed_images = BatchRandomSmoothing._smooth(images, torch.tensor(sigmas))
+    assert smoothed_images.shape == images.shape
+    for image, smoothed_image, sigma in zip(images, smoothed_images, sigmas):
+        # Per-sample transform using scipy gaussian_filter (mode="reflect")
+        monkeypatch.setattr(random, "uniform", lambda low, high: sigma)
+        expected_image = RandomSmoothing()(image.numpy())
+        assert torch.allclose(smoothed_image, expected_image, atol=1e-6)
+
+    # Samples are smoothed with random standard deviations lower than sigma
+    torch.manual_seed(0)
+    smoothed_images = BatchRandomSmoothing(sigma=0.5)(images)
+    assert smoothed_images.shape == images.shape
+    assert not torch.equal(smoothed_images, images)
+
+
+@pytest.mark.parametrize("batch_shape", IMAGE_SHAPES)
+def test_batch_crop_pad(monkeypatch, batch_shape):
+    images = torch.rand(batch_shape)
+    n_dims = images.dim() - 2
+    shifts = torch.tensor([[-3, 0, 2], [4, -1, 0], [1, 1, -4]])[:n_dims]
+
+    shifted_images = images
+    for dim in range(n_dims):
+        shifted_images = BatchRandomCropPad._shift(shifted_images, shifts[dim], dim + 2)
+    assert shifted_images.shape == images.shape
+    for idx, (image, shifted_image) in enumerate(zip(images, shifted_images)):
+        # Shifts of RandomCropPad are given from the last dimension
+        crop = shifts[:, idx].flip(0).numpy()
+        monkeypatch.setattr(np.random, "randint", lambda low, high, size: crop)
+        assert torch.equal(shifted_image, RandomCropPad(length=5)(image))
+
+    # Shifts are drawn between -length and length - 1, as with RandomCropPad
+    def randint(low, high, size, device):
+        assert (low, high, size) == (-5, 5, (images.size(0),))
+        return shifts[0]
+
+    monkeypatch.setattr(torch, "randint", randint)
+    shifted_images = BatchRandomCropPad(length=5)(images)
+    for dim in range(n_dims):
+        images = BatchRandomCropPad._shift(images, shifts[0], dim + 2)
+    assert torch.equal(shifted_images, images)
+
+
+@pytest.mark.parametrize("batch_shape", IMAGE_SHAPES)
+def test_batch_erasing(batch_shape):
+    images = torch.rand(batch_shape)
+
+    torch.manual_seed(0)
+    random.seed(0)
+    erased_images = BatchRandomErasing()(images)
+    torch.manual_seed(0)
+    random.seed(0)
+    erasing = BatchRandomErasing().erasing
+    assert torch.equal(erased_images, torch.stack([erasing(image) for image in images]))
+
+
+def test_batch_augmentation():
+    augmentation = BatchAugmentation(["Noise", "Smoothing", "None", "CropPad"])
+    assert [type(transform) for transform in augmentation.augmentation_list] == [
+        BatchRandomNoising,
+        BatchRandomSmoothing,
+        BatchRandomCropPad,
+    ]
+    images = torch.rand(IMAGE_SHAPES[0])
+    assert augmentation(images).shape == images.shape
+    assert BatchAugmentation(None)(images) is images
@@ -0,0 +1,171 @@
+# coding: utf8
+
+import pickle
+
+import nibabel as nib
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+from clinicadl.prepare_data.prepare_data import DeepLearningPrepareData
+from clinicadl.utils.caps_dataset.data import return_dataset
+from clinicadl.utils.preprocessing import read_preprocessing
+from tests.testing_tools import create_t1_linear_caps
+
+
+@pytest.fixture
+def caps_dir(tmp_path):
+    participants = ["sub-01", "sub-02", "sub-03", "sub-04"]
+    tsv_path = create_t1_linear_caps(tmp_path / "caps", participants)
+    data_df = pd.read_csv(tsv_path, sep="\t")
+    data_df["cohort"] = "single"
+    data_df["diagnosis"] = ["AD", "CN", "CN", "AD"]
+    data_df["age"] = [70.5, 64.0, 81.2, 59.9]
+    return tmp_path / "caps", data_df
+
+
+def get_dataset(caps_dir, data_df, parameters, **kwargs):
+    extract_json = f"extract_{parameters['mode']}.json"
+    DeepLearningPrepareData(
+        caps_directory=str(caps_dir),
+        tsv_file=str(caps_dir.parent / "subjects.tsv"),
+        n_proc=1,
+        parameters=dict(
+            parameters,
+            preprocessing="t1-linear",
+            use_uncropped_image=True,
+            extract_json=extract_json,
+        ),
+    )
+    return return_dataset(
+        str(caps_dir),
+        data_df,
+        read_preprocessing(str(caps_dir / "tensor_extraction" / extract_json)),
+        None,
+        **kwargs,
+    )
+
+
+def compare_samples(sample, expected_sample):
+    assert sample.keys() == expected_sample.keys()
+    for key, value in expected_sample.items():
+        if isinstance(value, torch.Tensor):
+            assert torch.equal(sample[key], value)
+        else:
+            assert sample[key] == value
+
+
+@pytest.mark.parametrize(
+    "parameters",
+    [
+        {"mode": "image", "prepare_dl": True},
+        {"mode": "patch", "patch_size": 10, "stride_size": 7, "prepare_dl": True},
+        {"mode": "patch", "patch_size": 10, "stride_size": 7, "prepare_dl": False},
+        {
+            "mode": "slice",
+            "slice_mode": "single",
+            "slice_direction": 2,
+            "discarded_slices": [3, 4],
+            "prepare_dl": False,
+        },
+    ],
+)
+@pytest.mark.parametrize(
+    "label,label_code",
+    [("diagnosis", {"AD": 0, "CN": 1}), ("age", None), (None, None)],
+)
+def test_getitems(caps_dir, parameters, label, label_code):
+    caps_dir, data_df = caps_dir
+    dataset = get_dataset(
+        caps_dir,
+        data_df,
+        parameters,
+        label=label,
+        label_code=label_code,
+        label_presence=label is not None,
+    )
+    indices = [2, 0, len(dataset) - 1, 2, 3]
+    samples = dataset.__getitems__(indices)
+    assert len(samples) == len(indices)
+    for idx, sample in zip(indices, samples):
+        compare_samples(sample, dataset[idx])
+
+    # The DataFrame is not copied to the DataLoader workers
+    worker_dataset = pickle.loads(pickle.dumps(dataset))
+    assert worker_dataset.df is None
+    assert len(worker_dataset) == len(dataset)
+    for idx, sample in zip(indices, worker_dataset.__getitems__(indices)):
+        compare_samples(sample, dataset[idx])
+
+
+def create_roi_masks(caps_dir, image_shape=(20, 24, 22)):
+    mask_dir = caps_dir / "masks" / "tpl-MNI152NLin2009cSym"
+    mask_dir.mkdir(parents=True)
+    boxes = {"box": np.s_[2:9, 5:16, 3:11], "split": np.s_[4:12:3, 1:6, 10:20]}
+    for roi, box in boxes.items():
+        mask_np = np.zeros(image_shape, dtype=np.uint8)
+        mask_np[box] = 1
+        # Masks of cropped and uncropped images have the same shape as the images
+        for desc in ["", "_desc-Crop"]:
+            nib.save(
+                nib.Nifti1Image(mask_np, np.eye(4)),
+                mask_dir
+                / f"tpl-MNI152NLin2009cSym{desc}_res-1x1x1_roi-{roi}_mask.nii.gz",
+            )
+
+
+SIZE_PARAMETERS = [
+    {"mode": "image"},
+    {"mode": "patch", "patch_size": 10, "stride_size": 7},
+    {
+        "mode": "slice",
+        "slice_mode": "single",
+        "slice_direction": 1,
+        "discarded_slices": [3, 4],
+    },
+    {
+        "mode": "slice",
+        "slice_mode": "rgb",
+        "slice_direction": 0,
+        "discarded_slices": [2, 0],
+    },
+    {"mode": "roi", "roi_list": ["box"], "uncropped_roi": False},
+    {"mode": "roi", "roi_list": ["box", "split"], "uncropped_roi": False},
+]
+
+
+@pytest.mark.parametrize(
+    "parameters,prepare_dl",
+    [
+        (parameters, prepare_dl)
+        for parameters in SIZE_PARAMETERS
+        for prepare_dl in [True, False]
+    ]
+    # Datasets look for the regions extracted with the masks of cropped images
+    + [({"mode": "roi", "roi_list": ["split"], "uncropped_roi": True}, False)],
+)
+def test_dataset_size(caps_dir, parameters, prepare_dl):
+    caps_dir, data_df = caps_dir
+    if parameters["mode"] == "roi":
+        create_roi_masks(caps_dir)
+    parameters = dict(parameters, prepare_dl=prepare_dl)
+    dataset = get_dataset(caps_dir, data_df, parameters, label_presence=False)
+
+    # The size computed from the recorded shapes is the one of the samples. Regions of
+    # different shapes have the size of the first one.
+    for idx in [0, len(dataset) - dataset.elem_per_image]:
+        assert dataset[idx]["image"].shape == dataset.size
+
+    # Former extractions load the first sample, and the first whole image to count the
+    # patches and slices
+    if prepare_dl and parameters["mode"] in ["patch", "slice"]:
+        get_dataset(caps_dir, data_df, {"mode": "image", "prepare_dl": True})
+    preprocessing_dict = dict(dataset.preprocessing_dict)
+    preprocessing_dict.pop("tensor_shape", None)
+    preprocessing_dict.pop("num_tensors", None)
+    legacy_dataset = return_dataset(
+        str(caps_dir), data_df, preprocessing_dict, None, label_presence=False
+    )
+    assert legacy_dataset.size == dataset.size
+    assert len(legacy_dataset) == len(dataset)
@@ -0,0 +1,152 @@
+# coding: utf8
+
+from pathlib import Path
+
+import pytest
+from clinica.utils.exceptions import ClinicaCAPSError
+from clinica.utils.input_files import T1W_LINEAR
+from clinica.utils.inputs import clinica_file_reader
+
+from clinicadl.utils.caps_dataset.caps_index import CapsFileIndex, get_caps_index
+
+T1W_SUFFIX = "space-MNI152NLin2009cSym_res-1x1x1_T1w"
+
+
+def touch(caps_dir: Path, relative_path: str):
+    file_path = caps_dir / relative_path
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.touch()
+
+
+@pytest.fixture
+def caps_dir(tmp_path):
+    caps_dir = tmp_path / "caps"
+    touch(
+        caps_dir,
+        f"subjects/sub-01/ses-M00/t1_linear/sub-01_ses-M00_{T1W_SUFFIX}.nii.gz",
+    )
+    # Different case than the pattern
+    touch(
+        caps_dir,
+        f"subjects/sub-02/ses-M00/t1_linear/sub-02_ses-M00_{T1W_SUFFIX.lower()}.nii.gz",
+    )
+    # Two images for the same session
+    touch(
+        caps_dir,
+        f"subjects/sub-03/ses-M00/t1_linear/sub-03_ses-M00_{T1W_SUFFIX}.nii.gz",
+    )
+    touch(
+        caps_dir,
+        f"subjects/sub-03/ses-M00/t1_linear/copy/sub-03_ses-M00_{T1W_SUFFIX}.nii.gz",
+    )
+    # Tensors extracted from the images
+    for participant in ["sub-01", "sub-02"]:
+        prepare_dir = f"subjects/{participant}/ses-M00/deeplearning_prepare_data"
+        touch(
+            caps_dir,
+            f"{prepare_dir}/image_based/t1_linear/{participant}_ses-M00_{T1W_SUFFIX}.pt",
+        )
+        for mode in ["patch", "slice", "roi"]:
+            touch(
+                caps_dir,
+                f"{prepare_dir}/{mode}_based/t1_linear/"
+                f"{participant}_ses-M00_{T1W_SUFFIX}_{mode}-0_T1w.pt",
+            )
+    return caps_dir
+
+
+def test_read_files(caps_dir):
+    participants = ["sub-01", "sub-02"]
+    sessions = ["ses-M00", "ses-M00"]
+
+    for file_type in [
+        T1W_LINEAR,
+        {"pattern": f"*{T1W_SUFFIX}.pt", "description": "image tensor"},
+    ]:
+        clinica_files, _ = clinica_file_reader(
+            participants, sessions, str(caps_dir), file_type
+        )
+        index_files = CapsFileIndex(str(caps_dir), file_type).read_files(
+            participants, sessions
+        )
+        assert index_files == clinica_files
+
+
+def test_read_files_missing(caps_dir):
+    participants = ["sub-01", "sub-04"]
+    sessions = ["ses-M00", "ses-M01"]
+
+    with pytest.raises(ClinicaCAPSError) as clinica_error:
+        clinica_file_reader(participants, sessions, str(caps_dir), T1W_LINEAR)
+    with pytest.raises(ClinicaCAPSError) as index_error:
+        CapsFileIndex(str(caps_dir), T1W_LINEAR).read_files(participants, sessions)
+    assert str(index_error.value) == str(clinica_error.value)
+
+    index_files = CapsFileIndex(str(caps_dir), T1W_LINEAR).read_files(
+        participants, sessions, raise_exception=False
+    )
+    clinica_files, _ = clinica_file_reader(
+        participants, sessions, str(caps_dir), T1W_LINEAR, raise_exception=False
+    )
+    assert index_files == clinica_files
+
+
+def test_read_files_multiple(caps_dir):
+    with pytest.raises(ClinicaCAPSError) as clinica_error:
+        clinica_file_reader(["sub-03"], ["ses-M00"], str(caps_dir), T1W_LINEAR)
+    with pytest.raises(ClinicaCAPSError) as index_error:
+        CapsFileIndex(str(caps_dir), T1W_LINEAR).read_files(["sub-03"], ["ses-M00"])
+    # The files found are listed in the order of the file system by clinica
+    assert sorted(str(index_error.value).split("\n")) == sorted(
+        str(clinica_error.value).split("\n")
+    )
+
+
+def test_skipped_folders(caps_dir):
+    # Elements extracted by prepare_data are never indexed
+    file_type = {"pattern": "*.pt", "description": "tensors"}
+    index_files = CapsFileIndex(str(caps_dir), file_type).read_files(
+        ["sub-01"], ["ses-M00"]
+    )
+    assert index_files == [
+        str(
+            caps_dir
+            / "subjects/sub-01/ses-M00/deeplearning_prepare_data/image_based/t1_linear"
+            / f"sub-01_ses-M00_{T1W_SUFFIX}.pt"
+        )
+    ]
+
+
+def test_index_update(caps_dir):
+    index = CapsFileIndex(str(caps_dir), T1W_LINEAR)
+    with pytest.raises(ClinicaCAPSError):
+        index.read_files(["sub-04"], ["ses-M00"])
+
+    # The index is saved and updated with the new session
+    touch(
+        caps_dir,
+        f"subjects/sub-04/ses-M00/t1_linear/sub-04_ses-M00_{T1W_SUFFIX}.nii.gz",
+    )
+    assert Path(index.index_path).is_file()
+    index = CapsFileIndex(str(caps_dir), T1W_LINEAR)
+    clinica_files, _ = clinica_file_reader(
+        ["sub-04"], ["ses-M00"], str(caps_dir), T1W_LINEAR
+    )
+    assert index.read_files(["sub-04"], ["ses-M00"]) == clinica_files
+
+
+def test_index_revalidation(caps_dir):
+    index = get_caps_index(str(caps_dir), T1W_LINEAR)
+    assert len(index.read_files(["sub-01"], ["ses-M00"])) == 1
+    (caps_dir / "subjects/sub-01/ses-M00/other").mkdir()
+    assert len(index.read_files(["sub-01"], ["ses-M00"])) == 1
+
+    # A second image in another folder of the session is found by the same index
+    touch(
+        caps_dir,
+        f"subjects/sub-01/ses-M00/other/copy/sub-01_ses-M00_{T1W_SUFFIX}.nii.gz",
+    )
+    assert get_caps_index(str(caps_dir), T1W_LINEAR) is index
+    with pytest.raises(ClinicaCAPSError, match="More than 1 file found"):
+        index.read_files(["sub-01"], ["ses-M00"])
+    assert len(index.find("sub-01", "ses-M00")) == 2
@@ -0,0 +1,96 @@
+# coding: utf8
+
+import pytest
+import torch
+from torch.utils.data import DataLoader, Dataset, TensorDataset
+
+from clinicadl.utils.maps_manager import MapsManager
+from clinicadl.utils.maps_manager.maps_manager_utils import add_default_values
+
+
+def get_maps_manager(**parameters):
+    """Gives a MapsManager with the default training parameters, without any MAPS."""
+    maps_manager = MapsManager.__new__(MapsManager)
+    parameters = add_default_values({"network_task": "classification", **parameters})
+    for name, value in parameters.items():
+        setattr(maps_manager, name, value)
+    return maps_manager
+
+
+def test_default_options():
+    maps_manager = get_maps_manager(n_proc=0, pin_memory=True)
+    # Options of the workers are not given without workers, pin_memory needs a GPU
+    assert maps_manager._get_dataloader_options() == {
+        "num_workers": 0,
+        "pin_memory": torch.cuda.is_available(),
+    }
+    assert maps_manager._get_evaluation_batch_size() == maps_manager.batch_size
+
+
+@pytest.mark.parametrize("multiprocessing_context", ["default", "spawn"])
+def test_worker_options(multiprocessing_context):
+    maps_manager = get_maps_manager(
+        n_proc=2,
+        persistent_workers=True,
+        prefetch_factor=3,
+        multiprocessing_context=multiprocessing_context,
+        batch_size=4,
+        evaluation_batch_size=16,
+    )
+    options = maps_manager._get_dataloader_options()
+    expected_options = {
+        "num_workers": 2,
+        "pin_memory": False,
+        "persistent_workers": True,
+        "prefetch_factor": 3,
+    }
+    if multiprocessing_context != "default":
+        expected_options["multiprocessing_context"] = multiprocessing_context
+    assert options == expected_options
+    assert maps_manager._get_dataloader_options(n_proc=0)["num_workers"] == 0
+    assert maps_manager._get_evaluation_batch_size() == 16
+    assert maps_manager._get_evaluation_batch_size(batch_size=8) == 8
+
+    # The options are accepted by the DataLoader
+    dataset = TensorDataset(torch.arange(10))
+    dataloader = DataLoader(
+        dataset, batch_size=maps_manager._get_evaluation_batch_size(), **options
+    )
+    assert torch.equal(torch.cat([batch for batch, in dataloader]), torch.arange(10))
+
+
+class ModeDataset(Dataset):
+    """Dataset giving the index and the mode of its samples, like a CapsDataset."""
+
+    def __init__(self):
+        self.eval_mode = False
+
+    def eval(self):
+        self.eval_mode = True
+        return self
+
+    def __len__(self):
+        return 6
+
+    def __getitem__(self, idx):
+        return {"idx": idx, "eval_mode": self.eval_mode}
+
+
+@pytest.mark.parametrize("persistent_workers", [False, True])
+def test_evaluation_loader(persistent_workers):
+    maps_manager = get_maps_manager(
+        n_proc=2, persistent_workers=persistent_workers, batch_size=2
+    )
+    dataset = ModeDataset()
+    dataloader = maps_manager._get_evaluation_loader(dataset)
+    # Workers are only kept alive between evaluations with persistent_workers
+    assert dataloader.persistent_workers == persistent_workers
+
+    for _ in range(2):
+        samples = [sample for batch in dataloader for sample in batch["idx"].tolist()]
+        assert samples == list(range(6))
+        for batch in dataloader:
+            assert batch["eval_mode"].all()
+    # The mode of the original dataset is not changed
+    assert not dataset.eval_mode
+    assert dataloader.startup_time > 0
@@ -0,0 +1,104 @@
+# coding: utf8
+
+import pytest
+import torch
+from torch import nn
+from torch.utils.data import RandomSampler
+
+from clinicadl.utils.caps_dataset.sampler import DistributedSamplerWrapper
+from clinicadl.utils.distributed import (
+    DistributedNetwork,
+    all_gather_list,
+    all_reduce_sum,
+    get_rank,
+    get_world_size,
+    launch,
+)
+from clinicadl.utils.network.sub_network import CNN
+
+
+def get_model(seed):
+    torch.manual_seed(seed)
+    convolutions = nn.Sequential(nn.Conv2d(1, 4, 3), nn.ReLU(), nn.MaxPool2d(2))
+    fc = nn.Sequential(nn.Flatten(), nn.Linear(4 * 3 * 3, 3))
+    return CNN(convolutions, fc, n_classes=3, gpu=False)
+
+
+def get_batch():
+    generator = torch.Generator().manual_seed(1)
+    return {
+        "image": torch.randn(4, 1, 8, 8, generator=generator),
+        "label": torch.tensor([0, 1, 2, 1]),
+    }
+
+
+def train_step(model, network, data):
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.5)
+    _, loss_dict = network.compute_outputs_and_loss(data, nn.CrossEntropyLoss())
+    loss_dict["loss"].backward()
+    optimizer.step()
+
+
+def _distributed_step(output_path):
+    rank = get_rank()
+    assert get_world_size() == 2
+    assert all_gather_list([rank]) == [0, 1]
+    assert all_reduce_sum(rank + 1) == 3
+
+    # The weights of the process of rank 0 are given to all the processes
+    model = get_model(seed=rank)
+    network = DistributedNetwork(model)
+    data = {key: value[rank::2] for key, value in get_batch().items()}
+    train_step(model, network, data)
+    if rank == 0:
+        torch.save(model.state_dict(), output_path)
+
+
+def test_distributed_step(tmp_path):
+    launch(_distributed_step, 2, str(tmp_path / "model.pt"))
+    distributed_state = torch.load(tmp_path / "model.pt")
+
+    # A step on the full batch in a single process
+    model = get_model(seed=0)
+    train_step(model, model, get_batch())
+    for name, value in model.state_dict().items():
+        assert not torch.equal(value, get_model(seed=0).state_dict()[name])
+        assert torch.allclose(distributed_state[name], value, atol=1e-6)
+
+
+@pytest.mark.parametrize("n_indices", [1, 7, 8, 10])
+@pytest.mark.parametrize("num_replicas", [2, 3])
+def test_sampler_wrapper(n_indices, num_replicas):
+    sampler = RandomSampler(range(n_indices))
+    n_padded = -(-n_indices // num_replicas) * num_replicas
+
+    samplers = [
+        DistributedSamplerWrapper(sampler, num_replicas, rank, seed=3)
+        for rank in range(num_replicas)
+    ]
+    for epoch in range(2):
+        shards = [list(rank_sampler) for rank_sampler in samplers]
+        indices = [index for shard in shards for index in shard]
+        assert [len(shard) for shard in shards] == [len(samplers[0])] * num_replicas
+        assert len(indices) == n_padded
+        assert set(indices) == set(range(n_indices))
+        # Only the first indices of the order are repeated, once
+        order = [index for rank_indices in zip(*shards) for index in rank_indices]
+        assert order[n_indices:] == order[: n_padded - n_indices]
+        if epoch == 0:
+            first_order = order
+    # A new order is drawn at each epoch
+    if n_indices > 5:
+        assert order != first_order
+
+    samplers = [
+        DistributedSamplerWrapper(sampler, num_replicas, rank, seed=3, pad=False)
+        for rank in range(num_replicas)
+    ]
+    shards = [list(rank_sampler) for rank_sampler in samplers]
+    assert [len(shard) for shard in shards] == [
+        len(rank_sampler) for rank_sampler in samplers
+    ]
+    assert sorted(index for shard in shards for index in shard) == list(
+        range(n_indices)
+    )
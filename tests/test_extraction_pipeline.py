@@ -0,0 +1,110 @@
+# coding: utf8
+
+import os
+import threading
+import time
+
+import nibabel as nib
+import numpy as np
+import pytest
+import torch
+
+from clinicadl.prepare_data.extraction_pipeline import (
+    StagedPipeline,
+    compute_n_threads,
+    stream_extraction,
+)
+from clinicadl.utils.exceptions import ClinicaDLArgumentError
+
+
+def pipeline_threads():
+    return [
+        thread
+        for thread in threading.enumerate()
+        if thread.name.startswith(("double-", "add-"))
+    ]
+
+
+def get_pipeline(double_fn=None, queue_size=2):
+    def double(value):
+        # Outputs are completed in another order than the inputs
+        time.sleep(0.001 * (value % 3))
+        return 2 * value
+
+    return StagedPipeline(
+        [("double", double_fn or double, 3), ("add", lambda value: value + 1, 2)],
+        queue_size,
+    )
+
+
+def test_pipeline_outputs():
+    pipeline = get_pipeline()
+    outputs = list(pipeline.run(range(50)))
+
+    # Each input is yielded exactly once, with its position
+    assert sorted(position for position, _ in outputs) == list(range(50))
+    for position, output in outputs:
+        assert output == 2 * position + 1
+    assert pipeline.n_items == [50, 50]
+    assert pipeline_threads() == []
+
+    assert list(get_pipeline().run([])) == []
+
+
+def test_pipeline_error():
+    def double(value):
+        if value == 7:
+            raise RuntimeError("Decoding failed.")
+        return 2 * value
+
+    with pytest.raises(RuntimeError, match="Decoding failed."):
+        for _ in get_pipeline(double).run(range(50)):
+            pass
+    assert pipeline_threads() == []
+
+    # Errors of the inputs are raised too
+    def inputs():
+        yield 1
+        raise ValueError("Missing input.")
+
+    with pytest.raises(ValueError, match="Missing input."):
+        list(get_pipeline().run(inputs()))
+    assert pipeline_threads() == []
+
+
+def test_pipeline_close():
+    # Stopping the consumer stops the threads, although inputs remain
+    outputs = get_pipeline().run(range(1000))
+    assert next(outputs)[1] % 2 == 1
+    outputs.close()
+    assert pipeline_threads() == []
+
+
+def test_n_threads():
+    assert compute_n_threads(3) == 3
+    assert compute_n_threads(-1) == os.cpu_count()
+    assert compute_n_threads(-os.cpu_count() - 5) == 1
+    with pytest.raises(ClinicaDLArgumentError):
+        compute_n_threads(0)
+    with pytest.raises(ClinicaDLArgumentError):
+        StagedPipeline([("double", lambda value: 2 * value, 0)])
+
+
+def test_stream_extraction(tmp_path):
+    input_files = list()
+    for idx in range(5):
+        input_file = str(tmp_path / f"image-{idx}.nii.gz")
+        nib.save(
+            nib.Nifti1Image(np.full((4, 5, 6), idx, np.float32), np.eye(4)), input_file
+        )
+        input_files.append(input_file)
+
+    def extract_fn(nii_path, image_tensor):
+        return [(nii_path, image_tensor.mean())]
+
+    outputs = list(stream_extraction(input_files, extract_fn, n_extractors=-1))
+    assert sorted(position for position, _ in outputs) == list(range(5))
+    for position, output_mode in outputs:
+        ((nii_path, value),) = output_mode
+        assert nii_path == input_files[position]
+        assert value == torch.tensor(float(position))
@@ -0,0 +1,240 @@
+# coding: utf8
+
+import nibabel as nib
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+from clinicadl.prepare_data.prepare_data import DeepLearningPrepareData
+from clinicadl.prepare_data.prepare_data_utils import PatchGrid
+from clinicadl.utils.caps_dataset.data import return_dataset
+from clinicadl.utils.caps_dataset.foreground import (
+    ForegroundIndex,
+    compute_bounding_box,
+    compute_foreground_mask,
+    compute_foreground_patches,
+    get_foreground_index_path,
+)
+from clinicadl.utils.caps_dataset.sampler import ImageGroupedSampler
+from clinicadl.utils.preprocessing import read_preprocessing
+from clinicadl.utils.task_manager import ClassificationManager
+from tests.testing_tools import create_t1_linear_caps
+
+
+def test_foreground_index(tmp_path):
+    index_path = str(tmp_path / "tensor_extraction" / "extract_foreground.tsv")
+    foreground_index = ForegroundIndex(index_path)
+    foreground_index.add("sub-01", "ses-M00", ((0, 10), (2, 8), (1, 5)), [0, 3, 4])
+    foreground_index.add("sub-02", "ses-M00", ((1, 2), (0, 3), (0, 3)))
+    # The last entry of an image replaces the previous ones
+    foreground_index.add("sub-01", "ses-M00", ((0, 10), (2, 9), (1, 5)), [3])
+
+    loaded_index = ForegroundIndex(index_path)
+    assert len(loaded_index) == 2
+    assert ("sub-02", "ses-M00") in loaded_index
+    assert loaded_index.get_bounding_box("sub-01", "ses-M00") == (
+        (0, 10),
+        (2, 9),
+        (1, 5),
+    )
+    assert loaded_index.get_patch_ids("sub-01", "ses-M00").tolist() == [3]
+    assert loaded_index.get_patch_ids("sub-02", "ses-M00").tolist() == []
+    with pytest.raises(KeyError):
+        loaded_index.get_patch_ids("sub-03", "ses-M00")
+
+
+@pytest.mark.parametrize("patch_size,stride_size", [(4, 4), (4, 3), (5, 2), (3, 6)])
+def test_foreground_patches(patch_size, stride_size):
+    generator = torch.Generator().manual_seed(0)
+    mask = torch.rand(1, 11, 12, 13, generator=generator) > 0.7
+    mask[:, :5] = True
+
+    # Indices are the ones of the patch grid
+    patch_grid = PatchGrid((1, 11, 12, 13), patch_size, stride_size)
+    expected = [
+        patch_index
+        for patch_index in range(len(patch_grid))
+        if patch_grid.extract(mask.float(), patch_index).mean() >= 0.5
+    ]
+    assert 0 < len(expected) < len(patch_grid)
+    assert compute_foreground_patches(mask[0], patch_size, stride_size, 0.5) == expected
+
+    # The patch with the most foreground is kept if no patch reaches the threshold
+    mask = torch.zeros(11, 12, 13, dtype=torch.bool)
+    # Only the last patch contains its last voxel
+    x, y, z = patch_grid.coordinates(len(patch_grid) - 1)
+    mask[x + patch_size - 1, y + patch_size - 1, z + patch_size - 1] = True
+    assert compute_foreground_patches(mask, patch_size, stride_size, 0.5) == [
+        len(patch_grid) - 1
+    ]
+
+
+def test_foreground_mask_nan():
+    image_tensor = torch.zeros(1, 10, 12, 11)
+    image_tensor[0, 2:6, 3:9, 4:7] = 100
+    mask = compute_foreground_mask(image_tensor)
+    assert compute_bounding_box(mask) == ((2, 6), (3, 9), (4, 7))
+
+    # NaN values do not hide the foreground
+    image_tensor[0, 0, 0, 0] = float("nan")
+    assert torch.equal(compute_foreground_mask(image_tensor), mask)
+    assert len(compute_foreground_patches(mask, 3, 3, 0.5)) > 1
+
+
+@pytest.fixture
+def caps_dir(tmp_path):
+    caps_dir = tmp_path / "caps"
+    tsv_path = create_t1_linear_caps(caps_dir, ["sub-01", "sub-02", "sub-03"])
+    # Images with different foregrounds
+    foregrounds = [
+        (slice(0, 20), slice(0, 24), slice(0, 22)),
+        (slice(2, 10), slice(4, 16), slice(3, 12)),
+        (slice(12, 20), slice(0, 8), slice(14, 22)),
+    ]
+    for image_path, foreground in zip(
+        sorted(caps_dir.rglob("*_T1w.nii.gz")), foregrounds
+    ):
+        image = np.zeros((20, 24, 22), dtype=np.float32)
+        image[foreground] = np.random.default_rng(0).random(image[foreground].shape)
+        image[foreground] += 1
+        nib.save(nib.Nifti1Image(image, np.eye(4)), image_path)
+    data_df = pd.read_csv(tsv_path, sep="\t")
+    data_df["cohort"] = "single"
+    return caps_dir, data_df
+
+
+def get_patch_dataset(caps_dir, data_df, foreground_threshold):
+    extract_json = f"extract_{foreground_threshold}.json"
+    DeepLearningPrepareData(
+        caps_directory=str(caps_dir),
+        tsv_file=str(caps_dir.parent / "subjects.tsv"),
+        n_proc=1,
+        parameters={
+            "mode": "patch",
+            "patch_size": 6,
+            "stride_size": 4,
+            "foreground_threshold": foreground_threshold,
+            "preprocessing": "t1-linear",
+            "use_uncropped_image": True,
+            "prepare_dl": True,
+            "extract_json": extract_json,
+        },
+    )
+    return return_dataset(
+        str(caps_dir),
+        data_df,
+        read_preprocessing(str(caps_dir / "tensor_extraction" / extract_json)),
+        None,
+        label_presence=False,
+    )
+
+
+def test_patch_dataset_elem_table(caps_dir):
+    caps_dir, data_df = caps_dir
+    dataset = get_patch_dataset(caps_dir, data_df, 0.5)
+    full_dataset = get_patch_dataset(caps_dir, data_df, None)
+    n_patches = full_dataset.elem_per_image
+    foreground_index = ForegroundIndex(
+        get_foreground_index_path(str(caps_dir), "extract_0.5.json")
+    )
+
+    patch_ids_list = [
+        foreground_index.get_patch_ids(participant, "ses-M00").tolist()
+        for participant in data_df.participant_id
+    ]
+    assert len(patch_ids_list[0]) == n_patches
+    assert 0 < len(patch_ids_list[1]) < n_patches
+    assert 0 < len(patch_ids_list[2]) < n_patches
+    assert dataset.num_elem_of_images().tolist() == [
+        len(patch_ids) for patch_ids in patch_ids_list
+    ]
+    assert len(dataset) == sum(len(patch_ids) for patch_ids in patch_ids_list)
+
+    # Samples are the foreground patches, image by image, with their index in the grid
+    idx = 0
+    for image_idx, patch_ids in enumerate(patch_ids_list):
+        for patch_id in patch_ids:
+            sample = dataset[idx]
+            full_sample = full_dataset[image_idx * n_patches + patch_id]
+            assert sample["participant_id"] == data_df.participant_id[image_idx]
+            assert sample["patch_id"] == patch_id
+            assert torch.equal(sample["image"], full_sample["image"])
+            idx += 1
+
+
+@pytest.mark.parametrize("window", [1, 2, 5])
+def test_grouped_sampler_counts(window):
+    elem_counts = [3, 0, 5, 2, 1]
+    offsets = np.cumsum(elem_counts) - elem_counts
+    sampler = ImageGroupedSampler(
+        len(elem_counts), elem_counts, window, torch.Generator().manual_seed(0)
+    )
+    assert len(sampler) == sum(elem_counts)
+
+    indices = list(sampler)
+    assert sorted(indices) == list(range(sum(elem_counts)))
+    image_indices = np.searchsorted(offsets, indices, side="right") - 1
+    if window == 1:
+        # The elements of an image are yielded in a row
+        changes = np.count_nonzero(np.diff(image_indices))
+        assert changes == np.count_nonzero(elem_counts) - 1
+
+
+def test_soft_voting_without_weights():
+    task_manager = ClassificationManager("patch", n_classes=2)
+    columns = task_manager.columns
+    # Patch 2 is not seen in validation and patch 1 is below the selection threshold
+    validation_df = pd.DataFrame(
+        [
+            ["sub-01", "ses-M00", 0, 0, 0, 0.8, 0.2],
+            ["sub-01", "ses-M00", 1, 0, 1, 0.4, 0.6],
+        ],
+        columns=columns,
+    )
+    performance_df = pd.DataFrame(
+        [
+            ["sub-02", "ses-M00", 1, 1, 1, 0.3, 0.7],
+            ["sub-02", "ses-M00", 2, 1, 0, 0.6, 0.4],
+            ["sub-03", "ses-M00", 0, 1, 1, 0.1, 0.9],
+        ],
+        columns=columns,
+    )
+    df_final, _ = task_manager.ensemble_prediction(
+        performance_df, validation_df, selection_threshold=0.5
+    )
+    df_final.set_index("participant_id", inplace=True)
+    assert df_final.loc["sub-02", "proba1"] == pytest.approx(0.55)
+    assert df_final.loc["sub-03", "proba1"] == pytest.approx(0.9)
+
+
+def test_image_dataset_size(caps_dir):
+    caps_dir, data_df = caps_dir
+    data_df = data_df[data_df.participant_id != "sub-01"].reset_index(drop=True)
+    tsv_path = caps_dir.parent / "foreground.tsv"
+    data_df[["participant_id", "session_id"]].to_csv(tsv_path, sep="\t", index=False)
+    DeepLearningPrepareData(
+        caps_directory=str(caps_dir),
+        tsv_file=str(tsv_path),
+        n_proc=1,
+        parameters={
+            "mode": "image",
+            "foreground_threshold": 0.5,
+            "preprocessing": "t1-linear",
+            "use_uncropped_image": True,
+            "prepare_dl": True,
+            "extract_json": "extract_image.json",
+        },
+    )
+    preprocessing_dict = read_preprocessing(
+        str(caps_dir / "tensor_extraction" / "extract_image.json")
+    )
+    # Images are cropped to the union of their foregrounds
+    assert preprocessing_dict["foreground_bbox"] == [[2, 20], [0, 16], [3, 22]]
+
+    dataset = return_dataset(
+        str(caps_dir), data_df, preprocessing_dict, None, label_presence=False
+    )
+    assert dataset.size == (1, 18, 16, 19)
+    for idx in range(len(dataset)):
+        assert dataset[idx]["image"].shape == dataset.size
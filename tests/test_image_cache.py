@@ -0,0 +1,104 @@
+# coding: utf8
+
+from collections import Counter
+
+import pandas as pd
+import pytest
+import torch
+
+from clinicadl.utils.caps_dataset.data import ImageCache
+from clinicadl.utils.caps_dataset.sampler import ImageGroupedSampler
+from clinicadl.utils.exceptions import ClinicaDLArgumentError
+from clinicadl.utils.task_manager import ReconstructionManager
+
+
+@pytest.fixture
+def image_paths(tmp_path):
+    # Images of 64 KB each
+    paths = list()
+    for idx in range(4):
+        image_path = str(tmp_path / f"image-{idx}.pt")
+        torch.save(torch.full((1, 16, 32, 32), float(idx)), image_path)
+        paths.append(image_path)
+    return paths
+
+
+def test_image_cache_eviction(image_paths):
+    cache = ImageCache(max_size=0.125)  # 2 images
+    assert cache.hit_rate is None
+
+    for idx in [0, 1, 0, 2]:
+        assert torch.equal(
+            cache.get(image_paths[idx]), torch.full((1, 16, 32, 32), float(idx))
+        )
+    # The least recently used image (1) was removed to stay within the bound
+    assert list(cache._images) == image_paths[0:3:2]
+    assert cache.size == 2 * 2**16
+    assert cache.hit_rate == 0.25
+
+    cache.get(image_paths[0])
+    cache.get(image_paths[1])
+    assert list(cache._images) == [image_paths[0], image_paths[1]]
+    assert cache.hit_rate == 2 / 6
+
+    cache.reset_stats()
+    assert cache.hit_rate is None
+
+
+def test_image_cache_bound(image_paths):
+    # Images larger than the cache are loaded without being stored
+    cache = ImageCache(max_size=0.05)
+    for _ in range(2):
+        assert torch.equal(cache.get(image_paths[3]), torch.full((1, 16, 32, 32), 3.0))
+    assert len(cache._images) == 0
+    assert cache.size == 0
+    assert cache.hit_rate == 0
+
+
+@pytest.mark.parametrize("window", [1, 2, 3, 5])
+def test_grouped_sampler(window):
+    n_images, elem_per_image = 5, 4
+    sampler = ImageGroupedSampler(n_images, elem_per_image, window)
+    indices = list(sampler)
+    assert len(indices) == len(sampler) == n_images * elem_per_image
+    assert sorted(indices) == list(range(n_images * elem_per_image))
+
+    # Consecutive indices of each group of elements come from window images
+    group_size = window * elem_per_image
+    for start in range(0, len(indices), group_size):
+        images = Counter(idx // elem_per_image for idx in indices[start:][:group_size])
+        assert len(images) == min(window, n_images - start // elem_per_image)
+        assert set(images.values()) == {elem_per_image}
+
+    with pytest.raises(ClinicaDLArgumentError):
+        ImageGroupedSampler(n_images, elem_per_image, window=0)
+
+
+def test_grouped_sampler_generator():
+    class Dataset:
+        df = pd.DataFrame({"participant_id": [f"sub-{idx}" for idx in range(6)]})
+        elem_per_image = 3
+
+        def __len__(self):
+            return 18
+
+        def num_elem_of_images(self):
+            return [3] * 6
+
+    def get_indices(seed):
+        sampler = ReconstructionManager.generate_sampler(
+            Dataset(),
+            "grouped",
+            window=2,
+            generator=torch.Generator().manual_seed(seed),
+        )
+        return [list(sampler) for _ in range(3)]
+
+    # The order only depends on the seed, not on the global random state
+    torch.manual_seed(1)
+    indices = get_indices(0)
+    torch.manual_seed(2)
+    assert get_indices(0) == indices
+    assert get_indices(1) != indices
+    # Each epoch has a different order
+    assert indices[0] != indices[1]
@@ -0,0 +1,62 @@
+# coding: utf8
+
+import pytest
+import torch
+from torch import nn
+
+from clinicadl.utils.network.cnn.models import Conv4_FC3
+from clinicadl.utils.network.mixed_precision import (
+    compute_outputs_and_loss,
+    get_grad_scaler,
+)
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    return Conv4_FC3(input_size=[1, 32, 32], gpu=False, output_size=3).eval()
+
+
+@pytest.fixture
+def data():
+    generator = torch.Generator().manual_seed(1)
+    return {
+        "image": torch.rand(4, 1, 32, 32, generator=generator),
+        "label": torch.tensor([0, 1, 2, 1]),
+    }
+
+
+def test_amp_outputs(model, data):
+    criterion = nn.CrossEntropyLoss()
+    outputs, loss_dict = compute_outputs_and_loss(model, data, criterion, amp=False)
+    amp_outputs, amp_loss_dict = compute_outputs_and_loss(
+        model, data, criterion, amp=True
+    )
+
+    assert amp_outputs.dtype == torch.float32
+    assert amp_loss_dict["loss"].dtype == torch.float32
+    assert torch.allclose(amp_outputs, outputs, rtol=0.05, atol=0.05)
+    assert abs(amp_loss_dict["loss"].item() - loss_dict["loss"].item()) < 0.05 * abs(
+        loss_dict["loss"].item()
+    )
+
+
+def test_amp_backward(model, data):
+    criterion = nn.CrossEntropyLoss()
+    _, loss_dict = compute_outputs_and_loss(model, data, criterion, amp=False)
+    loss_dict["loss"].backward()
+    gradient = torch.cat([param.grad.flatten() for param in model.parameters()])
+    model.zero_grad()
+
+    # The scaler is only used for float16 on GPU
+    scaler = get_grad_scaler(model.device, True)
+    assert not scaler.is_enabled()
+    _, amp_loss_dict = compute_outputs_and_loss(model, data, criterion, amp=True)
+    scaler.scale(amp_loss_dict["loss"]).backward()
+    for param in model.parameters():
+        assert param.dtype == torch.float32
+        assert param.grad.dtype == torch.float32
+    # Gradients of bfloat16 operations are less precise but have the same direction
+    amp_gradient = torch.cat([param.grad.flatten() for param in model.parameters()])
+    assert torch.isfinite(amp_gradient).all()
+    assert torch.cosine_similarity(amp_gradient, gradient, dim=0) > 0.95
@@ -0,0 +1,141 @@
+# coding: utf8
+
+import pandas as pd
+import torch
+from torch import nn
+from torch.utils.data import DataLoader
+
+from clinicadl.prepare_data.prepare_data import DeepLearningPrepareData
+from clinicadl.utils.caps_dataset.data import return_dataset
+from clinicadl.utils.caps_dataset.sampler import ImageBatchSampler
+from clinicadl.utils.network.multi_network import MultiCNN
+from clinicadl.utils.network.sub_network import CNN
+from clinicadl.utils.preprocessing import read_preprocessing
+from clinicadl.utils.task_manager import ClassificationManager
+from tests.testing_tools import create_t1_linear_caps
+
+
+def get_network():
+    convolutions = nn.Sequential(
+        nn.Conv2d(1, 4, 3), nn.BatchNorm2d(4), nn.ReLU(), nn.MaxPool2d(2)
+    )
+    fc = nn.Sequential(nn.Flatten(), nn.Linear(4 * 3 * 3, 2))
+    return CNN(convolutions, fc, n_classes=2, gpu=False)
+
+
+def get_batch(generator, n_images=4, n_networks=3):
+    # Elements of an image are consecutive in the batches
+    return {
+        "image": torch.randn(n_images * n_networks, 1, 8, 8, generator=generator),
+        "label": torch.randint(2, (n_images,), generator=generator).repeat_interleave(
+            n_networks
+        ),
+    }
+
+
+def clone_state(network):
+    return {name: value.clone() for name, value in network.state_dict().items()}
+
+
+def test_freeze_network():
+    torch.manual_seed(0)
+    generator = torch.Generator().manual_seed(1)
+    model = MultiCNN([get_network() for _ in range(3)])
+    criterion = nn.CrossEntropyLoss()
+    # Momentum and weight decay would move weights without gradients
+    optimizer = torch.optim.SGD(
+        model.parameters(), lr=0.1, momentum=0.9, weight_decay=0.1
+    )
+
+    def train_step():
+        model.train()
+        optimizer.zero_grad()
+        _, loss_dict = model.compute_outputs_and_loss(get_batch(generator), criterion)
+        loss_dict["loss"].backward()
+        optimizer.step()
+        return loss_dict
+
+    train_step()
+    model.freeze_network(1)
+    frozen_state = clone_state(model.networks[1])
+    trained_state = clone_state(model.networks[2])
+
+    for _ in range(3):
+        loss_dict = train_step()
+        network_losses = loss_dict["network_losses"]
+        assert torch.isclose(loss_dict["loss"], network_losses[0] + network_losses[2])
+
+    # Weights and normalization statistics of the frozen network are unchanged
+    assert not model.networks[1].training
+    for name, value in model.networks[1].state_dict().items():
+        assert torch.equal(value, frozen_state[name])
+    for param in model.networks[1].parameters():
+        assert param.grad is None
+    assert not all(
+        torch.equal(value, trained_state[name])
+        for name, value in model.networks[2].state_dict().items()
+    )
+
+
+def test_networks_metrics(tmp_path):
+    # Slices are identified from the first slice which is not discarded
+    caps_dir = tmp_path / "caps"
+    tsv_path = create_t1_linear_caps(
+        caps_dir, [f"sub-0{i}" for i in range(6)], image_shape=(10, 8, 8)
+    )
+    DeepLearningPrepareData(
+        caps_directory=str(caps_dir),
+        tsv_file=str(tsv_path),
+        n_proc=1,
+        parameters={
+            "mode": "slice",
+            "slice_mode": "single",
+            "slice_direction": 0,
+            "discarded_slices": [2, 3],
+            "preprocessing": "t1-linear",
+            "use_uncropped_image": True,
+            "prepare_dl": True,
+            "extract_json": "extract_slice.json",
+        },
+    )
+    data_df = pd.read_csv(tsv_path, sep="\t")
+    data_df["diagnosis"] = ["AD", "CN"] * 3
+    data_df["cohort"] = "single"
+    preprocessing_dict = read_preprocessing(
+        str(caps_dir / "tensor_extraction" / "extract_slice.json")
+    )
+
+    def get_dataset(cnn_index=None):
+        return return_dataset(
+            str(caps_dir),
+            data_df,
+            preprocessing_dict,
+            None,
+            label="diagnosis",
+            label_code={"AD": 0, "CN": 1},
+            cnn_index=cnn_index,
+        )
+
+    dataset = get_dataset()
+    n_networks = dataset.elem_per_image
+    assert n_networks == 5
+    torch.manual_seed(0)
+    model = MultiCNN([get_network() for _ in range(n_networks)])
+    task_manager = ClassificationManager("slice", n_classes=2)
+    criterion = nn.CrossEntropyLoss()
+    # A single batch, so that the sum of the losses of the batches is the same
+    dataloader = DataLoader(
+        dataset, batch_sampler=ImageBatchSampler(range(6), n_networks, 6)
+    )
+    metrics_list = task_manager.test_networks(model, dataloader, criterion)
+
+    for network in range(n_networks):
+        results_df, metrics_dict = task_manager.test(
+            model.networks[network],
+            DataLoader(get_dataset(cnn_index=network), batch_size=6),
+            criterion,
+        )
+        assert (results_df.slice_id == network + 2).all()
+        assert metrics_list[network].keys() == metrics_dict.keys()
+        for key, value in metrics_dict.items():
+            assert abs(metrics_list[network][key] - value) < 1e-5
@@ -0,0 +1,81 @@
+# coding: utf8
+
+import gzip
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from clinicadl.utils import nifti
+from clinicadl.utils.nifti import load_nifti_image, read_nifti
+
+
+def get_image(image_class=nib.Nifti1Image, dtype=np.float32):
+    rng = np.random.default_rng(0)
+    image_np = (rng.random((7, 8, 9)) * 1000).astype(dtype)
+    affine = np.diag([1.5, 2.0, 1.0, 1.0])
+    image = image_class(image_np, affine)
+    if np.issubdtype(dtype, np.integer):
+        # Voxel values are scaled when they are read
+        image.header.set_slope_inter(0.25, -3.0)
+    return image
+
+
+@pytest.mark.parametrize(
+    "image_class,dtype,filename",
+    [
+        (nib.Nifti1Image, np.float32, "image.nii"),
+        (nib.Nifti1Image, np.float32, "image.nii.gz"),
+        (nib.Nifti1Image, np.int16, "image.nii.gz"),
+        (nib.Nifti2Image, np.float32, "image.nii"),
+        (nib.Nifti2Image, np.int16, "image.nii.gz"),
+    ],
+)
+def test_read_nifti(tmp_path, image_class, dtype, filename):
+    nii_path = str(tmp_path / filename)
+    nib.save(get_image(image_class, dtype), nii_path)
+
+    expected = nib.load(nii_path).get_fdata(dtype=np.float32)
+    image_np = read_nifti(nii_path)
+    assert image_np.dtype == np.float32
+    np.testing.assert_array_equal(image_np, expected)
+
+    image = load_nifti_image(nii_path)
+    assert isinstance(image, image_class)
+    np.testing.assert_array_equal(image.affine, nib.load(nii_path).affine)
+
+
+def test_read_multi_member_gzip(tmp_path):
+    nii_path = str(tmp_path / "image.nii")
+    nib.save(get_image(), nii_path)
+    with open(nii_path, "rb") as nii_file:
+        data = nii_file.read()
+    # Files compressed in several parts are read entirely
+    gz_path = str(tmp_path / "image.nii.gz")
+    with open(gz_path, "wb") as gz_file:
+        gz_file.write(gzip.compress(data[:1000]))
+        gz_file.write(gzip.compress(data[1000:]))
+
+    np.testing.assert_array_equal(
+        read_nifti(gz_path), nib.load(nii_path).get_fdata(dtype=np.float32)
+    )
+
+
+def test_nifti_cache(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    nii_path = str(tmp_path / "image.nii.gz")
+    nib.save(get_image(), nii_path)
+    image_np = read_nifti(nii_path, cache_dir)
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+
+    # Volumes are read from the cache without decoding the image
+    def fail(*args):
+        raise AssertionError("The image was decoded again.")
+
+    monkeypatch.setattr(nifti, "_image_from_bytes", fail)
+    np.testing.assert_array_equal(read_nifti(nii_path, cache_dir), image_np)
+
+    # Entries are indexed by the content of the images
+    nib.save(get_image(dtype=np.int16), nii_path)
+    with pytest.raises(AssertionError, match="decoded again"):
+        read_nifti(nii_path, cache_dir)
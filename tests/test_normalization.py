@@ -0,0 +1,93 @@
+# coding: utf8
+
+import pytest
+import torch
+from torchvision import transforms
+
+from clinicadl.prepare_data.prepare_data_utils import extract_patch_tensor
+from clinicadl.utils.caps_dataset.data import (
+    MinMaxNormalization,
+    NanRemoval,
+    Normalization,
+)
+from clinicadl.utils.caps_dataset.image_statistics import (
+    ImageStatistics,
+    compute_image_statistics,
+    normalize_tensor,
+)
+from clinicadl.utils.exceptions import ClinicaDLConfigurationError
+
+
+@pytest.fixture
+def image_tensor():
+    image_tensor = torch.randn(
+        1, 10, 12, 11, generator=torch.Generator().manual_seed(0)
+    )
+    image_tensor[0, 2, 3, 4] = float("nan")
+    image_tensor[0, 7, :, 5] = float("nan")
+    return image_tensor
+
+
+def test_normalization(image_tensor):
+    statistics = compute_image_statistics(image_tensor)
+    assert statistics.has_nan
+    expected = transforms.Compose([NanRemoval(), MinMaxNormalization()])(image_tensor)
+
+    # Statistics are computed on the tensor, or given by the dataset
+    transform = Normalization().configure(None, elements_are_images=True)
+    assert torch.allclose(transform(image_tensor.clone()), expected)
+    assert torch.allclose(transform(image_tensor.clone(), statistics), expected)
+    assert torch.allclose(normalize_tensor(image_tensor.clone()), expected)
+
+    # NaN values are only removed without normalization
+    transform = Normalization(normalize=False).configure(None, True)
+    assert torch.equal(transform(image_tensor.clone()), NanRemoval()(image_tensor))
+    assert torch.equal(
+        transform(image_tensor.clone(), statistics), NanRemoval()(image_tensor)
+    )
+
+    # Tensors of images without NaN values are not scanned
+    transform = Normalization().configure(None, True)
+    clean_tensor = torch.nan_to_num(image_tensor)
+    assert torch.allclose(
+        transform(clean_tensor, ImageStatistics(False, *statistics[1:])),
+        MinMaxNormalization()(clean_tensor),
+    )
+
+
+# Patches 4 and 19 contain NaN values
+@pytest.mark.parametrize("patch_index", [0, 4, 19])
+def test_normalization_scopes(image_tensor, patch_index):
+    statistics = compute_image_statistics(image_tensor)
+    patch_tensor = extract_patch_tensor(image_tensor, 4, 3, patch_index)
+    clean_patch = NanRemoval()(patch_tensor)
+
+    transform = Normalization(scope="element").configure(None, False)
+    assert torch.allclose(
+        transform(patch_tensor.clone(), statistics), MinMaxNormalization()(clean_patch)
+    )
+
+    image_min, image_max = statistics.min, statistics.max
+    transform = Normalization(scope="image").configure(None, False)
+    assert torch.allclose(
+        transform(patch_tensor.clone(), statistics),
+        (clean_patch - image_min) / (image_max - image_min),
+    )
+    with pytest.raises(ClinicaDLConfigurationError):
+        transform(patch_tensor.clone())
+
+
+def test_prenormalized(image_tensor):
+    normalized_tensor = normalize_tensor(image_tensor)
+    patch_tensor = extract_patch_tensor(normalized_tensor, 4, 3, 5)
+
+    # Tensors normalized by prepare_data are not normalized again
+    transform = Normalization().configure("image", True)
+    assert transform(normalized_tensor) is normalized_tensor
+    transform = Normalization(scope="image").configure("image", False)
+    assert transform(patch_tensor) is patch_tensor
+    transform = Normalization(scope="element").configure("image", False)
+    assert torch.allclose(transform(patch_tensor), MinMaxNormalization()(patch_tensor))
+
+    with pytest.raises(ClinicaDLConfigurationError):
+        Normalization(scope="image").configure("element", False)
@@ -0,0 +1,134 @@
+# coding: utf8
+
+import concurrent.futures
+import logging
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+import torch
+
+from clinicadl.utils.exceptions import MAPSError
+from clinicadl.utils.maps_manager import maps_manager as maps_manager_module
+from tests.test_data_pipeline import get_maps_manager
+
+
+class ThreadPoolExecutor(concurrent.futures.ThreadPoolExecutor):
+    """Runs the splits in threads of the test process, where the training is replaced."""
+
+    def __init__(self, max_workers, mp_context=None):
+        super().__init__(max_workers)
+
+
+def fake_train_split_process(calls, failed_split=None):
+    def train_split_process(maps_path, split, resume, n_threads, n_proc, logging_level):
+        calls.append((split, n_threads, n_proc))
+        if split == failed_split:
+            raise RuntimeError(f"Split {split} diverged.")
+        beginning = datetime(2024, 1, 1, 10, 0, 0)
+        return beginning, beginning + timedelta(minutes=split + 1)
+
+    return train_split_process
+
+
+# DataLoader workers of each process with 4 and 2 processes, 0 means no worker
+@pytest.mark.parametrize(
+    "n_proc,expected_n_proc", [(8, [2, 4]), (5, [1, 2]), (2, [1, 1]), (0, [0, 0])]
+)
+def test_parallel_splits_resources(tmp_path, monkeypatch, n_proc, expected_n_proc):
+    calls = list()
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(
+        maps_manager_module, "_train_split_process", fake_train_split_process(calls)
+    )
+    monkeypatch.setattr(torch, "get_num_threads", lambda: 12)
+    maps_manager = get_maps_manager(
+        maps_path=str(tmp_path), parallel_splits=4, n_proc=n_proc
+    )
+
+    # Threads and workers are shared between the processes training at the same time
+    maps_manager._train_parallel_splits([0, 1, 2, 3, 4])
+    assert sorted(calls) == [(split, 3, expected_n_proc[0]) for split in range(5)]
+
+    calls.clear()
+    maps_manager._train_parallel_splits([0, 1])
+    assert sorted(calls) == [(split, 6, expected_n_proc[1]) for split in range(2)]
+
+
+def test_parallel_splits_failure(tmp_path, monkeypatch):
+    calls = list()
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(
+        maps_manager_module,
+        "_train_split_process",
+        fake_train_split_process(calls, failed_split=1),
+    )
+    maps_manager = get_maps_manager(maps_path=str(tmp_path), parallel_splits=2)
+
+    # The other splits are trained before the error is raised
+    with pytest.raises(MAPSError, match=r"\[1\]") as error:
+        maps_manager._train_parallel_splits([0, 1, 2])
+    assert isinstance(error.value.__cause__, RuntimeError)
+    assert sorted(split for split, _, _ in calls) == [0, 1, 2]
+
+    times_df = pd.read_csv(tmp_path / "training_times.tsv", sep="\t")
+    assert times_df.split.tolist() == [0, 2]
+    assert times_df.duration.tolist() == [60.0, 180.0]
+    assert not times_df.resumed.any()
+
+
+def test_write_split_time(tmp_path):
+    maps_manager = get_maps_manager(maps_path=str(tmp_path))
+    beginning = datetime(2024, 1, 1, 10, 0, 0)
+    for split in [1, 0]:
+        maps_manager._write_split_time(
+            split, beginning, beginning + timedelta(seconds=30)
+        )
+    # A resumed training adds a row after the previous ones of the split
+    maps_manager._write_split_time(
+        0, beginning, beginning + timedelta(seconds=10), resume=True
+    )
+    times_df = pd.read_csv(tmp_path / "training_times.tsv", sep="\t")
+    assert times_df.split.tolist() == [0, 0, 1]
+    assert times_df.duration.tolist() == [30.0, 10.0, 30.0]
+    assert times_df.resumed.tolist() == [False, True, False]
+    assert times_df.beginning[0] == "2024-01-01 10:00:00"
+
+    # A new training replaces the rows of the split
+    maps_manager._write_split_time(
+        0, beginning, beginning + timedelta(seconds=20), resume=False
+    )
+    times_df = pd.read_csv(tmp_path / "training_times.tsv", sep="\t")
+    assert times_df.split.tolist() == [0, 1]
+    assert times_df.duration.tolist() == [20.0, 30.0]
+
+
+def test_train_split_process(tmp_path, monkeypatch, capsys):
+    trained = list()
+
+    class MapsManager:
+        def __init__(self, maps_path, verbose=None):
+            self.parameters = {"n_proc": 8}
+
+        def _train_split(self, split, resume=False):
+            trained.append((split, self.parameters["n_proc"], torch.get_num_threads()))
+            logging.getLogger("clinicadl.maps_manager").info("Beginning epoch 0.")
+
+    monkeypatch.setattr(maps_manager_module, "MapsManager", MapsManager)
+    clinicadl_logger = logging.getLogger("clinicadl")
+    handlers, level = list(clinicadl_logger.handlers), clinicadl_logger.level
+    n_threads = torch.get_num_threads()
+    try:
+        beginning, end = maps_manager_module._train_split_process(
+            str(tmp_path), 3, False, 1, 2, logging.INFO
+        )
+    finally:
+        torch.set_num_threads(n_threads)
+        clinicadl_logger.handlers = handlers
+        clinicadl_logger.setLevel(level)
+
+    # Each process trains its split with its part of the resources
+    assert trained == [(3, 2, 1)]
+    assert beginning <= end
+    # Logs of the split are identified by their prefix
+    assert "Split 3 - Beginning epoch 0." in capsys.readouterr().out
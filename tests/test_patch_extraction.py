@@ -0,0 +1,63 @@
+# coding: utf8
+
+import pytest
+import torch
+
+from clinicadl.prepare_data.prepare_data_utils import (
+    PatchGrid,
+    extract_patch_tensor,
+    extract_patches,
+)
+from clinicadl.utils.exceptions import ClinicaDLArgumentError
+
+
+def unfold_patches(image_tensor, patch_size, stride_size):
+    """Patches as they were extracted with successive unfold operations."""
+    patches_tensor = (
+        image_tensor.unfold(1, patch_size, stride_size)
+        .unfold(2, patch_size, stride_size)
+        .unfold(3, patch_size, stride_size)
+        .contiguous()
+    )
+    return patches_tensor.view(-1, patch_size, patch_size, patch_size)
+
+
+@pytest.mark.parametrize(
+    "patch_size,stride_size", [(5, 5), (5, 3), (4, 7), (6, 1), (12, 4)]
+)
+def test_patch_grid(patch_size, stride_size):
+    image_tensor = torch.randn(1, 12, 15, 13)
+    patches_tensor = unfold_patches(image_tensor, patch_size, stride_size)
+
+    patch_grid = PatchGrid(tuple(image_tensor.shape), patch_size, stride_size)
+    assert len(patch_grid) == patches_tensor.shape[0]
+    for patch_index in range(len(patch_grid)):
+        patch_tensor = extract_patch_tensor(
+            image_tensor, patch_size, stride_size, patch_index
+        )
+        assert patch_tensor.shape == (1, patch_size, patch_size, patch_size)
+        assert patch_tensor.is_contiguous()
+        assert torch.equal(patch_tensor, patches_tensor[patch_index].unsqueeze(0))
+
+    patch_list = extract_patches(
+        "sub-01_ses-M00_T1w.nii.gz", patch_size, stride_size, image_tensor
+    )
+    assert [patch_path for patch_path, _ in patch_list] == [
+        f"sub-01_ses-M00_patchsize-{patch_size}_stride-{stride_size}"
+        f"_patch-{patch_index}_T1w.pt"
+        for patch_index in range(len(patch_grid))
+    ]
+    assert torch.equal(
+        torch.cat([patch_tensor for _, patch_tensor in patch_list]), patches_tensor
+    )
+
+    with pytest.raises(IndexError):
+        patch_grid.coordinates(len(patch_grid))
+
+
+def test_patch_grid_errors():
+    image_shape = (1, 12, 15, 13)
+    with pytest.raises(ClinicaDLArgumentError):
+        PatchGrid(image_shape, 13, 1)
+    with pytest.raises(ClinicaDLArgumentError):
+        PatchGrid(image_shape, 5, 0)
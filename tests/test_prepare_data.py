@@ -4,16 +4,21 @@ import os
 import shutil
 import warnings
 from os import PathLike
-from os.path import join
+from os.path import join, splitext
 from pathlib import Path
 from typing import Any, Dict, List
 
+import pandas as pd
 import pytest
+import torch
 
-from tests.testing_tools import clean_folder, compare_folders
+from tests.testing_tools import clean_folder, compare_folders, create_t1_linear_caps
 
 warnings.filterwarnings("ignore")
 
+# Outputs of prepare_data which are not in the reference CAPS
+IGNORED_OUTPUTS = ["caps_index", "_manifest.tsv", "_statistics.tsv"]
+
 
 @pytest.fixture(
     params=[
@@ -27,7 +32,12 @@ def test_name(request):
     return request.param
 
 
-def test_prepare_data(cmdopt, tmp_path, test_name):
+@pytest.fixture(params=["pt", "memmap", "chunked"])
+def tensor_format(request):
+    return request.param
+
+
+def test_prepare_data(cmdopt, tmp_path, test_name, tensor_format):
 
     base_dir = Path(cmdopt["input"])
     input_dir = base_dir / "prepare_data" / "in"
@@ -76,10 +86,10 @@ def test_prepare_data(cmdopt, tmp_path, test_name):
         print(f"Test {test_name} not available.")
         assert 0
 
-    run_test_prepare_data(input_dir, ref_dir, tmp_out_dir, parameters)
+    run_test_prepare_data(input_dir, ref_dir, tmp_out_dir, parameters, tensor_format)
 
 
-def run_test_prepare_data(input_dir, ref_dir, out_dir, parameters):
+def run_test_prepare_data(input_dir, ref_dir, out_dir, parameters, tensor_format):
 
     modalities = ["t1-linear", "pet-linear"]  # , "custom"]
     uncropped_image = [True, False]
@@ -100,6 +110,10 @@ def run_test_prepare_data(input_dir, ref_dir, out_dir, parameters):
                 tsv_file = join(input_dir, f"pet_{acq}.tsv")
                 mode = parameters["mode"]
                 extract_generic(out_dir, mode, tsv_file, parameters)
+                if tensor_format != "pt":
+                    compare_stored_tensors(
+                        out_dir, mode, tsv_file, parameters, tensor_format
+                    )
 
         elif modality == "custom":
             parameters["use_uncropped_image"] = True
@@ -122,22 +136,147 @@ def run_test_prepare_data(input_dir, ref_dir, out_dir, parameters):
                 tsv_file = input_dir / "subjects.tsv"
                 mode = parameters["mode"]
                 extract_generic(out_dir, mode, tsv_file, parameters)
+                if tensor_format != "pt":
+                    compare_stored_tensors(
+                        out_dir, mode, tsv_file, parameters, tensor_format
+                    )
         else:
             raise NotImplementedError(
                 f"Test for modality {modality} was not implemented."
             )
-    assert compare_folders(out_dir / f"caps_{mode}", ref_dir / f"caps_{mode}", out_dir)
+    # The CAPS index is written in the CAPS in addition to the reference outputs
+    assert any(
+        (out_dir / f"caps_{mode}" / "tensor_extraction" / "caps_index").iterdir()
+    )
+    # Stores are written in addition to the tensors of the reference outputs
+    ignore_pattern_list = IGNORED_OUTPUTS
+    if tensor_format != "pt":
+        ignore_pattern_list = IGNORED_OUTPUTS + [f"_{tensor_format}"]
+    assert compare_folders(
+        out_dir / f"caps_{mode}",
+        ref_dir / f"caps_{mode}",
+        out_dir,
+        ignore_pattern_list=ignore_pattern_list,
+    )
 
 
 def extract_generic(out_dir, mode, tsv_file, parameters):
 
     from os.path import join
 
+    from clinicadl.prepare_data.extraction_manifest import get_manifest_path
     from clinicadl.prepare_data.prepare_data import DeepLearningPrepareData
+    from clinicadl.utils.caps_dataset.image_statistics import get_statistics_index_path
 
+    caps_dir = join(out_dir, f"caps_{mode}")
     DeepLearningPrepareData(
-        caps_directory=join(out_dir, f"caps_{mode}"),
+        caps_directory=caps_dir,
         tsv_file=tsv_file,
         n_proc=1,
         parameters=parameters,
     )
+    # Extracted images are recorded in a manifest and their statistics in an index,
+    # in addition to the reference outputs
+    if parameters["tensor_format"] == "pt":
+        assert Path(get_manifest_path(caps_dir, parameters["extract_json"])).is_file()
+    assert Path(
+        get_statistics_index_path(caps_dir, parameters["extract_json"])
+    ).is_file()
+
+
+def compare_stored_tensors(out_dir, mode, tsv_file, parameters, tensor_format):
+    """Extracts the tensors in a store and compares them to the pt outputs."""
+    from clinicadl.utils.caps_dataset.data import return_dataset
+    from clinicadl.utils.preprocessing import read_preprocessing
+
+    pt_json = parameters["extract_json"]
+    store_json = f"{splitext(pt_json)[0]}_{tensor_format}.json"
+    extract_generic(
+        out_dir,
+        mode,
+        tsv_file,
+        dict(parameters, tensor_format=tensor_format, extract_json=store_json),
+    )
+
+    caps_dir = join(out_dir, f"caps_{mode}")
+    data_df = pd.read_csv(tsv_file, sep="\t")
+    data_df["cohort"] = "single"
+    pt_dataset, store_dataset = [
+        return_dataset(
+            caps_dir,
+            data_df,
+            read_preprocessing(join(caps_dir, "tensor_extraction", extract_json)),
+            None,
+            label_presence=False,
+        )
+        for extract_json in [pt_json, store_json]
+    ]
+    for participant, session in zip(data_df.participant_id, data_df.session_id):
+        pt_tensors = pt_dataset.get_stored_tensors(participant, session, "single")
+        store_tensors = store_dataset.get_stored_tensors(participant, session, "single")
+        assert len(store_tensors) == len(pt_tensors)
+        for store_tensor, pt_tensor in zip(store_tensors, pt_tensors):
+            assert torch.equal(store_tensor, pt_tensor)
+
+
+def test_resume_extraction(tmp_path):
+    from clinicadl.prepare_data.extraction_manifest import get_manifest_path
+    from clinicadl.prepare_data.prepare_data import DeepLearningPrepareData
+    from clinicadl.utils.exceptions import ClinicaDLArgumentError
+
+    caps_dir = tmp_path / "caps"
+    participants = ["sub-01", "sub-02", "sub-03"]
+    tsv_file = create_t1_linear_caps(caps_dir, participants)
+    parameters = {
+        "mode": "patch",
+        "patch_size": 10,
+        "stride_size": 10,
+        "preprocessing": "t1-linear",
+        "use_uncropped_image": True,
+        "save_features": True,
+        "prepare_dl": True,
+        "extract_json": "extract.json",
+    }
+    manifest_path = get_manifest_path(str(caps_dir), "extract.json")
+
+    def extract(extract_parameters):
+        """Returns the participants appended to the manifest by the extraction."""
+        n_entries = 0
+        if os.path.isfile(manifest_path):
+            n_entries = len(pd.read_csv(manifest_path, sep="\t"))
+        DeepLearningPrepareData(
+            caps_directory=str(caps_dir),
+            tsv_file=str(tsv_file),
+            n_proc=1,
+            parameters=dict(extract_parameters),
+        )
+        manifest_df = pd.read_csv(manifest_path, sep="\t")
+        return sorted(manifest_df.participant_id[n_entries:])
+
+    def get_outputs(participant):
+        return sorted((caps_dir / "subjects" / participant / "ses-M00").rglob("*.pt"))
+
+    assert extract(parameters) == participants
+    output_mtimes = {
+        output: output.stat().st_mtime_ns
+        for participant in participants
+        for output in get_outputs(participant)
+    }
+
+    # Nothing is extracted again
+    assert extract(parameters) == []
+
+    # Only the modified input and the image whose outputs are missing are extracted
+    input_path = next((caps_dir / "subjects" / "sub-02").rglob("*.nii.gz"))
+    input_mtime = input_path.stat().st_mtime_ns
+    os.utime(input_path, ns=(input_mtime + 10**9, input_mtime + 10**9))
+    get_outputs("sub-03")[0].unlink()
+    assert extract(parameters) == ["sub-02", "sub-03"]
+    for output in get_outputs("sub-01"):
+        assert output.stat().st_mtime_ns == output_mtimes[output]
+    for participant in ["sub-02", "sub-03"]:
+        assert len(get_outputs(participant)) == len(get_outputs("sub-01"))
+
+    # The same extraction file cannot describe other parameters
+    with pytest.raises(ClinicaDLArgumentError):
+        extract(dict(parameters, stride_size=5))
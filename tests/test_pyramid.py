@@ -0,0 +1,146 @@
+# coding: utf8
+
+import pandas as pd
+import pytest
+import torch
+
+from clinicadl.prepare_data.prepare_data import DeepLearningPrepareData
+from clinicadl.utils.caps_dataset.data import return_dataset
+from clinicadl.utils.caps_dataset.pyramid import (
+    compute_pyramid,
+    get_level_path,
+    get_level_shape,
+    scale_bounding_box,
+)
+from clinicadl.utils.exceptions import ClinicaDLConfigurationError
+from clinicadl.utils.nifti import read_nifti
+from clinicadl.utils.preprocessing import read_preprocessing
+from tests.testing_tools import create_t1_linear_caps
+
+
+def downsample(image_tensor):
+    """Averages blocks of 2x2x2 voxels, with the voxels available at the end of dimensions."""
+    _, depth, height, width = image_tensor.shape
+    output_tensor = torch.zeros(get_level_shape(tuple(image_tensor.shape), 1))
+    for x in range(0, depth, 2):
+        for y in range(0, height, 2):
+            for z in range(0, width, 2):
+                output_tensor[:, x // 2, y // 2, z // 2] = image_tensor[
+                    :, x : x + 2, y : y + 2, z : z + 2
+                ].mean(dim=(1, 2, 3))
+    return output_tensor
+
+
+@pytest.mark.parametrize("image_shape", [(1, 8, 6, 10), (1, 9, 7, 5), (2, 3, 1, 6)])
+def test_compute_pyramid(image_shape):
+    image_tensor = torch.rand(image_shape)
+    levels = compute_pyramid(image_tensor, 3)
+    assert len(levels) == 3
+
+    expected_tensor = image_tensor
+    for level, level_tensor in enumerate(levels, start=1):
+        expected_tensor = downsample(expected_tensor)
+        assert level_tensor.shape == get_level_shape(image_shape, level)
+        assert torch.allclose(level_tensor, expected_tensor, atol=1e-6)
+    assert compute_pyramid(image_tensor, 0) == []
+
+
+def test_level_shape_and_box():
+    assert get_level_shape((1, 9, 7, 16), 0) == (1, 9, 7, 16)
+    assert get_level_shape((1, 9, 7, 16), 1) == (1, 5, 4, 8)
+    assert get_level_shape((1, 9, 7, 16), 2) == (1, 3, 2, 4)
+
+    assert get_level_path("image_T1w.pt", 0) == "image_T1w.pt"
+    assert get_level_path("image_T1w.pt", 2) == "image_T1w_level-2.pt"
+
+    # Boxes of a level contain the voxels of the original box
+    bounding_box = ((0, 9), (3, 6), (5, 16))
+    assert scale_bounding_box(bounding_box, 0) == bounding_box
+    assert scale_bounding_box(bounding_box, 1) == ((0, 5), (1, 3), (2, 8))
+    assert scale_bounding_box(bounding_box, 2) == ((0, 3), (0, 2), (1, 4))
+    mask = torch.zeros(1, 9, 7, 16)
+    mask[:, 0:9, 3:6, 5:16] = 1
+    level_mask = compute_pyramid(mask, 2)[-1][0]
+    assert torch.nonzero(level_mask).min(0).values.tolist() == [0, 0, 1]
+    assert (torch.nonzero(level_mask).max(0).values + 1).tolist() == [3, 2, 4]
+
+
+@pytest.fixture
+def caps_dir(tmp_path):
+    participants = ["sub-01", "sub-02", "sub-03"]
+    tsv_path = create_t1_linear_caps(tmp_path / "caps", participants)
+    data_df = pd.read_csv(tsv_path, sep="\t")
+    data_df["cohort"] = "single"
+    return tmp_path / "caps", data_df
+
+
+@pytest.mark.parametrize("tensor_format", ["pt", "memmap", "chunked"])
+def test_pyramid_levels(caps_dir, tensor_format):
+    caps_dir, data_df = caps_dir
+    DeepLearningPrepareData(
+        caps_directory=str(caps_dir),
+        tsv_file=str(caps_dir.parent / "subjects.tsv"),
+        n_proc=1,
+        parameters={
+            "mode": "image",
+            "pyramid_levels": 2,
+            "tensor_format": tensor_format,
+            "preprocessing": "t1-linear",
+            "use_uncropped_image": True,
+            "prepare_dl": True,
+            "extract_json": "extract_image.json",
+        },
+    )
+    preprocessing_dict = read_preprocessing(
+        str(caps_dir / "tensor_extraction" / "extract_image.json")
+    )
+    image_paths = sorted(caps_dir.rglob("*_T1w.nii.gz"))
+    levels = [
+        [image_tensor] + compute_pyramid(image_tensor, 2)
+        for image_tensor in (
+            torch.from_numpy(read_nifti(str(image_path))).unsqueeze(0)
+            for image_path in image_paths
+        )
+    ]
+
+    # Datasets read the level they were built for
+    for level in range(3):
+        dataset = return_dataset(
+            str(caps_dir),
+            data_df,
+            dict(preprocessing_dict, resolution_level=level),
+            None,
+            label_presence=False,
+        )
+        assert dataset.size == get_level_shape((1, 20, 24, 22), level)
+        for idx in range(len(dataset)):
+            assert torch.equal(dataset[idx]["image"], levels[idx][level])
+
+    # Elements extracted on-the-fly come from the downsampled images
+    dataset = return_dataset(
+        str(caps_dir),
+        data_df,
+        dict(
+            preprocessing_dict,
+            mode="patch",
+            patch_size=4,
+            stride_size=4,
+            prepare_dl=False,
+            resolution_level=1,
+        ),
+        None,
+        label_presence=False,
+    )
+    # Level 1 has 10 * 12 * 11 voxels, which contain 2 * 3 * 2 patches
+    assert dataset.elem_per_image == 12
+    assert dataset.size == (1, 4, 4, 4)
+    assert torch.equal(dataset[13]["image"], levels[1][1][:, 0:4, 0:4, 4:8])
+
+    with pytest.raises(ClinicaDLConfigurationError):
+        return_dataset(
+            str(caps_dir),
+            data_df,
+            dict(preprocessing_dict, resolution_level=3),
+            None,
+            label_presence=False,
+        )
@@ -0,0 +1,121 @@
+# coding: utf8
+
+import pytest
+import torch
+
+from clinicadl.utils.caps_dataset.chunked_store import ChunkedStore, ChunkedStoreWriter
+from clinicadl.utils.caps_dataset.memmap_store import MemmapStore, MemmapStoreWriter
+from clinicadl.utils.caps_dataset.quantization import (
+    TENSOR_DTYPES,
+    decode_tensor,
+    encode_tensor,
+    load_tensor,
+    save_tensor,
+)
+from clinicadl.utils.exceptions import ClinicaDLArgumentError
+
+
+def max_error(tensor, tensor_dtype):
+    """Bound of the absolute error made when storing tensor with tensor_dtype."""
+    finite_values = tensor[torch.isfinite(tensor)]
+    value_range = (finite_values.max() - finite_values.min()).item()
+    max_value = finite_values.abs().max().item()
+    if tensor_dtype == "float32":
+        return 0.0
+    elif tensor_dtype == "float16":
+        # 11 bits of precision, rounding to nearest
+        return max_value * 2**-11
+    elif tensor_dtype == "bfloat16":
+        return max_value * 2**-8
+    elif tensor_dtype == "uint8":
+        # Half a quantization step, plus the float32 error of the decoding
+        return value_range / (2**8 - 2) / 2 + max_value * 1e-6
+    elif tensor_dtype == "uint16":
+        return value_range / (2**16 - 2) / 2 + max_value * 1e-6
+
+
+@pytest.fixture
+def tensors():
+    generator = torch.Generator().manual_seed(0)
+    # Images may contain NaN values, which are removed by NanRemoval during training
+    nan_tensor = torch.randn(1, 6, 6, 6, generator=generator) * 1000
+    nan_tensor[0, 2, :, 3] = float("nan")
+    return [
+        torch.randn(1, 10, 12, 11, generator=generator) * 300 + 50,
+        torch.rand(3, 8, 8, generator=generator),
+        torch.full((1, 4, 4, 4), 7.5),
+        nan_tensor,
+    ]
+
+
+def check_round_trip(decoded_tensors, tensors, tensor_dtype):
+    assert len(decoded_tensors) == len(tensors)
+    for decoded_tensor, tensor in zip(decoded_tensors, tensors):
+        assert decoded_tensor.dtype == torch.float32
+        assert decoded_tensor.shape == tensor.shape
+        nan_mask = torch.isnan(tensor)
+        assert torch.equal(torch.isnan(decoded_tensor), nan_mask)
+        error = (decoded_tensor - tensor)[~nan_mask].abs().max().item()
+        assert error <= max_error(tensor, tensor_dtype)
+
+
+@pytest.mark.parametrize("tensor_dtype", TENSOR_DTYPES)
+def test_save_load(tmp_path, tensors, tensor_dtype):
+    decoded_tensors = list()
+    for idx, tensor in enumerate(tensors):
+        tensor_path = tmp_path / f"tensor-{idx}.pt"
+        save_tensor(tensor, tensor_path, tensor_dtype)
+        decoded_tensors.append(load_tensor(tensor_path))
+    check_round_trip(decoded_tensors, tensors, tensor_dtype)
+
+
+@pytest.mark.parametrize("tensor_dtype", TENSOR_DTYPES)
+@pytest.mark.parametrize(
+    "writer_class,store_class",
+    [(MemmapStoreWriter, MemmapStore), (ChunkedStoreWriter, ChunkedStore)],
+)
+def test_store(tmp_path, tensors, tensor_dtype, writer_class, store_class):
+    store_dir = tmp_path / "store"
+    with writer_class(str(store_dir), tensor_dtype) as writer:
+        writer.write("sub-01", "ses-M00", tensors[:2])
+        writer.write("sub-02", "ses-M00", tensors[2:])
+
+    store = store_class(str(store_dir))
+    assert store.num_elem("sub-01", "ses-M00") == 2
+    decoded_tensors = [
+        store.get("sub-01", "ses-M00", 0),
+        store.get("sub-01", "ses-M00", 1),
+        store.get("sub-02", "ses-M00", 0),
+        store.get("sub-02", "ses-M00", 1),
+    ]
+    check_round_trip(decoded_tensors, tensors, tensor_dtype)
+
+
+def test_float16_overflow():
+    tensor = torch.tensor([1.0, -70000.0, float("nan")])
+    with pytest.raises(ClinicaDLArgumentError):
+        encode_tensor(tensor, "float16")
+
+    # Values out of range are only checked for float16
+    encoded_tensor, _, _ = encode_tensor(tensor, "bfloat16")
+    assert torch.isfinite(encoded_tensor[1])
+    # Infinite values are stored as is
+    tensor = torch.tensor([1.0, float("inf"), float("nan")])
+    encoded_tensor, _, _ = encode_tensor(tensor, "float16")
+    assert torch.equal(encoded_tensor[:2], tensor[:2].half())
+
+
+@pytest.mark.parametrize("tensor_dtype", ["uint8", "uint16"])
+def test_quantized_special_values(tensor_dtype):
+    tensor = torch.tensor([float("nan"), -float("inf"), 2.0, 1.0, float("inf"), 4.0])
+    decoded_tensor = decode_tensor(*encode_tensor(tensor, tensor_dtype))
+    assert torch.isnan(decoded_tensor[0])
+    # Infinite values are clipped to the range of the finite values
+    assert torch.allclose(
+        decoded_tensor[1:], torch.tensor([1.0, 2.0, 1.0, 4.0, 4.0]), atol=0.01
+    )
+
+    # Tensors without finite values
+    tensor = torch.tensor([float("nan"), float("nan")])
+    decoded_tensor = decode_tensor(*encode_tensor(tensor, tensor_dtype))
+    assert torch.isnan(decoded_tensor).all()
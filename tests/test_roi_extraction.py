@@ -0,0 +1,120 @@
+# coding: utf8
+
+import numpy as np
+import pytest
+import torch
+
+from clinicadl.prepare_data import prepare_data_utils
+from clinicadl.prepare_data.prepare_data import DeepLearningPrepareData
+from clinicadl.prepare_data.prepare_data_utils import RoiMask, extract_roi_tensor
+from tests.test_caps_dataset import create_roi_masks
+from tests.testing_tools import create_t1_linear_caps
+
+
+def mask_roi(image_tensor, mask_np, uncrop_output):
+    """Region as it was extracted by multiplying the whole image by the mask."""
+    mask_np = mask_np.reshape((1,) + mask_np.shape[-3:])
+    roi_tensor = image_tensor * torch.from_numpy(mask_np)
+    if not uncrop_output:
+        roi_tensor = roi_tensor[
+            np.ix_(
+                mask_np.any((1, 2, 3)),
+                mask_np.any((0, 2, 3)),
+                mask_np.any((0, 1, 3)),
+                mask_np.any((0, 1, 2)),
+            )
+        ]
+    return roi_tensor.float().clone()
+
+
+def get_masks(shape):
+    masks = dict()
+    contiguous_mask = np.zeros(shape, dtype=np.uint8)
+    contiguous_mask[2:6, 3:9, 1:4] = 1
+    contiguous_mask[3, 4, 1] = 0
+    masks["contiguous"] = contiguous_mask
+    # Planes of the bounding box do not contain the region
+    split_mask = np.zeros(shape, dtype=np.uint8)
+    split_mask[1:3, 2:5, 4:6] = 1
+    split_mask[6:8, 7:9, 8:11] = 1
+    masks["non-contiguous"] = split_mask
+    # Regions touching the borders of the image
+    border_mask = np.zeros(shape, dtype=np.uint8)
+    border_mask[:2, -3:, -4:] = 1
+    masks["border"] = border_mask
+    masks["4D"] = np.expand_dims(contiguous_mask, 0)
+    masks["empty"] = np.zeros(shape, dtype=np.uint8)
+    return masks
+
+
+# Images cropped or not around the brain, with masks of the same shape
+@pytest.mark.parametrize("image_shape", [(9, 11, 12), (12, 14, 13)])
+@pytest.mark.parametrize(
+    "mask_name", ["contiguous", "non-contiguous", "border", "4D", "empty"]
+)
+@pytest.mark.parametrize("uncrop_output", [True, False])
+def test_roi_mask(image_shape, mask_name, uncrop_output):
+    image_tensor = torch.randn((1,) + image_shape)
+    mask_np = get_masks(image_shape)[mask_name]
+    expected_tensor = mask_roi(image_tensor, mask_np, uncrop_output)
+
+    roi_mask = RoiMask(mask_np)
+    assert roi_mask.contiguous == (mask_name != "non-contiguous")
+    roi_tensor = roi_mask.extract(image_tensor, uncrop_output)
+    assert roi_tensor.dtype == torch.float32
+    assert roi_tensor.shape == expected_tensor.shape
+    assert torch.equal(roi_tensor, expected_tensor)
+
+    # Masks are compiled once, either before or at each extraction
+    roi_mask.share_memory_()
+    assert torch.equal(
+        extract_roi_tensor(image_tensor, roi_mask, uncrop_output), expected_tensor
+    )
+    assert torch.equal(
+        extract_roi_tensor(image_tensor, mask_np, uncrop_output), expected_tensor
+    )
+
+    # The extracted region does not share memory with the image
+    roi_tensor.fill_(1)
+    assert not torch.equal(image_tensor, torch.ones_like(image_tensor))
+
+
+def test_roi_mask_dimension():
+    with pytest.raises(ValueError):
+        RoiMask(np.ones((4, 5)))
+
+
+def test_roi_masks_loaded_once(tmp_path, monkeypatch):
+    caps_dir = tmp_path / "caps"
+    create_t1_linear_caps(caps_dir, ["sub-01", "sub-02", "sub-03"])
+    create_roi_masks(caps_dir)
+    loaded_masks = list()
+
+    class CountedRoiMask(RoiMask):
+        def __init__(self, mask_np):
+            loaded_masks.append(mask_np)
+            super().__init__(mask_np)
+
+    monkeypatch.setattr(prepare_data_utils, "RoiMask", CountedRoiMask)
+    prepare_data_utils.load_roi_masks.cache_clear()
+    DeepLearningPrepareData(
+        caps_directory=str(caps_dir),
+        tsv_file=str(tmp_path / "subjects.tsv"),
+        n_proc=1,
+        parameters={
+            "mode": "roi",
+            "roi_list": ["box", "split"],
+            "uncropped_roi": False,
+            "roi_custom_template": "",
+            "roi_custom_mask_pattern": "",
+            "preprocessing": "t1-linear",
+            "use_uncropped_image": True,
+            "prepare_dl": True,
+            "extract_json": "extract_roi.json",
+        },
+    )
+    prepare_data_utils.load_roi_masks.cache_clear()
+
+    # Each mask is read once for the three images
+    assert len(loaded_masks) == 2
+    assert len(list(caps_dir.rglob("*_roi-*_T1w.pt"))) == 6
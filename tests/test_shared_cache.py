@@ -0,0 +1,119 @@
+# coding: utf8
+
+import logging
+from collections import namedtuple
+
+import pytest
+import torch
+
+from clinicadl.utils.caps_dataset import shared_cache as shared_cache_module
+from clinicadl.utils.caps_dataset.shared_cache import SharedTensorCache
+
+StatVFS = namedtuple("StatVFS", ["f_bavail", "f_frsize"])
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # Blocks of 4 KB, to fill several of them with small tensors
+    monkeypatch.setattr(shared_cache_module, "BLOCK_SIZE", 4096)
+
+
+@pytest.mark.parametrize(
+    "dtype", [torch.float32, torch.float16, torch.float64, torch.int16, torch.uint8]
+)
+def test_shared_cache_dtype(small_blocks, dtype):
+    shared_cache = SharedTensorCache(1)
+    tensors = {
+        f"tensor-{idx}": (torch.rand(1, 5, 7, idx + 1) * 100).to(dtype)
+        for idx in range(20)
+    }
+    for key, tensor in tensors.items():
+        assert shared_cache.add(key, tensor)
+    assert len(shared_cache) == 20
+    assert "tensor-3" in shared_cache and "tensor-20" not in shared_cache
+    assert shared_cache.get("tensor-20") is None
+
+    # Tensors are copied in shared memory with their dtype and shape
+    for key, tensor in tensors.items():
+        shared_tensor = shared_cache.get(key)
+        assert shared_tensor.dtype == dtype
+        assert shared_tensor.is_shared()
+        assert torch.equal(shared_tensor, tensor)
+    assert shared_cache.size <= 2**20
+
+
+def test_shared_cache_mixed_dtypes(small_blocks):
+    shared_cache = SharedTensorCache(1)
+    tensors = {
+        "image": torch.rand(1, 9, 10, 11),
+        "half": torch.rand(1, 9, 10, 11).half(),
+        "label": torch.arange(13, dtype=torch.int16),
+        "mask": torch.ones(3, 5, 7, dtype=torch.uint8),
+        "other-image": torch.rand(1, 4, 6, 3),
+    }
+    for key, tensor in tensors.items():
+        assert shared_cache.add(key, tensor)
+    for key, tensor in tensors.items():
+        assert shared_cache.get(key).dtype == tensor.dtype
+        assert torch.equal(shared_cache.get(key), tensor)
+
+
+def test_shared_cache_budget(small_blocks):
+    # A budget of 3 blocks of 4 KB, each storing 2 tensors of 1.6 KB
+    shared_cache = SharedTensorCache(3 * 4096 / 2**20)
+    tensors = [torch.rand(400) for _ in range(7)]
+    for idx, tensor in enumerate(tensors[:6]):
+        assert shared_cache.add(f"tensor-{idx}", tensor)
+    assert shared_cache.size == 3 * 4096
+    assert not shared_cache.full
+
+    assert not shared_cache.add("tensor-6", tensors[6])
+    assert shared_cache.full
+    assert "tensor-6" not in shared_cache
+    # Tensors already stored are still found, but no other tensor is added
+    assert shared_cache.add("tensor-0", tensors[0])
+    assert not shared_cache.add("small", torch.rand(1))
+    assert len(shared_cache) == 6
+    for idx, tensor in enumerate(tensors[:6]):
+        assert torch.equal(shared_cache.get(f"tensor-{idx}"), tensor)
+
+
+def test_shared_cache_large_tensor(small_blocks):
+    # Tensors larger than a block have their own block within the budget
+    shared_cache = SharedTensorCache(0.05)
+    assert shared_cache.add("large", torch.rand(3000))
+    assert shared_cache.size == 3008 * 4
+    assert not shared_cache.add("too-large", torch.rand(20000))
+    assert shared_cache.full
+
+
+def test_shared_cache_shm_space(small_blocks, monkeypatch, caplog):
+    shared_cache = SharedTensorCache(1)
+    monkeypatch.setattr(
+        shared_cache_module.os, "statvfs", lambda path: StatVFS(1, 4096)
+    )
+    monkeypatch.setattr(shared_cache_module.os.path, "isdir", lambda path: True)
+    assert shared_cache.add("tensor-0", torch.rand(400))
+
+    # The next block does not fit in the space left in /dev/shm
+    monkeypatch.setattr(
+        shared_cache_module.os, "statvfs", lambda path: StatVFS(1, 2048)
+    )
+    with caplog.at_level(logging.WARNING, logger="clinicadl.shared_cache"):
+        assert shared_cache.add("tensor-1", torch.rand(400))
+        assert not shared_cache.add("tensor-2", torch.rand(400))
+    assert shared_cache.full
+    assert "/dev/shm" in caplog.text
+    assert shared_cache.size == 4096
+
+
+def test_shared_cache_without_shm(small_blocks, monkeypatch, tmp_path):
+    # Systems without /dev/shm are not checked
+    monkeypatch.setattr(shared_cache_module, "SHM_DIRECTORY", str(tmp_path / "shm"))
+    monkeypatch.setattr(
+        shared_cache_module.os,
+        "statvfs",
+        lambda path: pytest.fail("statvfs called without /dev/shm"),
+    )
+    shared_cache = SharedTensorCache(1)
+    assert shared_cache.add("tensor-0", torch.rand(400))
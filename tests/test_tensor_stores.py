@@ -0,0 +1,126 @@
+# coding: utf8
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+import torch
+
+from clinicadl.prepare_data.prepare_data import (
+    ConvertTensorFormat,
+    DeepLearningPrepareData,
+)
+from clinicadl.utils.caps_dataset.chunked_store import ChunkedStore, ChunkedStoreWriter
+from clinicadl.utils.caps_dataset.data import return_dataset
+from clinicadl.utils.caps_dataset.memmap_store import MemmapStore, MemmapStoreWriter
+from clinicadl.utils.preprocessing import read_preprocessing
+from tests.testing_tools import create_t1_linear_caps
+
+
+@pytest.fixture
+def caps_dir(tmp_path):
+    create_t1_linear_caps(tmp_path / "caps", ["sub-01", "sub-02"])
+    return tmp_path / "caps"
+
+
+@pytest.fixture(
+    params=[
+        {"mode": "image"},
+        {"mode": "patch", "patch_size": 10, "stride_size": 6},
+        {
+            "mode": "slice",
+            "slice_mode": "rgb",
+            "slice_direction": 1,
+            "discarded_slices": [2, 3],
+        },
+    ]
+)
+def parameters(request):
+    return dict(
+        request.param,
+        preprocessing="t1-linear",
+        use_uncropped_image=True,
+        save_features=True,
+        prepare_dl=True,
+    )
+
+
+def extract(caps_dir, parameters, tensor_format):
+    extract_json = f"extract_{tensor_format}.json"
+    DeepLearningPrepareData(
+        caps_directory=str(caps_dir),
+        tsv_file=str(caps_dir.parent / "subjects.tsv"),
+        n_proc=1,
+        parameters=dict(
+            parameters, tensor_format=tensor_format, extract_json=extract_json
+        ),
+    )
+    return extract_json
+
+
+def get_dataset(caps_dir, extract_json):
+    data_df = pd.read_csv(caps_dir.parent / "subjects.tsv", sep="\t")
+    data_df["cohort"] = "single"
+    return return_dataset(
+        str(caps_dir),
+        data_df,
+        read_preprocessing(str(caps_dir / "tensor_extraction" / extract_json)),
+        None,
+        label_presence=False,
+    )
+
+
+@pytest.mark.parametrize("tensor_format", ["memmap", "chunked"])
+def test_store_dataset(caps_dir, parameters, tensor_format):
+    pt_dataset = get_dataset(caps_dir, extract(caps_dir, parameters, "pt"))
+    store_dataset = get_dataset(caps_dir, extract(caps_dir, parameters, tensor_format))
+    compare_datasets(store_dataset, pt_dataset)
+
+
+@pytest.mark.parametrize("tensor_format", ["memmap", "chunked"])
+def test_convert_tensor_format(caps_dir, parameters, tensor_format):
+    pt_json = extract(caps_dir, parameters, "pt")
+    ConvertTensorFormat(
+        str(caps_dir),
+        pt_json,
+        tensor_format,
+        f"converted_{tensor_format}",
+        str(caps_dir.parent / "subjects.tsv"),
+        n_proc=-1,
+    )
+    compare_datasets(
+        get_dataset(caps_dir, f"converted_{tensor_format}.json"),
+        get_dataset(caps_dir, pt_json),
+    )
+
+
+def compare_datasets(store_dataset, pt_dataset):
+    assert Path(store_dataset.tensor_stores["single"].store_dir).is_dir()
+    assert len(store_dataset) == len(pt_dataset)
+    assert store_dataset.size == pt_dataset.size
+    mode = pt_dataset.mode
+    for idx in range(len(pt_dataset)):
+        store_sample, pt_sample = store_dataset[idx], pt_dataset[idx]
+        assert store_sample["participant_id"] == pt_sample["participant_id"]
+        assert store_sample[f"{mode}_id"] == pt_sample[f"{mode}_id"]
+        assert torch.equal(store_sample["image"], pt_sample["image"])
+
+
+@pytest.mark.parametrize(
+    "writer_class,store_class",
+    [(MemmapStoreWriter, MemmapStore), (ChunkedStoreWriter, ChunkedStore)],
+)
+def test_interrupted_writer(tmp_path, writer_class, store_class):
+    store_dir = tmp_path / "store"
+    with pytest.raises(RuntimeError):
+        with writer_class(str(store_dir)) as writer:
+            writer.write("sub-01", "ses-M00", [torch.zeros(1, 4, 4)])
+            raise RuntimeError("Extraction failed.")
+    # The partial store is removed, so that the extraction can be run again
+    assert not store_dir.exists()
+
+    with writer_class(str(store_dir)) as writer:
+        writer.write("sub-01", "ses-M00", [torch.ones(1, 4, 4)])
+    assert torch.equal(
+        store_class(str(store_dir)).get("sub-01", "ses-M00", 0), torch.ones(1, 4, 4)
+    )
@@ -15,6 +15,8 @@ from tests.testing_tools import compare_folders
     params=[
         "slice_cnn",
         "image_cnn",
+        "image_cnn_amp",
+        "image_cnn_distributed",
         "patch_cnn",
         "patch_multi_cnn",
         "roi_cnn",
@@ -34,6 +36,8 @@ def test_train_cnn(cmdopt, tmp_path, test_name):
     labels_path = join(input_dir, "labels_list")
     config_path = join(input_dir, "train_config.toml")
     split = "0"
+    # Name of the reference MAPS
+    ref_name = test_name
 
     if test_name == "slice_cnn":
         mode = "slice"
@@ -47,7 +51,7 @@ def test_train_cnn(cmdopt, tmp_path, test_name):
             "-c",
             config_path,
         ]
-    elif test_name == "image_cnn":
+    elif test_name in ["image_cnn", "image_cnn_amp", "image_cnn_distributed"]:
         mode = "image"
         split = "1"
         test_input = [
@@ -62,6 +66,14 @@ def test_train_cnn(cmdopt, tmp_path, test_name):
             "-s",
             split,
         ]
+        # The outputs of the training are the same with mixed precision
+        # or with several processes
+        if test_name == "image_cnn_amp":
+            ref_name = "image_cnn"
+            test_input.append("--amp")
+        elif test_name == "image_cnn_distributed":
+            ref_name = "image_cnn"
+            test_input += ["--world_size", "2"]
     elif test_name == "patch_cnn":
         mode = "patch"
         split = "0"
@@ -119,20 +131,26 @@ def test_train_cnn(cmdopt, tmp_path, test_name):
     with open(os.path.join(str(tmp_out_dir), "maps.json"), "r") as out:
         json_data_out = json.load(out)
     with open(
-        os.path.join(str(ref_dir / ("maps_" + test_name)), "maps.json"), "r"
+        os.path.join(str(ref_dir / ("maps_" + ref_name)), "maps.json"), "r"
     ) as ref:
         json_data_ref = json.load(ref)
+    if test_name == "image_cnn_amp":
+        assert json_data_out.pop("amp")
+        json_data_ref.pop("amp", None)
+    elif test_name == "image_cnn_distributed":
+        assert json_data_out.pop("world_size") == 2
+        json_data_ref.pop("world_size", None)
 
     assert json_data_out == json_data_ref  # ["mode"] == mode
 
     assert compare_folders(
         str(tmp_out_dir / "groups"),
-        str(ref_dir / ("maps_" + test_name) / "groups"),
+        str(ref_dir / ("maps_" + ref_name) / "groups"),
         tmp_path,
     )
     assert compare_folders(
         str(tmp_out_dir / "split-0" / "best-loss"),
-        str(ref_dir / ("maps_" + test_name) / "split-0" / "best-loss"),
+        str(ref_dir / ("maps_" + ref_name) / "split-0" / "best-loss"),
         tmp_path,
     )
 
@@ -0,0 +1,161 @@
+# coding: utf8
+
+import pandas as pd
+import pytest
+import torch
+from torch import nn
+from torch.utils.data import DataLoader, Dataset
+
+from clinicadl.utils.exceptions import ClinicaDLConfigurationError
+from clinicadl.utils.maps_manager.logwriter import LogWriter
+from clinicadl.utils.task_manager import ClassificationManager
+from clinicadl.utils.task_manager.task_manager import RunningMetrics
+from tests.test_data_pipeline import get_maps_manager
+
+
+class LabelDataset(Dataset):
+    """Dataset of images of a single voxel, labelled by the sign of the voxel."""
+
+    def __init__(self, n_samples=10):
+        generator = torch.Generator().manual_seed(0)
+        self.images = torch.randn(n_samples, 1, generator=generator)
+        self.labels = (torch.randn(n_samples, generator=generator) > 0).long()
+        self.eval_mode = False
+
+    def eval(self):
+        self.eval_mode = True
+        return self
+
+    def __len__(self):
+        return len(self.images)
+
+    def __getitem__(self, idx):
+        return {
+            "image": self.images[idx],
+            "label": self.labels[idx],
+            "participant_id": f"sub-{idx:02d}",
+            "session_id": "ses-M00",
+            "image_id": 0,
+        }
+
+
+class LinearNetwork(nn.Module):
+    """Network giving the logits of two classes from the voxel."""
+
+    device = "cpu"
+
+    def __init__(self):
+        super().__init__()
+        self.linear = nn.Linear(1, 2)
+        with torch.no_grad():
+            self.linear.weight.copy_(torch.tensor([[-1.0], [1.0]]))
+            self.linear.bias.zero_()
+
+    def compute_outputs_and_loss(self, input_dict, criterion, use_labels=True):
+        outputs = self.linear(input_dict["image"])
+        return outputs, {"loss": criterion(outputs, input_dict["label"])}
+
+
+def test_running_metrics():
+    task_manager = ClassificationManager("image", n_classes=2)
+    criterion = nn.CrossEntropyLoss()
+    model = LinearNetwork()
+    dataloader = DataLoader(LabelDataset(), batch_size=3)
+    results_df, metrics = task_manager.test(model, dataloader, criterion)
+
+    # The results of a whole epoch give the metrics of an evaluation
+    running_metrics = RunningMetrics(task_manager, len(dataloader))
+    for data in dataloader:
+        outputs, loss_dict = model.compute_outputs_and_loss(data, criterion)
+        running_metrics.update(data, outputs, loss_dict)
+    assert running_metrics.compute() == pytest.approx(metrics)
+
+    # The loss is extrapolated to the whole epoch from the batches seen
+    running_metrics.reset()
+    data = next(iter(dataloader))
+    outputs, loss_dict = model.compute_outputs_and_loss(data, criterion)
+    running_metrics.update(data, outputs, loss_dict)
+    running_results = task_manager.compute_metrics(results_df.iloc[:3])
+    running_results["loss"] = loss_dict["loss"].item() * len(dataloader)
+    assert running_metrics.compute() == pytest.approx(running_results)
+
+
+def test_train_metrics_subset():
+    maps_manager = get_maps_manager(
+        mode="image",
+        train_metrics="subset",
+        train_metrics_fraction=0.3,
+        seed=4,
+        batch_size=2,
+    )
+    dataset = LabelDataset()
+    train_loader = DataLoader(dataset, batch_size=2, shuffle=True)
+    train_eval_loader = maps_manager._get_evaluation_loader(dataset)
+
+    subset_loader, running_metrics = maps_manager._init_train_metrics(
+        train_loader, train_eval_loader
+    )
+    assert running_metrics is None
+    subset = list(subset_loader.sampler)
+    assert len(subset) == 3
+    assert subset == sorted(set(subset))
+
+    # The same elements are evaluated at each evaluation, and when training resumes
+    for _ in range(2):
+        assert [
+            participant
+            for data in subset_loader
+            for participant in data["participant_id"]
+        ] == [f"sub-{idx:02d}" for idx in subset]
+    other_loader, _ = maps_manager._init_train_metrics(train_loader, train_eval_loader)
+    assert list(other_loader.sampler) == subset
+
+    # Other methods
+    maps_manager.train_metrics = "full"
+    assert maps_manager._init_train_metrics(train_loader, train_eval_loader) == (
+        train_eval_loader,
+        None,
+    )
+    maps_manager.train_metrics = "running"
+    maps_manager.task_manager = ClassificationManager("image", n_classes=2)
+    loader, running_metrics = maps_manager._init_train_metrics(
+        train_loader, train_eval_loader
+    )
+    assert loader is None
+    assert running_metrics.n_batches == len(train_loader)
+
+    maps_manager.train_metrics = "subset"
+    maps_manager.train_metrics_fraction = 0
+    with pytest.raises(ClinicaDLConfigurationError):
+        maps_manager._init_train_metrics(train_loader, train_eval_loader)
+    maps_manager.train_metrics = "partial"
+    with pytest.raises(ClinicaDLConfigurationError):
+        maps_manager._init_train_metrics(train_loader, train_eval_loader)
+
+
+def test_log_writer_resume(tmp_path):
+    evaluation_metrics = ["loss"]
+    log_dir = tmp_path / "split-0" / "training_logs"
+    log_dir.mkdir(parents=True)
+    # Logs written before the train_metrics column
+    pd.DataFrame(
+        [[0, 0, 10.0, 0.5, 0.6], [1, 0, 20.0, 0.4, 0.5], [2, 0, 30.0, 0.3, 0.4]],
+        columns=["epoch", "iteration", "time", "loss_train", "loss_valid"],
+    ).to_csv(log_dir / "training.tsv", sep="\t", index=False)
+
+    log_writer = LogWriter(
+        str(tmp_path),
+        evaluation_metrics,
+        0,
+        resume=True,
+        beginning_epoch=2,
+        train_metrics="running",
+    )
+    log_writer.step(2, 0, {"loss": 0.2}, {"loss": 0.3}, 1)
+
+    training_df = pd.read_csv(log_dir / "training.tsv", sep="\t")
+    assert training_df.columns.tolist() == log_writer.columns
+    assert training_df.epoch.tolist() == [0, 1, 2]
+    # Former rows were computed on the full training set
+    assert training_df.train_metrics.tolist() == ["full", "full", "running"]
+    assert training_df.loss_train.tolist() == [0.5, 0.4, 0.2]
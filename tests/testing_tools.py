@@ -85,12 +85,12 @@ def models_equal(state_dict_1, state_dict_2, epsilon=0):
     return True
 
 
-def tree(dir_: PathLike, file_out: PathLike):
+def tree(dir_: PathLike, file_out: PathLike, ignore_pattern_list: List[str] = None):
     """Creates a file (file_out) with a visual tree representing the file
     hierarchy at a given directory
 
     .. note::
-        Does not display empty directories.
+        Does not display empty directories, nor the paths matching ignore_pattern_list.
 
     """
     from pathlib import Path
@@ -100,6 +100,8 @@ def tree(dir_: PathLike, file_out: PathLike):
     for path in sorted(Path(dir_).rglob("*")):
         if path.is_dir() and not any(path.iterdir()):
             continue
+        if ignore_pattern(path.relative_to(dir_), ignore_pattern_list):
+            continue
         depth = len(path.relative_to(dir_).parts)
         spacer = "    " * depth
         file_content = file_content + f"{spacer}+ {path.name}\n"
@@ -109,7 +111,12 @@ def tree(dir_: PathLike, file_out: PathLike):
     Path(file_out).write_text(file_content)
 
 
-def compare_folders(outdir: PathLike, refdir: PathLike, tmp_path: PathLike) -> bool:
+def compare_folders(
+    outdir: PathLike,
+    refdir: PathLike,
+    tmp_path: PathLike,
+    ignore_pattern_list: List[str] = None,
+) -> bool:
     """
     Compares the file hierarchy of two folders.
 
@@ -117,6 +124,7 @@ def compare_folders(outdir: PathLike, refdir: PathLike, tmp_path: PathLike) -> b
             outdir: path to the fisrt fodler.
             refdir: path to the second folder.
             tmp_path: path to a temporary folder.
+            ignore_pattern_list: list of patterns of the paths ignored in both folders.
     """
 
     from filecmp import cmp
@@ -124,8 +132,8 @@ def compare_folders(outdir: PathLike, refdir: PathLike, tmp_path: PathLike) -> b
 
     file_out = PurePath(tmp_path) / "file_out.txt"
     file_ref = PurePath(tmp_path) / "file_ref.txt"
-    tree(outdir, file_out)
-    tree(refdir, file_ref)
+    tree(outdir, file_out, ignore_pattern_list)
+    tree(refdir, file_ref, ignore_pattern_list)
     if not cmp(file_out, file_ref):
         with open(file_out, "r") as fin:
             out_message = fin.read()
@@ -166,3 +174,39 @@ def clean_folder(path, recreate=True):
         rmtree(abs_path)
     if recreate:
         makedirs(abs_path)
+
+
+def create_t1_linear_caps(
+    caps_dir: PathLike, participants: List[str], image_shape=(20, 24, 22)
+) -> Path:
+    """Creates a CAPS with one random t1-linear image per participant
+    Args:
+        caps_dir: path to the CAPS directory to create.
+        participants: IDs of the participants, whose session is ses-M00.
+        image_shape: shape of the images.
+    Returns:
+        the path to a TSV file listing the sessions, next to the CAPS directory.
+    """
+    import nibabel as nib
+    import numpy as np
+    import pandas as pd
+
+    caps_dir = Path(caps_dir)
+    rng = np.random.default_rng(0)
+    for participant in participants:
+        image_dir = caps_dir / "subjects" / participant / "ses-M00" / "t1_linear"
+        image_dir.mkdir(parents=True)
+        image = rng.random(image_shape, dtype=np.float32) * 100
+        nib.save(
+            nib.Nifti1Image(image, np.eye(4)),
+            image_dir
+            / f"{participant}_ses-M00_space-MNI152NLin2009cSym_res-1x1x1_T1w.nii.gz",
+        )
+    (caps_dir / "dataset_description.json").write_text(
+        '{"Name": "caps", "BIDSVersion": "1.7.0", "DatasetType": "derivative"}'
+    )
+    tsv_path = caps_dir.parent / "subjects.tsv"
+    pd.DataFrame(
+        {"participant_id": participants, "session_id": ["ses-M00"] * len(participants)}
+    ).to_csv(tsv_path, sep="\t", index=False)
+    return tsv_path